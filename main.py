@@ -6,10 +6,9 @@ Extra TODO's:
 - Poti ki jih nastavi uporabnik naj bodo neodvisne
 """
 import argparse
-import pandas as pd
-from xai_gpt_shap.ChatGptClient import ChatGptClient
-from xai_gpt_shap.ShapCalculator import ShapCalculator
-import shap
+
+# Heavy dependencies (shap, pandas, openai) are imported after the arguments are parsed,
+# so --help and argument errors return immediately
 
 
 def parse_arguments():    
@@ -23,31 +22,144 @@ def parse_arguments():
     parser.add_argument("--target_class", type=int, required=False, help="Target class for SHAP analysis (e.g., 1)")
     parser.add_argument("--output_csv", required=False, help="Path to save SHAP results (e.g., shap_results.csv)")
     parser.add_argument("--role", required=False, help="Select a role: beginner, student, analyst, researcher, executive_summary")
+    parser.add_argument("--session_id", required=False, help="Log the chat under this id and resume it if it was logged before")
+    parser.add_argument("--session_db", required=False, help="SQLite database of the logged chat sessions (default: chat_sessions.sqlite)")
     parser.add_argument("--show_waterfall", required=False, action="store_true", help="Whether SHAP waterfall results should be displayed before GPT interaction")
-    parser.add_argument("--api_key", required=True, help="API key for OpenAI")
-    return parser.parse_args()
+    parser.add_argument("--api_key", required=False, help="API key for OpenAI (not needed in batch mode without --explain)")
+    parser.add_argument("--batch", required=False, action="store_true", help="Explain every row of --instance_path without interaction and write JSONL records to --output_jsonl")
+    parser.add_argument("--output_jsonl", required=False, help="Batch mode: path of the JSONL output file (e.g., shap_results.jsonl)")
+    parser.add_argument("--explain", required=False, action="store_true", help="Batch mode: also generate a GPT explanation for every row")
+    parser.add_argument("--chunk_size", type=int, required=False, help="Batch mode: rows explained and checkpointed together (default: 1000)")
+    parser.add_argument("--checkpoint_path", required=False, help="Batch mode: checkpoint file (defaults to the output path with .checkpoint.json)")
+    parser.add_argument("--no_resume", required=False, action="store_true", help="Batch mode: ignore an existing checkpoint and start over")
+    parser.add_argument("--id_column", required=False, help="Batch mode: column copied into every record as its id")
+    parser.add_argument("--n_workers", type=int, required=False, help="Batch mode: number of processes calculating SHAP values")
+    parser.add_argument("--max_concurrency", type=int, required=False, help="Batch mode: maximum GPT requests in flight (default: 8)")
+    parser.add_argument("--max_evals", type=int, required=False, help="Approximate SHAP values with at most this many model evaluations per instance")
+    parser.add_argument("--deadline_ms", type=float, required=False, help="Approximate SHAP values within this many milliseconds per instance")
+    parser.add_argument("--tol", type=float, required=False, help="Approximate SHAP values until their standard errors are below this value")
+    parser.add_argument("--memoize_predictions", required=False, action="store_true", help="Evaluate repeated masked rows only once (helps with expensive models)")
+    parser.add_argument("--profile", required=False, action="store_true", help="Print a per-stage latency breakdown at the end of the run")
+    parser.add_argument("--trace_jsonl", required=False, help="Write every timed stage as a JSON line to this file (implies --profile)")
+    args = parser.parse_args()
+
+    if args.batch and not args.output_jsonl:
+        parser.error("--batch requires --output_jsonl")
+    if not args.api_key and (not args.batch or args.explain):
+        parser.error("--api_key is required")
+    return args
+
+def run_batch(args, calculator):
+    """
+    Explains every instance of the instance file and writes the results as JSONL records.
+
+    Args:
+        args (Namespace): Parsed command line arguments.
+        calculator (ShapCalculator): Calculator with the model, data and target class set.
+    """
+    from xai_gpt_shap.BatchPipeline import BatchPipeline
+
+    gpt_client = None
+    llm_client = None
+    role = args.role
+    if args.explain:
+        from xai_gpt_shap.ChatGptClient import ChatGptClient
+        from xai_gpt_shap.AsyncChatGptClient import AsyncChatGptClient
+        gpt_client = ChatGptClient(args.api_key)
+        llm_client = AsyncChatGptClient(args.api_key, max_concurrency=args.max_concurrency or AsyncChatGptClient.MAX_CONCURRENCY)
+        role = role or "analyst"
+
+    pipeline = BatchPipeline(
+        calculator,
+        gpt_client=gpt_client,
+        llm_client=llm_client,
+        role=role,
+        model_name="XGBoost",
+        short_summary="ali oseba zasluži več kot 50k na leto",
+        choice_class="pozitivnega",
+        chunk_size=args.chunk_size or BatchPipeline.DEFAULT_CHUNK_SIZE,
+        checkpoint_path=args.checkpoint_path,
+        id_column=args.id_column,
+        n_workers=args.n_workers,
+        on_chunk=lambda rows_done: print(f"Explained {rows_done} rows", flush=True),
+    )
+    stats = pipeline.run(args.instance_path, args.output_jsonl, resume=not args.no_resume)
+    print(
+        f"Batch finished: {stats['rows']} rows written, {stats['skipped']} rows done earlier, "
+        f"{stats['errors']} failed explanations, {stats['elapsed']:.1f} s"
+    )
 
 def main():
 
     args = parse_arguments()
 
-    gpt_client = ChatGptClient(args.api_key)
+    instrumentation = None
+    if args.profile or args.trace_jsonl:
+        from xai_gpt_shap.instrumentation import Instrumentation, JsonLinesExporter, set_instrumentation
+        exporters = [JsonLinesExporter(args.trace_jsonl)] if args.trace_jsonl else []
+        instrumentation = Instrumentation(exporters=exporters)
+        # Components created from now on report to this instrumentation
+        set_instrumentation(instrumentation)
+
+    try:
+        run(args)
+    finally:
+        if instrumentation is not None:
+            instrumentation.flush()
+            print("\nLatency breakdown:")
+            print(instrumentation.format_report())
+
+def run(args):
+    """
+    Runs the SHAP analysis and the GPT explanation for the parsed arguments.
+
+    Args:
+        args (Namespace): Parsed command line arguments.
+    """
+    import pandas as pd
+    from xai_gpt_shap.ChatGptClient import ChatGptClient
+    from xai_gpt_shap.ShapCalculator import ShapCalculator
+
     calculator = ShapCalculator()
+    if args.max_evals is not None or args.deadline_ms is not None or args.tol is not None:
+        calculator.set_explainer_type("approximate")
+        calculator.set_explainer_options(
+            max_evals=args.max_evals, deadline=args.deadline_ms / 1000 if args.deadline_ms else None, tol=args.tol,
+        )
+    if args.memoize_predictions:
+        calculator.set_prediction_memoization()
 
     calculator.load_model(args.model_path)
     calculator.load_data(args.data_path)
     calculator.set_target_class(args.target_class)
 
-    gpt_client.custom_console_message("Calculating SHAP values..." )
+    if args.batch:
+        run_batch(args, calculator)
+        return
+
+    gpt_client = ChatGptClient(args.api_key)
 
     # Load selected instance on which SHAP analysis should be run
     selected_instance = pd.read_csv(args.instance_path)
+
+    if args.session_id:
+        # A logged session continues where it stopped, without sending the SHAP prompt again
+        from xai_gpt_shap.ChatSessionStore import ChatSessionStore
+        session_store = ChatSessionStore(args.session_db or ChatSessionStore.DEFAULT_PATH)
+        restored = gpt_client.resume_session(session_store, args.session_id)
+        if restored:
+            gpt_client.custom_console_message(f"Resumed session {args.session_id} with {restored} messages", "green")
+            gpt_client.interactive_chat(calculator, selected_instance)
+            return
+
+    gpt_client.custom_console_message("Calculating SHAP values..." )
     shap_results, shap_values_for_waterfall = calculator.calculate_shap_values_for_instance(selected_instance)
 
     gpt_client.custom_console_message("SHAP values calculated")
     # Showing SHAP results in a graph
     if args.show_waterfall:
         gpt_client.custom_console_message("Close the window to continue.." )
+        import shap
         shap.plots.waterfall(shap_values_for_waterfall[0], max_display=14)    
     
     gpt_client.custom_console_message("Sending SHAP values to ChatGPT")
@@ -62,7 +174,7 @@ def main():
 
     message = gpt_client.create_summary_and_message(shap_results, "XGBoost", "ali oseba zasluži več kot 50k na leto", "pozitivnega", role)
     gpt_client.send_initial_prompt(message, max_response_tokens = 500)
-    gpt_client.interactive_chat()
+    gpt_client.interactive_chat(calculator, selected_instance)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,372 @@
+"""
+Benchmarks of ShapCalculator and ChatGptClient.
+
+Synthetic datasets and small models are generated in a temporary directory, chat requests go to a local
+mock server and tokens are counted with an offline byte-level encoding, so the results are reproducible
+without network access. Results are written as JSON and can be compared with an earlier run:
+
+    python -m tests.benchmark --preset quick --output benchmark.json
+    python -m tests.benchmark --preset quick --output new.json --compare benchmark.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import importlib.metadata
+import platform
+import tempfile
+import statistics
+import numpy as np
+import pandas as pd
+from openai import OpenAI
+from rich.console import Console
+from xai_gpt_shap.ShapCalculator import ShapCalculator
+from xai_gpt_shap.ChatGptClient import ChatGptClient
+from tests.mock_openai_server import MockChatCompletionsServer
+from tests.offline_encoding import create_byte_encoding
+
+
+PRESETS = {
+    "smoke": {
+        "repeat": 1,
+        "rows": [200],
+        "features": [5],
+        "background_sizes": [20],
+        "batch_sizes": [10],
+        "prompt_features": [10],
+        "token_text_sizes": [1000],
+        "history_lengths": [10],
+        "stream_answer_chars": [500],
+    },
+    "quick": {
+        "repeat": 3,
+        "rows": [1000, 10000],
+        "features": [10, 50],
+        "background_sizes": [50, 100],
+        "batch_sizes": [100],
+        "prompt_features": [10, 100, 500],
+        "token_text_sizes": [1000, 20000],
+        "history_lengths": [20, 200],
+        "stream_answer_chars": [2000],
+    },
+    "full": {
+        "repeat": 5,
+        "rows": [1000, 10000, 100000],
+        "features": [10, 50, 200],
+        "background_sizes": [50, 100, 500],
+        "batch_sizes": [100, 1000],
+        "prompt_features": [10, 100, 500, 2000],
+        "token_text_sizes": [1000, 20000, 200000],
+        "history_lengths": [20, 200, 2000],
+        "stream_answer_chars": [2000, 20000],
+    },
+}
+REGRESSION_THRESHOLD = 1.2 # A benchmark is reported as a regression if its median is 20% slower than the baseline
+
+
+def measure(function, repeat, setup=None, warmup=1):
+    """
+    Runs a function several times and returns timing statistics.
+
+    Args:
+        function (callable): The measured function.
+        repeat (int): Number of measured runs.
+        setup (callable, optional): Called before every run, not measured.
+        warmup (int, optional): Unmeasured runs first, so one-time costs (imports, JIT compilation) are excluded.
+
+    Returns:
+        dict: Median, minimum and maximum run time in seconds and the number of runs.
+    """
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        function()
+
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return {"median": statistics.median(times), "min": min(times), "max": max(times), "runs": repeat}
+
+
+class BenchmarkSuite:
+    """
+    Generates the benchmark fixtures and runs the benchmarks of one preset.
+    """
+
+    def __init__(self, preset="quick", directory=None, seed=0):
+        """
+        Initializes the suite.
+
+        Args:
+            preset (str, optional): One of `PRESETS`.
+            directory (str, optional): Directory for the generated files. Defaults to a temporary directory.
+            seed (int, optional): Seed of the synthetic data.
+
+        Raises:
+            ValueError: If the preset is unknown.
+        """
+        if preset not in PRESETS:
+            raise ValueError(f"Unknown preset: {preset}. Available presets: {', '.join(PRESETS)}")
+        self.preset = preset
+        self.config = PRESETS[preset]
+        self.repeat = self.config["repeat"]
+        self.directory = directory or tempfile.mkdtemp(prefix="xai_gpt_shap_benchmark_")
+        self.rng = np.random.default_rng(seed)
+        self.results = []
+
+    def run(self):
+        """
+        Runs all benchmarks.
+
+        Returns:
+            dict: Environment metadata ("meta") and one entry per benchmark and parameter set ("results").
+        """
+        ChatGptClient._ENCODINGS[ChatGptClient.DEFAULT_MODEL] = create_byte_encoding()
+        for n_features in self.config["features"]:
+            for n_rows in self.config["rows"]:
+                self.benchmark_shap(n_rows, n_features)
+        self.benchmark_prompts()
+        self.benchmark_tokens()
+        self.benchmark_streaming()
+        return {"meta": self.get_metadata(), "results": self.results}
+
+    def get_metadata(self):
+        versions = {}
+        for package in ("numpy", "pandas", "shap", "scikit-learn", "onnxruntime", "openai", "rich", "tiktoken"):
+            try:
+                versions[package] = importlib.metadata.version(package)
+            except importlib.metadata.PackageNotFoundError:
+                versions[package] = None
+        return {
+            "preset": self.preset,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "versions": versions,
+        }
+
+    def add_result(self, name, params, timing):
+        self.results.append({"name": name, "params": params, **timing})
+
+    def create_dataset(self, n_rows, n_features):
+        """
+        Writes a synthetic binary classification dataset and trains pickled (and, if skl2onnx is installed, ONNX) models.
+
+        Returns:
+            dict: Paths of the dataset and models.
+        """
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.ensemble import RandomForestClassifier
+
+        columns = [f"feature_{index}" for index in range(n_features)]
+        data = pd.DataFrame(self.rng.normal(size=(n_rows, n_features)).astype("float32"), columns=columns)
+        weights = self.rng.normal(size=n_features)
+        target = (data.to_numpy() @ weights + self.rng.normal(size=n_rows)) > 0
+
+        prefix = os.path.join(self.directory, f"{n_rows}x{n_features}")
+        paths = {"data": prefix + "_data.csv"}
+        data.to_csv(paths["data"], index=False)
+
+        train_rows = min(n_rows, 2000)
+        models = {
+            "linear": LogisticRegression(max_iter=500).fit(data[:train_rows], target[:train_rows]),
+            "forest": RandomForestClassifier(n_estimators=20, max_depth=6, random_state=0).fit(data[:train_rows], target[:train_rows]),
+        }
+        for name, model in models.items():
+            paths[name] = f"{prefix}_{name}.pkl"
+            with open(paths[name], "wb") as file:
+                pickle.dump(model, file)
+
+        try:
+            from skl2onnx import to_onnx
+        except ImportError:
+            paths["onnx"] = None
+        else:
+            onnx_model = to_onnx(
+                models["forest"], data[:1].to_numpy(), options={"zipmap": False},
+                target_opset={"": 17, "ai.onnx.ml": 3},
+            )
+            paths["onnx"] = prefix + "_forest.onnx"
+            with open(paths["onnx"], "wb") as file:
+                file.write(onnx_model.SerializeToString())
+        return paths
+
+    def benchmark_shap(self, n_rows, n_features):
+        paths = self.create_dataset(n_rows, n_features)
+        base_params = {"rows": n_rows, "features": n_features}
+
+        calculator = ShapCalculator(target_class=1)
+        self.add_result("load_data", base_params, measure(lambda: calculator.load_data(paths["data"]), self.repeat))
+
+        for model_name in ("linear", "forest", "onnx"):
+            if paths[model_name] is None:
+                continue
+            params = {**base_params, "model": model_name}
+            self.add_result("load_model", params, measure(lambda: calculator.load_model(paths[model_name]), self.repeat))
+
+            for explainer_type in ("auto", "model_agnostic"):
+                if model_name == "onnx" and explainer_type == "auto":
+                    continue
+                calculator.set_explainer_type(explainer_type)
+                for background_size in self.config["background_sizes"]:
+                    if background_size > n_rows:
+                        continue
+                    calculator.set_background_strategy("sample", size=background_size, seed=0)
+                    explainer_params = {**params, "explainer": explainer_type, "background": background_size}
+
+                    self.add_result(
+                        "explainer_construction", explainer_params,
+                        measure(calculator.get_explainer, self.repeat, setup=calculator.invalidate_explainer_cache),
+                    )
+                    calculator.get_explainer()
+                    instance = calculator.data.iloc[[0]]
+                    self.add_result(
+                        "shap_instance", explainer_params,
+                        measure(lambda: calculator.calculate_shap_values_for_instance(instance), self.repeat),
+                    )
+                    for batch_size in self.config["batch_sizes"]:
+                        instances = calculator.data.iloc[:batch_size]
+                        timing = measure(lambda: calculator.calculate_shap_values_for_batch(instances), self.repeat)
+                        timing["rows_per_second"] = batch_size / timing["median"]
+                        self.add_result("shap_batch", {**explainer_params, "batch": batch_size}, timing)
+
+    def create_client(self, base_url=None):
+        client = ChatGptClient("benchmark-key")
+        if base_url is not None:
+            client.client = OpenAI(api_key="benchmark-key", base_url=base_url)
+        client.console = Console(file=io.StringIO(), force_terminal=True, width=100)
+        return client
+
+    def benchmark_prompts(self):
+        client = self.create_client()
+        for n_features in self.config["prompt_features"]:
+            shap_df = pd.DataFrame({
+                "Feature": [f"feature_{index}" for index in range(n_features)],
+                "SHAP Value": self.rng.normal(size=n_features),
+                "Feature Value": self.rng.normal(size=n_features).round(3),
+            })
+            for role in ("beginner", "analyst"):
+                self.add_result(
+                    "create_summary_and_message", {"features": n_features, "role": role},
+                    measure(lambda: client.create_summary_and_message(shap_df, "model", "summary", "positive", role), self.repeat),
+                )
+            self.add_result(
+                "create_summary_and_message", {"features": n_features, "role": "analyst", "token_budget": 2000},
+                measure(lambda: client.create_summary_and_message(
+                    shap_df, "model", "summary", "positive", "analyst", token_budget=2000), self.repeat),
+            )
+
+    def benchmark_tokens(self):
+        client = self.create_client()
+        for size in self.config["token_text_sizes"]:
+            text = ("The feature age increases the prediction. " * (size // 40 + 1))[:size]
+            self.add_result("count_tokens", {"chars": size}, measure(lambda: client.count_tokens(text), self.repeat))
+
+        message = "Why does the feature age increase the prediction for this instance? " * 5
+        for length in self.config["history_lengths"]:
+            def fill_history():
+                client.chat_history = []
+                client.history_token_counts = []
+                client._history_tokens_total = 0
+                client.add_message("system", "You explain SHAP values.")
+                for index in range(length):
+                    client.add_message("user" if index % 2 == 0 else "assistant", message)
+
+            tokens = client.count_tokens(message)
+            self.add_result(
+                "clean_chat_history", {"messages": length},
+                measure(lambda: client.clean_chat_history(tokens * length // 2), self.repeat, setup=fill_history),
+            )
+
+    def benchmark_streaming(self):
+        for chars in self.config["stream_answer_chars"]:
+            answer = ("The feature **age** increases the prediction.\n\n- income raises it\n- hours lower it\n\n" * (chars // 80 + 1))[:chars]
+            with MockChatCompletionsServer(answer=answer, stream_chunk_size=4) as server:
+                client = self.create_client(server.base_url)
+                client.add_message("user", "Explain the SHAP values.")
+
+                def reset():
+                    del client.chat_history[1:]
+                    client.history_token_counts = []
+
+                reset()
+                client.stream_response()
+                started_cpu = time.process_time()
+                timing = measure(client.stream_response, self.repeat, setup=reset, warmup=0)
+                cpu = (time.process_time() - started_cpu) / self.repeat
+            timing["cpu_per_chunk"] = cpu / (chars / server.stream_chunk_size)
+            self.add_result("stream_response", {"chars": chars}, timing)
+
+
+def compare_results(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Compares benchmark results with a baseline run.
+
+    Args:
+        results (dict): Results of `BenchmarkSuite.run`.
+        baseline (dict): Results of an earlier run.
+        threshold (float, optional): Ratio of medians above which a benchmark is a regression.
+
+    Returns:
+        list: One dict per benchmark present in both runs with the name, params, both medians, their ratio
+              and whether it is a regression.
+    """
+    def key(result):
+        return result["name"], json.dumps(result["params"], sort_keys=True)
+
+    baseline_results = {key(result): result for result in baseline["results"]}
+    comparison = []
+    for result in results["results"]:
+        previous = baseline_results.get(key(result))
+        if previous is None:
+            continue
+        ratio = result["median"] / previous["median"] if previous["median"] else float("inf")
+        comparison.append({
+            "name": result["name"],
+            "params": result["params"],
+            "baseline": previous["median"],
+            "current": result["median"],
+            "ratio": ratio,
+            "regression": ratio > threshold,
+        })
+    return comparison
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of ShapCalculator and ChatGptClient.")
+    parser.add_argument("--preset", choices=list(PRESETS), default="quick", help="Size of the benchmarks")
+    parser.add_argument("--output", default="benchmark_results.json", help="Path of the JSON results")
+    parser.add_argument("--compare", required=False, help="JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="Slowdown ratio reported as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    results = BenchmarkSuite(args.preset).run()
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            results["comparison"] = compare_results(results, json.load(file), args.threshold)
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+
+    for result in results["results"]:
+        print(f"{result['name']:<28} {json.dumps(result['params']):<90} {result['median'] * 1000:10.3f} ms")
+    regressions = [entry for entry in results.get("comparison", []) if entry["regression"]]
+    for entry in regressions:
+        print(f"REGRESSION {entry['name']} {json.dumps(entry['params'])}: {entry['ratio']:.2f}x slower")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
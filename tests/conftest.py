@@ -0,0 +1,64 @@
+import pickle
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LogisticRegression
+from xai_gpt_shap.ChatGptClient import ChatGptClient
+from xai_gpt_shap.ShapCalculator import ShapCalculator
+from tests.offline_encoding import create_byte_encoding
+
+
+def create_dataset(rows=200, columns=("a", "b", "c"), seed=0):
+    """
+    Creates a dataset of standard normal features.
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(rng.normal(size=(rows, len(columns))), columns=list(columns))
+
+
+@pytest.fixture
+def create_calculator(tmp_path):
+    """
+    Returns a function that fits a model, saves it as model.pkl and the data as data.csv in `tmp_path`
+    and creates a ShapCalculator for them.
+
+    The function takes the model (default: logistic regression), the labels as a function of the data
+    (default: first column > 0), the data (default: `create_dataset()`), whether to load the model and the data
+    (default: True) and further ShapCalculator arguments (target_class defaults to 1).
+    """
+    def create(model=None, labels=None, data=None, load=True, **options):
+        data = create_dataset() if data is None else data
+        model = LogisticRegression() if model is None else model
+        model.fit(data, data.iloc[:, 0] > 0 if labels is None else labels(data))
+        model_path = tmp_path / "model.pkl"
+        data_path = tmp_path / "data.csv"
+        with open(model_path, "wb") as file:
+            pickle.dump(model, file)
+        data.to_csv(data_path, index=False)
+
+        options.setdefault("target_class", 1)
+        calculator = ShapCalculator(str(model_path), str(data_path), **options)
+        if load:
+            calculator.load_model()
+            calculator.load_data()
+        return calculator
+
+    return create
+
+
+@pytest.fixture
+def calculator(create_calculator):
+    """
+    A loaded calculator for a logistic regression on three features.
+    """
+    return create_calculator()
+
+
+@pytest.fixture
+def offline_encoding(monkeypatch):
+    """
+    Counts tokens of the default model with a byte-level encoding, so no encoding has to be downloaded.
+    """
+    encoding = create_byte_encoding()
+    monkeypatch.setitem(ChatGptClient._ENCODINGS, ChatGptClient.DEFAULT_MODEL, encoding)
+    return encoding
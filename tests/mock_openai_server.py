@@ -0,0 +1,174 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockChatCompletionsServer:
+    """
+    A local HTTP server that mimics OpenAI's chat-completions endpoint, for tests and benchmarks.
+
+    Supports normal and streamed (server-sent events) responses, a configurable latency, and failing
+    the first requests with an error status to exercise retries. It also records how many requests
+    were received and how many were handled at the same time.
+
+    Example:
+        with MockChatCompletionsServer(latency=0.05) as server:
+            client = AsyncChatGptClient("test-key", base_url=server.base_url)
+    """
+
+    def __init__(self, answer="This is a mock explanation of the SHAP values.", latency=0.0,
+                 fail_first=0, fail_status=429, stream_chunk_size=4, stream_delay=0.0, barrier=None, barrier_timeout=5.0):
+        """
+        Initializes the mock server.
+
+        Args:
+            answer (str, optional): Text returned for every request.
+            latency (float, optional): Seconds to wait before answering.
+            fail_first (int, optional): Number of first requests answered with `fail_status`.
+            fail_status (int, optional): HTTP status of the failed requests.
+            stream_chunk_size (int, optional): Characters per streamed chunk.
+            stream_delay (float, optional): Seconds to wait between streamed chunks.
+            barrier (int, optional): Requests are only answered in groups of this many requests in flight,
+                                     which proves the client's concurrency without measuring time.
+            barrier_timeout (float, optional): Seconds a request waits for its group. If the group is not
+                                               complete by then, the request is answered with status 504.
+        """
+        self.answer = answer
+        self.latency = latency
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.stream_chunk_size = stream_chunk_size
+        self.stream_delay = stream_delay
+        self.requests = 0
+        self.active_requests = 0
+        self.max_active_requests = 0
+        self.request_bodies = []
+        self._barrier = threading.Barrier(barrier) if barrier else None
+        self.barrier_timeout = barrier_timeout
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._create_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        """
+        str: Base URL to pass to the OpenAI client.
+        """
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """
+        Starts serving in a background thread.
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops the server.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _create_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                    request_number = server.requests
+                    server.request_bodies.append(body)
+                    server.active_requests += 1
+                    server.max_active_requests = max(server.max_active_requests, server.active_requests)
+                try:
+                    if server._barrier is not None:
+                        try:
+                            server._barrier.wait(server.barrier_timeout)
+                        except threading.BrokenBarrierError:
+                            self._send_json(504, {"error": {"message": "Too few concurrent requests", "type": "mock_error"}})
+                            return
+                    if server.latency:
+                        time.sleep(server.latency)
+                    if request_number <= server.fail_first:
+                        self._send_json(server.fail_status, {"error": {"message": "Mock failure", "type": "mock_error"}})
+                    elif body.get("stream"):
+                        self._send_stream(body)
+                    else:
+                        self._send_json(200, server._create_completion(body))
+                finally:
+                    with server._lock:
+                        server.active_requests -= 1
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, body):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                answer = server.answer
+                for start in range(0, len(answer), server.stream_chunk_size):
+                    chunk = server._create_chunk(body, answer[start:start + server.stream_chunk_size])
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    if server.stream_delay:
+                        time.sleep(server.stream_delay)
+                self.wfile.write(f"data: {json.dumps(server._create_chunk(body, None, 'stop'))}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+    def _create_completion(self, body):
+        prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in body.get("messages", []))
+        completion_tokens = len(self.answer.split())
+        return {
+            "id": f"chatcmpl-mock-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.answer},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _create_chunk(self, body, content, finish_reason=None):
+        delta = {} if content is None else {"content": content}
+        return {
+            "id": f"chatcmpl-mock-{self.requests}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
@@ -0,0 +1,17 @@
+import tiktoken
+
+
+def create_byte_encoding():
+    """
+    Creates a byte-level tiktoken encoding, so tests and benchmarks do not need to download the model's encoding.
+    Every UTF-8 byte is one token, so token counts are larger than with the real encodings.
+
+    Returns:
+        tiktoken.Encoding: The encoding.
+    """
+    return tiktoken.Encoding(
+        name="bytes",
+        pat_str=r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={},
+    )
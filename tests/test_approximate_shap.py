@@ -0,0 +1,122 @@
+import time
+import itertools
+import math
+import numpy as np
+import pandas as pd
+import pytest
+from xai_gpt_shap.ApproximateExplainer import ApproximateExplainer
+from xai_gpt_shap.ChatGptClient import ChatGptClient
+from xai_gpt_shap.ShapResultCache import ShapResultCache
+from tests.conftest import create_dataset
+
+
+@pytest.fixture
+def calculator(create_calculator):
+    return create_calculator(
+        data=create_dataset(columns="abcd"), labels=lambda data: data["a"] - data["b"] + 0.5 * data["a"] * data["c"] > 0,
+        explainer_type="approximate",
+    )
+
+
+def exact_shap_values(predict, background, row):
+    """
+    Computes exact interventional SHAP values of class 1 by enumerating all coalitions.
+    """
+    n_features = len(row)
+    explainer = ApproximateExplainer(predict, background)
+    masks = np.array(list(itertools.product([False, True], repeat=n_features)))
+    outputs = dict(zip(map(tuple, masks), explainer._evaluate(masks, row)[:, 1]))
+    values = np.zeros(n_features)
+    for mask in masks:
+        size = mask.sum()
+        for feature in np.flatnonzero(~mask):
+            weight = math.factorial(size) * math.factorial(n_features - size - 1) / math.factorial(n_features)
+            with_feature = mask.copy()
+            with_feature[feature] = True
+            values[feature] += weight * (outputs[tuple(with_feature)] - outputs[tuple(mask)])
+    return values
+
+
+def test_estimates_are_additive_and_within_their_standard_errors(calculator):
+    model, data = calculator.model, calculator.data
+    background = data.iloc[:40]
+    instance = data.iloc[[100]]
+    exact = exact_shap_values(model.predict_proba, background, instance.to_numpy()[0])
+
+    explainer = ApproximateExplainer(model.predict_proba, background, max_evals=200, seed=0)
+    explanation = explainer(instance)
+
+    values = explanation.values[0, :, 1]
+    error_std = explanation.error_std[0, :, 1]
+    prediction = model.predict_proba(instance.to_numpy())[0, 1]
+    assert explanation.values.shape == explanation.error_std.shape == (1, 4, 2)
+    assert values.sum() + explanation.base_values[0, 1] == pytest.approx(prediction)
+    assert np.all(np.abs(values - exact) <= 4 * error_std + 1e-9)
+    assert explainer.last_stats[0]["evals"] <= 200
+
+
+def test_tolerance_and_deadline_stop_sampling(calculator):
+    model, data = calculator.model, calculator.data
+    instance = data.iloc[[100]]
+
+    explainer = ApproximateExplainer(model.predict_proba, data.iloc[:40], tol=0.01, seed=0)
+    explainer(instance)
+    assert explainer.last_stats[0]["converged"]
+
+    def slow_predict(rows):
+        time.sleep(0.002)
+        return model.predict_proba(rows)
+
+    explainer = ApproximateExplainer(slow_predict, data.iloc[:40], deadline=0.05, tol=1e-9, seed=0)
+    started = time.perf_counter()
+    explainer(instance)
+    assert time.perf_counter() - started < 0.5
+    assert not explainer.last_stats[0]["converged"]
+
+    with pytest.raises(ValueError):
+        ApproximateExplainer(model.predict_proba, data.iloc[:40], max_evals=5)(instance)
+
+
+def test_calculator_returns_standard_errors_and_prompt_flags_uncertain_signs(calculator, offline_encoding):
+    calculator.set_explainer_options(max_evals=300, seed=0)
+
+    shap_results, _ = calculator.calculate_shap_values_for_instance(calculator.data.iloc[[100]])
+    batch_results, _ = calculator.calculate_shap_values_for_batch(calculator.data.iloc[:3])
+
+    assert calculator.explainer_engine == "approximate"
+    assert (shap_results["SHAP Std Error"] > 0).all()
+    assert batch_results["SHAP Std Error"].notna().all()
+
+    shap_df = pd.DataFrame({
+        "Feature": ["a", "b"], "SHAP Value": [0.3, 0.01], "Feature Value": [1, 2], "SHAP Std Error": [0.02, 0.05],
+    })
+    message = ChatGptClient("test-key").create_summary_and_message(shap_df, "model", "summary", "1", "analyst")
+    assert "- a: SHAP=0.3000 ± 0.0392, Value=1\n" in message
+    assert "- b: SHAP=0.0100 ± 0.0980, Value=2 (uncertain: 95% CI includes zero)" in message
+
+
+def test_result_cache_is_bypassed_for_approximate_estimates(calculator, tmp_path):
+    calculator.set_explainer_options(max_evals=300, seed=0)
+    calculator.set_result_cache(ShapResultCache(str(tmp_path / "results.sqlite")))
+
+    shap_results, _ = calculator.calculate_shap_values_for_instance(calculator.data.iloc[[100]])
+    assert (shap_results["SHAP Std Error"] > 0).all()
+    assert calculator.multiclass_result is not None
+    assert calculator.result_cache.get_stats()["entries"] == 0
+
+    batch_results, explanation = calculator.calculate_shap_values_for_batch(calculator.data.iloc[:3])
+    assert batch_results["SHAP Std Error"].notna().all()
+    assert explanation.error_std.shape == explanation.values.shape
+    assert calculator.result_cache.get_stats()["entries"] == 0
+
+
+def test_result_cache_is_used_for_exact_explainers(calculator, tmp_path):
+    calculator.set_explainer_type("linear")
+    calculator.set_result_cache(ShapResultCache(str(tmp_path / "results.sqlite")))
+
+    _, first = calculator.calculate_shap_values_for_batch(calculator.data.iloc[:3])
+    _, second = calculator.calculate_shap_values_for_batch(calculator.data.iloc[:3])
+
+    assert calculator.result_cache.get_stats()["entries"] == 3
+    assert np.allclose(first.values, second.values)
+    assert first.error_std is None and second.error_std is None
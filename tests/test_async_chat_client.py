@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from xai_gpt_shap.AsyncChatGptClient import AsyncChatGptClient, _RateLimiter
+from xai_gpt_shap.roles import get_role_message
+from tests.mock_openai_server import MockChatCompletionsServer
+
+
+def test_explain_many_runs_concurrently_and_keeps_order():
+    # Requests are only answered once 4 of them are in flight, a serial client would get errors
+    with MockChatCompletionsServer(barrier=4) as server:
+        client = AsyncChatGptClient("test-key", base_url=server.base_url, max_concurrency=4, max_retries=0)
+        prompts = [f"Explain instance {index}" for index in range(12)]
+
+        results = client.explain_many_sync(prompts, role="analyst")
+
+    assert [result["index"] for result in results] == list(range(12))
+    assert all(result["answer"] == server.answer and result["error"] is None for result in results)
+    assert all(body["messages"][0]["content"] == get_role_message("analyst") for body in server.request_bodies)
+    assert server.max_active_requests == 4
+
+
+def test_explain_many_retries_rate_limited_requests():
+    with MockChatCompletionsServer(fail_first=2, fail_status=429) as server:
+        client = AsyncChatGptClient("test-key", base_url=server.base_url, max_concurrency=1)
+        client.BACKOFF_BASE = 0.01
+        results = client.explain_many_sync(["Explain this instance"])
+
+    assert results[0]["answer"] == server.answer
+    assert results[0]["attempts"] == 3
+    assert server.requests == 3
+
+
+def test_explain_many_reports_errors_after_last_retry():
+    with MockChatCompletionsServer(fail_first=10, fail_status=503) as server:
+        client = AsyncChatGptClient("test-key", base_url=server.base_url, max_retries=1)
+        client.BACKOFF_BASE = 0.01
+        results = client.explain_many_sync(["Explain this instance"])
+
+    assert results[0]["answer"] is None
+    assert results[0]["error"] is not None
+    assert results[0]["attempts"] == 2
+
+
+class FakeClock:
+    """
+    A clock that only advances when the rate limiter sleeps.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_requests_per_minute_throttling():
+    clock = FakeClock()
+    with MockChatCompletionsServer() as server:
+        # A bucket of 120 requests per minute refills 2 requests per second
+        client = AsyncChatGptClient(
+            "test-key", base_url=server.base_url, requests_per_minute=120, clock=clock, sleep=clock.sleep,
+        )
+        client.explain_many_sync(["a"] * 122)
+
+    assert server.requests == 122
+    # The bucket is empty after 120 requests, each further request waits for half a second
+    assert clock.now == pytest.approx(1.0)
+    assert sum(clock.sleeps) == pytest.approx(1.0)
+
+
+def test_token_bucket_refills_with_the_clock():
+    clock = FakeClock()
+    limiter = _RateLimiter(60, clock, clock.sleep)
+
+    async def acquire(amounts):
+        for amount in amounts:
+            await limiter.acquire(amount)
+
+    asyncio.run(acquire([60, 30]))
+    assert clock.now == pytest.approx(30)
+    clock.now += 60
+    asyncio.run(acquire([60, 100]))
+    assert clock.now == pytest.approx(150)
@@ -0,0 +1,112 @@
+import os
+import json
+import numpy as np
+import pytest
+import xai_gpt_shap.ShapCalculator as ShapCalculator
+from xai_gpt_shap.ShapCalculator import _init_parallel_worker
+from xai_gpt_shap.BatchPipeline import BatchPipeline
+from tests.conftest import create_dataset
+
+
+class Crash(Exception):
+    pass
+
+
+def init_counted_worker(state):
+    # Records every started worker in the file named by WORKER_LOG
+    with open(os.environ["WORKER_LOG"], "a") as file:
+        file.write(f"{os.getpid()}\n")
+    _init_parallel_worker(state)
+
+
+@pytest.fixture
+def calculator(create_calculator):
+    return create_calculator(data=create_dataset(rows=300, columns="abcd"), labels=lambda data: data["a"] + data["b"] > 0)
+
+
+def read_records(path):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+def test_batch_writes_one_record_per_instance(calculator, tmp_path):
+    instances = calculator.data.iloc[:25].assign(name=[f"row-{index}" for index in range(25)])
+    instance_path = tmp_path / "instances.csv"
+    instances.to_csv(instance_path, index=False)
+    output_path = tmp_path / "results.jsonl"
+
+    stats = BatchPipeline(calculator, chunk_size=10, id_column="name").run(str(instance_path), str(output_path))
+
+    records = read_records(output_path)
+    assert stats["rows"] == 25
+    assert [record["row"] for record in records] == list(range(25))
+    assert records[3]["id"] == "row-3"
+    assert set(records[0]["shap_values"]) == {"a", "b", "c", "d"}
+    _, explanation = calculator.calculate_shap_values_for_batch(calculator.data.iloc[:25])
+    assert np.allclose([list(record["shap_values"].values()) for record in records], explanation.values)
+
+
+def test_batch_resumes_after_crash(calculator, tmp_path):
+    instance_path = tmp_path / "instances.csv"
+    calculator.data.iloc[:50].to_csv(instance_path, index=False)
+    expected_path = tmp_path / "expected.jsonl"
+    output_path = tmp_path / "results.jsonl"
+    BatchPipeline(calculator, chunk_size=10).run(str(instance_path), str(expected_path))
+
+    def crash_after_two_chunks(rows_done):
+        if rows_done == 20:
+            # A record of the next chunk was partly written when the process died
+            with open(output_path, "ab") as file:
+                file.write(b'{"row": 20, "shap')
+            raise Crash()
+
+    with pytest.raises(Crash):
+        BatchPipeline(calculator, chunk_size=10, on_chunk=crash_after_two_chunks).run(str(instance_path), str(output_path))
+    stats = BatchPipeline(calculator, chunk_size=10).run(str(instance_path), str(output_path))
+
+    assert stats["skipped"] == 20
+    assert stats["rows"] == 30
+    assert output_path.read_text() == expected_path.read_text()
+
+
+@pytest.mark.parametrize("change", [
+    lambda calculator: calculator.set_target_class(0),
+    lambda calculator: calculator.set_explainer_type("linear"),
+    lambda calculator: calculator.set_explainer_options(algorithm="permutation"),
+    lambda calculator: calculator.set_background_strategy("sample", size=20, seed=1),
+])
+def test_batch_refuses_to_resume_with_different_settings(calculator, tmp_path, change):
+    instance_path = tmp_path / "instances.csv"
+    calculator.data.iloc[:30].to_csv(instance_path, index=False)
+    output_path = tmp_path / "results.jsonl"
+
+    def crash_after_one_chunk(rows_done):
+        raise Crash()
+
+    with pytest.raises(Crash):
+        BatchPipeline(calculator, chunk_size=10, on_chunk=crash_after_one_chunk).run(str(instance_path), str(output_path))
+    change(calculator)
+
+    with pytest.raises(ValueError, match="different settings"):
+        BatchPipeline(calculator, chunk_size=10).run(str(instance_path), str(output_path))
+    stats = BatchPipeline(calculator, chunk_size=10).run(str(instance_path), str(output_path), resume=False)
+    assert stats["skipped"] == 0
+    assert len(read_records(output_path)) == 30
+
+
+def test_batch_starts_workers_once_per_run(calculator, tmp_path, monkeypatch):
+    instance_path = tmp_path / "instances.csv"
+    calculator.data.iloc[:50].to_csv(instance_path, index=False)
+    worker_log = tmp_path / "workers.log"
+    monkeypatch.setenv("WORKER_LOG", str(worker_log))
+    monkeypatch.setattr(ShapCalculator, "_init_parallel_worker", init_counted_worker)
+
+    BatchPipeline(calculator, chunk_size=10, n_workers=2).run(str(instance_path), str(tmp_path / "parallel.jsonl"))
+    BatchPipeline(calculator, chunk_size=10).run(str(instance_path), str(tmp_path / "serial.jsonl"))
+
+    assert 1 <= len(worker_log.read_text().split()) <= 2
+    parallel = read_records(tmp_path / "parallel.jsonl")
+    serial = read_records(tmp_path / "serial.jsonl")
+    assert [record["row"] for record in parallel] == list(range(50))
+    assert np.allclose([list(record["shap_values"].values()) for record in parallel],
+                       [list(record["shap_values"].values()) for record in serial])
@@ -0,0 +1,18 @@
+import json
+from tests.benchmark import BenchmarkSuite, compare_results
+
+
+def test_smoke_benchmark_covers_every_component(tmp_path):
+    results = BenchmarkSuite("smoke", directory=str(tmp_path)).run()
+
+    names = {result["name"] for result in results["results"]}
+    assert names >= {
+        "load_model", "load_data", "explainer_construction", "shap_instance", "shap_batch",
+        "create_summary_and_message", "count_tokens", "clean_chat_history", "stream_response",
+    }
+    assert all(result["median"] >= 0 for result in results["results"])
+    json.dumps(results)
+
+    comparison = compare_results(results, results)
+    assert len(comparison) == len(results["results"])
+    assert not any(entry["regression"] for entry in comparison)
@@ -0,0 +1,83 @@
+import threading
+import pytest
+from xai_gpt_shap.ChatGptClient import ChatGptClient
+from xai_gpt_shap.ChatSessionStore import ChatSessionStore
+from tests.offline_encoding import create_byte_encoding
+
+
+@pytest.fixture(autouse=True)
+def offline_encoding(monkeypatch):
+    monkeypatch.setitem(ChatGptClient._ENCODINGS, ChatGptClient.DEFAULT_MODEL, create_byte_encoding())
+    monkeypatch.setitem(ChatGptClient._ENCODINGS, "other-model", create_byte_encoding())
+
+
+def create_logged_client(store, session_id, max_history_tokens=1000):
+    client = ChatGptClient("test-key", max_history_tokens=max_history_tokens)
+    client.set_session_store(store, session_id)
+    client.set_system_message("You explain SHAP values.")
+    client.add_message("user", "SHAP prompt " * 10)
+    client.add_message("assistant", "Initial explanation.")
+    for turn in range(6):
+        client.add_message("user", f"Question {turn}?")
+        client.add_message("assistant", f"Answer {turn}. " * 5)
+    return client
+
+
+def test_resumed_session_matches_the_trimmed_history_without_tokenizing(tmp_path, monkeypatch):
+    store = ChatSessionStore(str(tmp_path / "sessions.sqlite"))
+    client = create_logged_client(store, "a", max_history_tokens=300)
+    client.clean_chat_history()
+    client.add_message("user", "Last question?")
+
+    resumed = ChatGptClient("test-key", max_history_tokens=300)
+    monkeypatch.setattr(resumed, "count_tokens", lambda text: pytest.fail("Messages were tokenized again."))
+    assert resumed.resume_session(store, "a") == len(client.chat_history)
+
+    assert resumed.chat_history == client.chat_history
+    assert resumed.history_token_counts == client.history_token_counts
+    assert resumed.system_message == {"role": "system", "content": "You explain SHAP values."}
+    assert ChatGptClient("test-key").resume_session(store, "missing") == 0
+
+
+def test_resume_trims_to_a_smaller_window_and_recounts_other_models(tmp_path):
+    store = ChatSessionStore(str(tmp_path / "sessions.sqlite"))
+    client = create_logged_client(store, "a")
+    full_history = list(client.chat_history)
+
+    resumed = ChatGptClient("test-key", model="other-model", max_history_tokens=300)
+    counted = []
+    count_tokens = resumed.count_tokens
+    resumed.count_tokens = lambda text: counted.append(text) or count_tokens(text)
+    resumed.resume_session(store, "a")
+    resumed.add_message("user", "After resume?")
+
+    assert len(counted) == len(full_history) + 1
+    assert resumed.chat_history[:3] == full_history[:3]
+    assert resumed.chat_history[-3:-1] == full_history[-2:]
+    assert 5 < len(resumed.chat_history) < len(full_history)
+    assert resumed.get_history_token_usage()["total_tokens"] <= 300 + count_tokens("After resume?")
+    again = ChatGptClient("test-key", model="other-model", max_history_tokens=10_000)
+    again.resume_session(store, "a")
+    assert again.chat_history == resumed.chat_history
+
+
+def test_concurrent_sessions_are_kept_apart(tmp_path):
+    store = ChatSessionStore(str(tmp_path / "sessions.sqlite"))
+    clients = {}
+
+    def chat(session_id):
+        clients[session_id] = create_logged_client(store, session_id)
+
+    threads = [threading.Thread(target=chat, args=(f"session-{index}",)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(store.get_session_ids()) == sorted(clients)
+    for session_id, client in clients.items():
+        resumed = ChatGptClient("test-key")
+        resumed.resume_session(store, session_id)
+        assert resumed.chat_history == client.chat_history
+    store.delete_session("session-0")
+    assert not store.has_session("session-0")
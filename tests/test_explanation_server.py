@@ -0,0 +1,145 @@
+import json
+import threading
+import urllib.request
+import urllib.error
+import pytest
+import xai_gpt_shap.ExplanationServer as ExplanationServerModule
+from xai_gpt_shap.ExplanationServer import ExplanationServer, MicroBatcher, ServerBusyError, main, parse_model_spec
+
+
+@pytest.fixture
+def calculator(create_calculator):
+    return create_calculator(explainer_type="linear")
+
+
+def request(server, path, payload=None):
+    host, port = server.address
+    body = None if payload is None else json.dumps(payload).encode("utf-8")
+    try:
+        with urllib.request.urlopen(f"http://{host}:{port}{path}", data=body) as response:
+            return response.status, response.read().decode("utf-8")
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode("utf-8")
+
+
+def test_concurrent_requests_are_micro_batched(calculator):
+    server = ExplanationServer({"income": calculator}, port=0, max_batch_size=64, max_wait=0.2).start()
+    instances = calculator.data.iloc[:8]
+    responses = [None] * len(instances)
+
+    def explain(position):
+        responses[position] = request(server, "/explain", {"instance": instances.iloc[position].to_dict()})
+
+    try:
+        threads = [threading.Thread(target=explain, args=(position,)) for position in range(len(instances))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        status, health = request(server, "/health")
+        _, metrics = request(server, "/metrics")
+        error_status, _ = request(server, "/explain", {"instances": [{"a": 1.0}]})
+    finally:
+        server.shutdown()
+
+    _, expected = calculator.calculate_shap_values_for_batch(instances)
+    for position, (status, body) in enumerate(responses):
+        assert status == 200
+        result = json.loads(body)["results"][0]
+        assert list(result["shap_values"].values()) == pytest.approx(expected.values[position].tolist())
+    assert server.batchers["income"].stats["requests"] == 8
+    assert server.batchers["income"].stats["batches"] < 8
+    assert json.loads(health)["models"]["income"]["queue_size"] == 0
+    assert 'xai_gpt_shap_server_requests_total{model="income"} 8' in metrics
+    assert error_status == 400
+
+
+def test_full_queue_is_rejected(calculator):
+    batcher = MicroBatcher(calculator, max_queue_size=1)
+    release = threading.Event()
+    explain = calculator.calculate_shap_values_for_batch
+    calculator.calculate_shap_values_for_batch = lambda *args, **kwargs: (release.wait(), explain(*args, **kwargs))[1]
+    instance = calculator.data.iloc[[0]]
+
+    first = batcher.submit(instance)
+    # Wait until the worker took the first request, so the second one fills the queue
+    while batcher.queue_size:
+        pass
+    second = batcher.submit(instance)
+    with pytest.raises(ServerBusyError):
+        batcher.submit(instance)
+    release.set()
+
+    assert first.result()[0].shape == (1, 3)
+    assert second.result()[0].shape == (1, 3)
+    assert batcher.stats["rejected"] == 1
+    batcher.close()
+
+
+def test_request_errors_map_to_status_codes(calculator):
+    server = ExplanationServer({"income": calculator}, port=0, request_timeout=0.2).start()
+    instance = calculator.data.iloc[0].to_dict()
+    release = threading.Event()
+    explain = calculator.calculate_shap_values_for_batch
+
+    try:
+        unknown_status, _ = request(server, "/explain", {"model": "credit", "instance": instance})
+        missing_status, missing_body = request(server, "/explain", {"instances": [instance, {"a": 1.0, "b": 2.0}]})
+
+        calculator.calculate_shap_values_for_batch = lambda *args, **kwargs: {}["no such key"]
+        error_status, _ = request(server, "/explain", {"instance": instance})
+
+        calculator.calculate_shap_values_for_batch = lambda *args, **kwargs: (release.wait(), explain(*args, **kwargs))[1]
+        timeout_status, _ = request(server, "/explain", {"instance": instance})
+        release.set()
+    finally:
+        release.set()
+        server.shutdown()
+
+    assert unknown_status == 404
+    assert missing_status == 400 and "Instance 1 is missing features: c" in missing_body
+    assert error_status == 500
+    assert timeout_status == 504
+
+
+def test_model_spec_only_uses_a_plain_prefix_as_the_name(tmp_path):
+    existing = tmp_path / "run=3" / "model.pkl"
+    existing.parent.mkdir()
+    existing.touch()
+
+    assert parse_model_spec("income=models/income.pkl") == ("income", "models/income.pkl")
+    assert parse_model_spec("models/income.pkl") == ("income", "models/income.pkl")
+    assert parse_model_spec("models/run=3/model.pkl") == ("model", "models/run=3/model.pkl")
+    assert parse_model_spec(f"income={existing}") == ("income", str(existing))
+    assert parse_model_spec(str(existing)) == ("model", str(existing))
+
+
+def test_main_passes_the_prompt_settings_to_the_server(create_calculator, tmp_path, monkeypatch):
+    create_calculator(load=False)
+    servers = []
+
+    class RecordingServer(ExplanationServer):
+        address = ("127.0.0.1", 0)
+
+        def __init__(self, calculators, **options):
+            self.calculators = calculators
+            self.options = options
+            servers.append(self)
+
+        def serve_forever(self):
+            raise KeyboardInterrupt()
+
+        def shutdown(self):
+            pass
+
+    monkeypatch.setattr(ExplanationServerModule, "ExplanationServer", RecordingServer)
+    main([
+        "--model_path", f"income={tmp_path / 'model.pkl'}", "--data_path", str(tmp_path / "data.csv"),
+        "--target_class", "1", "--model_name", "XGBoost", "--short_summary", "earns more than 50k",
+        "--choice_class", "positive",
+    ])
+
+    assert list(servers[0].calculators) == ["income"]
+    assert servers[0].options["model_name"] == "XGBoost"
+    assert servers[0].options["short_summary"] == "earns more than 50k"
+    assert servers[0].options["choice_class"] == "positive"
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+from xai_gpt_shap.ChatGptClient import ChatGptClient
+from xai_gpt_shap.ShapAccumulator import ShapAccumulator
+from tests.conftest import create_dataset
+
+
+def test_accumulator_matches_statistics_of_the_full_matrix():
+    rng = np.random.default_rng(0)
+    shap_values = rng.normal(size=(1000, 4)) * [1, 2, 3, 4] + [0, 1, -1, 0]
+    values = pd.DataFrame(rng.normal(size=(1000, 4)), columns=list("abcd"))
+    values["d"] = "text"
+    accumulator = ShapAccumulator(list("abcd"), quantiles=(0.1, 0.5, 0.9), sketch_size=1000)
+
+    for start in range(0, 1000, 128):
+        accumulator.update(shap_values[start:start + 128], values.iloc[start:start + 128])
+    summary = accumulator.to_dataframe().set_index("Feature").loc[list("abcd")]
+
+    assert summary["SHAP Value"].to_numpy() == pytest.approx(shap_values.mean(axis=0))
+    assert summary["Mean |SHAP|"].to_numpy() == pytest.approx(np.abs(shap_values).mean(axis=0))
+    assert summary["SHAP Std"].to_numpy() == pytest.approx(shap_values.std(axis=0, ddof=1))
+    assert summary["SHAP Q0.5"].to_numpy() == pytest.approx(np.quantile(shap_values, 0.5, axis=0), abs=1e-5)
+    assert summary["Feature Value"].iloc[:3].to_numpy() == pytest.approx(values[list("abc")].mean().to_numpy())
+    assert np.isnan(summary["Feature Value"].iloc[3])
+
+
+def test_reservoir_keeps_a_uniform_sample():
+    accumulator = ShapAccumulator(["a"], quantiles=(0.5,), sketch_size=500, seed=0)
+    for start in range(0, 100_000, 1000):
+        accumulator.update(np.arange(start, start + 1000, dtype=float)[:, None])
+
+    # The median of a uniform sample of 0..99999 is close to 50000
+    assert accumulator.get_quantiles()[0, 0] == pytest.approx(50_000, rel=0.1)
+
+
+def test_global_importance_streams_an_instance_file_into_a_prompt(create_calculator, offline_encoding):
+    calculator = create_calculator(
+        data=create_dataset(rows=300), labels=lambda data: data["a"] + 0.3 * data["b"] > 0, explainer_type="linear",
+    )
+
+    summary = calculator.calculate_global_importance(calculator.data_path, chunk_size=64)
+    _, expected = calculator.calculate_shap_values_for_batch(calculator.data)
+
+    assert summary.attrs == {"scope": "global", "instances": 300}
+    assert list(summary["Feature"]) == ["a", "b", "c"]
+    assert summary["Mean |SHAP|"].to_numpy() == pytest.approx(np.abs(expected.values).mean(axis=0))
+
+    message = ChatGptClient("test-key").create_summary_and_message(summary, "logistic regression", "a > 0", "1", "analyst")
+    assert "aggregated over 300 instances" in message
+    assert "- a: mean |SHAP|=" in message
@@ -0,0 +1,49 @@
+import os
+import sys
+import subprocess
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = {"shap", "onnxruntime", "pandas", "openai", "tiktoken", "prompt_toolkit", "rich"}
+
+
+def import_times(*args):
+    """
+    Runs Python with `-X importtime` and returns the cumulative import time in microseconds of every imported module.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args], cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_package_import_is_lazy():
+    times = import_times("-c", "import xai_gpt_shap")
+
+    assert not HEAVY_MODULES & set(times)
+    assert times["xai_gpt_shap"] < 100_000
+
+
+def test_prompt_building_does_not_load_shap_or_openai():
+    times = import_times("-c", "from xai_gpt_shap import ChatGptClient; ChatGptClient('test-key')")
+
+    assert not HEAVY_MODULES & set(times)
+
+
+def test_shap_calculator_loads_shap_and_onnxruntime_on_demand():
+    times = import_times("-c", "from xai_gpt_shap import ShapCalculator; ShapCalculator()")
+
+    assert "pandas" in times
+    assert not {"shap", "onnxruntime", "openai"} & set(times)
+
+
+def test_cli_help_does_not_load_heavy_dependencies():
+    times = import_times("main.py", "--help")
+
+    assert not HEAVY_MODULES & set(times)
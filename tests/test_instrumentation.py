@@ -0,0 +1,63 @@
+import io
+import json
+from openai import OpenAI
+from rich.console import Console
+from xai_gpt_shap.ChatGptClient import ChatGptClient
+from xai_gpt_shap.ShapCalculator import ShapCalculator
+from xai_gpt_shap.instrumentation import (
+    Instrumentation, NullInstrumentation, JsonLinesExporter, PrometheusExporter, get_instrumentation,
+)
+from tests.mock_openai_server import MockChatCompletionsServer
+
+
+def test_components_default_to_null_instrumentation():
+    assert isinstance(get_instrumentation(), NullInstrumentation)
+    assert isinstance(ShapCalculator().instrumentation, NullInstrumentation)
+
+
+def test_shap_stages_and_model_evaluations_are_recorded(create_calculator, tmp_path):
+    trace_path = tmp_path / "trace.jsonl"
+    exporter = JsonLinesExporter(str(trace_path))
+    instrumentation = Instrumentation(exporters=[exporter])
+    calculator = create_calculator(load=False, explainer_type="model_agnostic", instrumentation=instrumentation)
+    calculator.set_background_strategy("sample", size=20, seed=0)
+
+    calculator.load_model()
+    calculator.load_data()
+    calculator.calculate_shap_values_for_batch(calculator.data.iloc[:5])
+    calculator.calculate_shap_values_for_instance(calculator.data.iloc[[0]])
+    instrumentation.flush()
+    exporter.close()
+
+    metrics = instrumentation.get_metrics()
+    assert {"load_model", "load_data", "explainer_construction", "shap_evaluation"} <= set(metrics["spans"])
+    assert metrics["spans"]["shap_evaluation"]["count"] == 2
+    assert metrics["counters"]["explainer_cache_misses"] == 1
+    assert metrics["counters"]["explainer_cache_hits"] == 1
+    assert metrics["counters"]["explained_rows"] == 6
+    assert metrics["counters"]["model_evaluations"] > 0
+    assert metrics["observations"]["masker_batch_size"]["count"] == metrics["counters"]["model_evaluations"]
+
+    records = [json.loads(line) for line in trace_path.read_text().splitlines()]
+    assert [record["type"] for record in records].count("span") == 5
+    assert records[-1]["type"] == "metrics"
+
+    text = PrometheusExporter.render(metrics)
+    assert 'xai_gpt_shap_span_duration_seconds_count{span="shap_evaluation"} 2' in text
+    assert "xai_gpt_shap_model_evaluations_total" in text
+
+
+def test_streaming_reports_time_to_first_token_and_tokens(offline_encoding):
+    instrumentation = Instrumentation()
+
+    with MockChatCompletionsServer(answer="A streamed explanation.") as server:
+        client = ChatGptClient("test-key", instrumentation=instrumentation)
+        client.client = OpenAI(api_key="test-key", base_url=server.base_url)
+        client.console = Console(file=io.StringIO())
+        client.add_message("user", "Explain the SHAP values.")
+        client.stream_response()
+
+    metrics = instrumentation.get_metrics()
+    assert metrics["spans"]["llm_stream"]["count"] == 1
+    assert metrics["observations"]["time_to_first_token"]["count"] == 1
+    assert metrics["counters"]["completion_tokens"] == client.count_tokens("A streamed explanation.")
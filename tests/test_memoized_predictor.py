@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from xai_gpt_shap.MemoizedPredictor import MemoizedPredictor
+
+
+class CountingModel:
+    """
+    Returns a reused output buffer, like an ONNX session with I/O binding, and records the evaluated rows.
+    """
+
+    def __init__(self):
+        self.evaluated = []
+        self._buffer = np.empty((0, 2))
+
+    def predict_proba(self, rows):
+        rows = np.asarray(rows)
+        self.evaluated.append(len(rows))
+        self._buffer = np.resize(self._buffer, (len(rows), 2))
+        self._buffer[:, 1] = rows.sum(axis=1)
+        self._buffer[:, 0] = -self._buffer[:, 1]
+        return self._buffer
+
+
+def test_duplicate_rows_are_evaluated_once_and_outputs_match():
+    model = CountingModel()
+    predict = MemoizedPredictor(model.predict_proba, max_entries=3)
+    rows = np.array([[1.0, 2.0], [0.0, 1.0], [1.0, 2.0], [0.0, 1.0], [5.0, 5.0]])
+
+    first = predict(rows)
+    second = predict(rows[:2])
+    model._buffer[:] = 0
+
+    assert first.tolist() == [[-3, 3], [-1, 1], [-3, 3], [-1, 1], [-10, 10]]
+    assert second.tolist() == [[-3, 3], [-1, 1]]
+    assert model.evaluated == [3]
+    assert predict(pd.DataFrame(rows[:1])).tolist() == [[-3, 3]]
+    assert predict(rows.astype(np.float32)[:1]).tolist() == [[-3, 3]]
+    assert model.evaluated == [3, 1]
+
+    stats = predict.get_stats()
+    assert stats["rows"] == 9 and stats["evaluated_rows"] == 4 and stats["size"] == 1
+    assert stats["dedup_ratio"] == pytest.approx(5 / 9)
+    with pytest.raises(ValueError):
+        MemoizedPredictor(model.predict_proba, max_entries=-1)
+
+
+def test_calculator_results_are_unchanged_with_memoization(create_calculator):
+    # Few distinct feature values, so masked rows repeat
+    data = pd.DataFrame(np.random.default_rng(0).integers(0, 3, size=(200, 5)).astype(float), columns=list("abcde"))
+
+    results = []
+    for memo_size in (None, 10_000):
+        calculator = create_calculator(
+            model=RandomForestClassifier(n_estimators=10, random_state=0), labels=lambda data: data["a"] + data["b"] > 2,
+            data=data, explainer_type="model_agnostic", explainer_options={"seed": 0}, prediction_memo_size=memo_size,
+        )
+        results.append(calculator.calculate_shap_values_for_batch(calculator.data.iloc[:5])[1].values)
+
+    assert np.array_equal(results[0], results[1])
+    assert calculator.memoized_predictor.get_stats()["dedup_ratio"] > 0.5
+    calculator.set_prediction_memoization(None)
+    calculator.get_explainer()
+    assert calculator.memoized_predictor is None
@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from xai_gpt_shap.ChatGptClient import ChatGptClient
+from xai_gpt_shap.instrumentation import Instrumentation
+from xai_gpt_shap.ShapResultCache import ShapResultCache
+from tests.conftest import create_dataset
+
+
+class ProbabilityModel:
+    """
+    A model that only has predict_proba and no classes_, like an ONNX model.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def fit(self, data, labels):
+        self.model.fit(data, labels)
+        return self
+
+    def predict_proba(self, rows):
+        return self.model.predict_proba(rows)
+
+
+def three_classes(data):
+    return np.array(["low", "mid", "high"])[np.digitize(data["a"] + data["b"], [-0.7, 0.7])]
+
+
+@pytest.fixture
+def forest_calculator(create_calculator):
+    return create_calculator(
+        model=RandomForestClassifier(n_estimators=20, random_state=0), labels=three_classes,
+        data=create_dataset(rows=300, columns="abcd"), target_class=0, instrumentation=Instrumentation(),
+    )
+
+
+def test_set_target_class_switches_without_recomputation(forest_calculator):
+    calculator = forest_calculator
+    instance = calculator.data.iloc[[5]]
+
+    calculator.calculate_shap_values_for_instance(instance)
+    calculator.set_target_class(2)
+    switched = calculator.shap_results
+
+    assert calculator.instrumentation.get_metrics()["counters"]["explained_rows"] == 1
+    expected, _ = calculator.calculate_shap_values_for_instance(instance)
+    assert switched["SHAP Value"].to_numpy() == pytest.approx(expected["SHAP Value"].to_numpy(), abs=1e-6)
+    with pytest.raises(ValueError):
+        calculator.set_target_class(3)
+
+
+def test_predicted_and_top_class_views_match_the_model(forest_calculator):
+    calculator = forest_calculator
+    instances = calculator.data.iloc[:20]
+
+    result = calculator.calculate_multiclass_shap_values(instances)
+
+    probabilities = calculator.model.predict_proba(instances)
+    assert result.values.shape == (20, 4, 3) and result.values.dtype == np.float32
+    assert result.class_names == ["high", "low", "mid"]
+    assert result.get_scores() == pytest.approx(probabilities, abs=1e-5)
+    assert result.get_predicted_classes().tolist() == probabilities.argmax(axis=1).tolist()
+    assert result.get_predicted_class_explanation().values.shape == (20, 4)
+    assert result.get_top_classes(k=2, row=0).tolist() == np.argsort(-probabilities[0], kind="stable")[:2].tolist()
+
+
+def test_binary_output_is_mirrored_and_contrasted_in_a_prompt(create_calculator, offline_encoding):
+    calculator = create_calculator(data=create_dataset(rows=300, columns="abcd"))
+
+    result = calculator.calculate_multiclass_shap_values(calculator.data.iloc[:10])
+    contrast = result.to_contrast_dataframe(row=0)
+
+    assert result.get_predicted_classes().tolist() == calculator.model.predict(calculator.data.iloc[:10]).astype(int).tolist()
+    assert result.values[..., 0] == pytest.approx(-result.values[..., 1])
+    assert list(contrast.columns[2:4]) == [f"SHAP ({name})" for name in contrast.attrs["classes"]]
+
+    message = ChatGptClient("test-key").create_summary_and_message(contrast, "logistic regression", "a > 0", "1", "analyst")
+    winner, runner_up = contrast.attrs["classes"]
+    assert f"preferred {winner} over {runner_up}" in message
+    assert f"SHAP ({runner_up})=" in message
+
+
+def test_result_cache_path_keeps_all_classes(forest_calculator, tmp_path):
+    calculator = forest_calculator
+    calculator.set_result_cache(ShapResultCache(str(tmp_path / "results.sqlite")))
+    instance = calculator.data.iloc[[5]]
+
+    calculator.calculate_shap_values_for_instance(instance)
+    calculator.calculate_shap_values_for_instance(instance)
+    calculator.set_target_class(2)
+    switched = calculator.shap_results
+    _, batch = calculator.calculate_shap_values_for_batch(instance)
+
+    counters = calculator.instrumentation.get_metrics()["counters"]
+    assert counters["explained_rows"] == 1
+    assert counters["result_cache_hits"] == 2
+    assert calculator.multiclass_result.n_classes == 3
+    assert switched["SHAP Value"].to_numpy() == pytest.approx(batch.values[0])
+
+
+def test_unknown_target_class_raises_value_error(forest_calculator):
+    forest_calculator.set_target_class(5)
+
+    with pytest.raises(ValueError, match="Target class 5"):
+        forest_calculator.calculate_shap_values_for_batch(forest_calculator.data.iloc[:2])
+
+
+def test_target_class_switch_keeps_standard_errors(create_calculator):
+    calculator = create_calculator(data=create_dataset(rows=300, columns="abcd"), explainer_type="approximate")
+    calculator.set_explainer_options(max_evals=300, seed=0)
+
+    first, _ = calculator.calculate_shap_values_for_instance(calculator.data.iloc[[5]])
+    calculator.set_target_class(0)
+
+    assert calculator.multiclass_result.error_std.dtype == np.float32
+    assert calculator.shap_results["SHAP Std Error"].to_numpy() == pytest.approx(first["SHAP Std Error"].to_numpy())
+    assert calculator.shap_results["SHAP Value"].to_numpy() == pytest.approx(-first["SHAP Value"].to_numpy())
+
+
+def test_result_cache_is_used_for_models_without_classes(create_calculator, tmp_path):
+    calculator = create_calculator(
+        model=ProbabilityModel(RandomForestClassifier(n_estimators=20, random_state=0)), labels=three_classes,
+        data=create_dataset(rows=300, columns="abcd"), instrumentation=Instrumentation(),
+    )
+    calculator.set_result_cache(ShapResultCache(str(tmp_path / "results.sqlite")))
+    instance = calculator.data.iloc[[5]]
+
+    first, _ = calculator.calculate_shap_values_for_instance(instance)
+    second, _ = calculator.calculate_shap_values_for_instance(instance)
+
+    counters = calculator.instrumentation.get_metrics()["counters"]
+    assert counters["explained_rows"] == 1
+    assert counters["result_cache_misses"] == 1 and counters["result_cache_hits"] == 1
+    assert calculator.result_cache.get_stats()["entries"] == 3
+    assert calculator.multiclass_result.class_names == ["0", "1", "2"]
+    assert second["SHAP Value"].to_numpy() == pytest.approx(first["SHAP Value"].to_numpy())
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+from xai_gpt_shap.OnnxModel import OnnxModel
+from tests.conftest import create_dataset
+
+skl2onnx = pytest.importorskip("skl2onnx")
+
+
+@pytest.fixture
+def onnx_model(tmp_path):
+    """
+    A logistic regression converted with the scikit-learn converter, which adds a ZipMap probability output.
+    """
+    data = create_dataset(rows=300, columns="abcd")
+    model = LogisticRegression().fit(data, data["a"] + data["b"] > 0)
+    converted = skl2onnx.convert_sklearn(
+        model, initial_types=[("input", skl2onnx.common.data_types.FloatTensorType([None, 4]))]
+    )
+    path = tmp_path / "model.onnx"
+    path.write_bytes(converted.SerializeToString())
+    return model, data.to_numpy(dtype=np.float32), str(path)
+
+
+def test_zipmap_is_unwrapped_to_a_probability_matrix(onnx_model):
+    model, rows, path = onnx_model
+
+    stripped = OnnxModel(path)
+    mapped = OnnxModel(path, strip_zipmap=False)
+
+    assert stripped.session.get_outputs()[stripped.probability_output_index].type == "tensor(float)"
+    assert mapped.session.get_outputs()[mapped.probability_output_index].type.startswith("seq(map")
+    assert stripped.predict_proba(rows[:20]) == pytest.approx(model.predict_proba(rows[:20]), abs=1e-5)
+    assert mapped.predict_proba(rows[:20]) == pytest.approx(model.predict_proba(rows[:20]), abs=1e-5)
+
+
+def test_large_batches_reuse_the_io_binding_buffer(onnx_model):
+    model, rows, path = onnx_model
+    wrapper = OnnxModel(path, io_binding_min_batch=100)
+
+    small = wrapper.predict_proba(rows[:10])
+    first = wrapper.predict_proba(rows[:200])
+    first_copy = first.copy()
+    second = wrapper.predict_proba(rows[100:300])
+
+    assert not np.shares_memory(small, first)
+    assert np.shares_memory(first, second)
+    assert first_copy == pytest.approx(model.predict_proba(rows[:200]), abs=1e-5)
+    assert second == pytest.approx(model.predict_proba(rows[100:300]), abs=1e-5)
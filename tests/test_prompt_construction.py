@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+from xai_gpt_shap.ChatGptClient import ChatGptClient
+from tests.offline_encoding import create_byte_encoding
+
+
+@pytest.fixture
+def gpt_client(monkeypatch):
+    monkeypatch.setitem(ChatGptClient._ENCODINGS, ChatGptClient.DEFAULT_MODEL, create_byte_encoding())
+    return ChatGptClient("test-key")
+
+
+def create_shap_df(n_features, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Feature": [f"feature_{index}" for index in range(n_features)],
+        "SHAP Value": rng.normal(size=n_features),
+        "Feature Value": rng.integers(0, 10, n_features),
+    })
+
+
+def test_top_features_match_nlargest_and_nsmallest():
+    shap_df = create_shap_df(50)
+    shap_df.loc[[3, 7], "SHAP Value"] = 5.0
+
+    largest, smallest = ChatGptClient._get_top_features(shap_df["SHAP Value"].to_numpy(), 3)
+
+    assert list(largest) == list(shap_df.nlargest(3, "SHAP Value").index)
+    assert list(smallest) == list(shap_df.nsmallest(3, "SHAP Value").index)
+
+
+def test_prompt_lists_every_feature_without_budget(gpt_client):
+    shap_df = create_shap_df(20)
+
+    message = gpt_client.create_summary_and_message(shap_df, "XGBoost", "summary", "positive", "analyst")
+
+    for _, row in shap_df.iterrows():
+        assert f"- {row['Feature']}: SHAP={row['SHAP Value']:.4f}, Value={row['Feature Value']}" in message
+
+
+def test_token_budget_keeps_largest_features(gpt_client):
+    shap_df = create_shap_df(500)
+    budget = 3000
+
+    message, tokens = gpt_client.create_summary_and_message(
+        shap_df, "XGBoost", "summary", "positive", "analyst", token_budget=budget, return_token_count=True
+    )
+
+    assert tokens == gpt_client.count_tokens(message)
+    assert tokens <= budget
+    assert "- Other features (" in message
+    strongest = shap_df.loc[shap_df["SHAP Value"].abs().idxmax(), "Feature"]
+    weakest = shap_df.loc[shap_df["SHAP Value"].abs().idxmin(), "Feature"]
+    assert f"- {strongest}:" in message
+    assert f"- {weakest}:" not in message
+
+
+def test_history_token_counts_follow_direct_edits(gpt_client, monkeypatch):
+    gpt_client.add_message("user", "short")
+    gpt_client.add_message("assistant", "a somewhat longer answer")
+    counted = []
+    count_tokens = gpt_client.count_tokens
+    monkeypatch.setattr(gpt_client, "count_tokens", lambda text: (counted.append(text), count_tokens(text))[1])
+
+    gpt_client.chat_history[0]["content"] = "a much longer question than before"
+    usage = gpt_client.get_history_token_usage()
+
+    assert counted == ["a much longer question than before"]
+    assert usage["total_tokens"] == count_tokens("a much longer question than before") + count_tokens("a somewhat longer answer")
+    gpt_client.get_history_token_usage()
+    assert len(counted) == 1
+
+
+def test_add_message_only_counts_the_new_message(gpt_client, monkeypatch):
+    for index in range(20):
+        gpt_client.add_message("user", f"question {index}")
+    counted = []
+    count_tokens = gpt_client.count_tokens
+    monkeypatch.setattr(gpt_client, "count_tokens", lambda text: (counted.append(text), count_tokens(text))[1])
+    scans = []
+    sync = gpt_client._sync_history_token_counts
+    monkeypatch.setattr(gpt_client, "_sync_history_token_counts", lambda: (scans.append(True), sync())[1])
+
+    gpt_client.add_message("assistant", "an answer")
+    gpt_client.add_message("system", "a system message", index=0)
+
+    assert counted == ["an answer", "a system message"]
+    assert scans == []
+    gpt_client.chat_history[5]["content"] = "an edited question"
+    usage = gpt_client.get_history_token_usage()
+    contents = [message["content"] for message in gpt_client.chat_history]
+    assert usage["total_tokens"] == sum(count_tokens(content) for content in contents)
+    assert counted[2:] == ["an edited question"]
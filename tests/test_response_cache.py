@@ -0,0 +1,58 @@
+import time
+import pytest
+from xai_gpt_shap.ResponseCache import ResponseCache, InMemoryResponseCache, SQLiteResponseCache
+
+
+def test_key_depends_on_every_request_parameter():
+    messages = [{"role": "user", "content": "Explain"}]
+    key = ResponseCache.make_key("gpt", 0.7, 200, "system", messages)
+
+    assert key == ResponseCache.make_key("gpt", 0.7, 200, "system", [dict(messages[0])])
+    assert key != ResponseCache.make_key("gpt", 0.8, 200, "system", messages)
+    assert key != ResponseCache.make_key("gpt", 0.7, None, "system", messages)
+    assert key != ResponseCache.make_key("gpt", 0.7, 200, "other", messages)
+    assert key != ResponseCache.make_key("gpt", 0.7, 200, "system", messages + [{"role": "user", "content": "?"}])
+
+
+def test_in_memory_cache_evicts_least_recently_used():
+    cache = InMemoryResponseCache(max_entries=2)
+    cache.put("a", "answer a")
+    cache.put("b", "answer b")
+    cache.get("a")
+    cache.put("c", "answer c")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "answer a"
+    assert cache.get_stats() == {"hits": 2, "misses": 1, "entries": 2}
+
+
+def test_in_memory_cache_expires_entries():
+    cache = InMemoryResponseCache(ttl_seconds=0.05)
+    cache.put("a", "answer a")
+    time.sleep(0.1)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_sqlite_cache_persists_and_limits_entries(tmp_path):
+    path = tmp_path / "responses.db"
+    cache = SQLiteResponseCache(str(path), max_entries=2)
+    for key in ["a", "b", "c"]:
+        cache.put(key, f"answer {key}")
+
+    reopened = SQLiteResponseCache(str(path), max_entries=2)
+    assert len(reopened) == 2
+    assert reopened.get("c") == "answer c"
+    assert reopened.get("a") is None
+
+
+def test_base_class_requires_the_storage_methods():
+    class IncompleteCache(ResponseCache):
+        def _get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        ResponseCache()
+    with pytest.raises(TypeError):
+        IncompleteCache()
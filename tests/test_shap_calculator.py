@@ -0,0 +1,179 @@
+import numpy as np
+import pytest
+import xai_gpt_shap.ShapCalculator as ShapCalculator
+from xai_gpt_shap.ChatGptClient import ChatGptClient
+from xai_gpt_shap.ShapResultCache import ShapResultCache
+
+
+def test_auto_explainer_keeps_probability_output_for_linear_models(calculator):
+    instance = calculator.data.iloc[[7]]
+
+    shap_results, explanation = calculator.calculate_shap_values_for_instance(instance)
+
+    assert calculator.explainer_engine == "model_agnostic"
+    assert shap_results.attrs["output"] == "probability"
+    prediction = calculator.model.predict_proba(instance)[0, 1]
+    assert explanation.values[0].sum() + explanation.base_values[0] == pytest.approx(prediction)
+
+
+def test_linear_explainer_marks_log_odds_in_the_prompt(calculator, offline_encoding):
+    client = ChatGptClient("test-key")
+    probability_results, _ = calculator.calculate_shap_values_for_instance(calculator.data.iloc[[7]])
+    calculator.set_explainer_type("linear")
+    log_odds_results, _ = calculator.calculate_shap_values_for_instance(calculator.data.iloc[[7]])
+
+    assert log_odds_results.attrs["output"] == "log_odds"
+    assert "log-odds units" in client.create_summary_and_message(log_odds_results, "model", "summary", "1", "beginner")
+    assert "log-odds units" not in client.create_summary_and_message(probability_results, "model", "summary", "1", "beginner")
+    calculator.set_target_class(0)
+    assert calculator.shap_results.attrs["output"] == "log_odds"
+
+
+def test_background_strategies_summarize_the_data(calculator):
+    labels = (calculator.data["a"] > 1).to_numpy()
+
+    calculator.set_background_strategy("sample", size=50, seed=0)
+    assert len(calculator.background) == 50 and calculator.background_weights is None
+
+    calculator.set_background_strategy("stratified", size=0.25, seed=0, labels=labels)
+    assert len(calculator.background) == 50
+    assert (calculator.background["a"] > 1).mean() == pytest.approx(labels.mean(), abs=0.02)
+
+    calculator.set_background_strategy("stratified", size=10, seed=0, labels=np.arange(200) % 3)
+    assert len(calculator.background) == 10
+
+    calculator.set_background_strategy("kmeans", size=10, seed=0)
+    assert len(calculator.background) == 10
+    assert calculator.background_weights.sum() == pytest.approx(1)
+    centroids = calculator.background.to_numpy()
+    calculator.set_background_strategy("kmeans", size=10, seed=0)
+    assert calculator.background.to_numpy() == pytest.approx(centroids)
+
+    with pytest.raises(ValueError):
+        calculator.set_background_strategy("median")
+
+
+def test_background_accuracy_compares_the_same_engine_without_the_result_cache(calculator, tmp_path):
+    calculator.set_result_cache(ShapResultCache(str(tmp_path / "results.sqlite")))
+    instances = calculator.data.iloc[:5]
+
+    calculator.set_background_strategy("full")
+    full = calculator.evaluate_background_accuracy(instances)
+    calculator.set_background_strategy("kmeans", size=20, seed=0)
+    kmeans = calculator.evaluate_background_accuracy(instances)
+
+    assert full["mean_abs_error"] == pytest.approx(0, abs=1e-9)
+    assert calculator.explainer_engine == "kernel"
+    assert kmeans["background_rows"] == 20 and kmeans["reference_rows"] == 200
+    assert 0 < kmeans["relative_error"] < 0.2
+    assert calculator.result_cache.get_stats()["entries"] == 0
+
+
+def test_explainer_is_reused_until_the_data_changes(calculator):
+    instance = calculator.data.iloc[[7]]
+
+    calculator.calculate_shap_values_for_instance(instance)
+    explainer = calculator.get_explainer()
+    calculator.calculate_shap_values_for_batch(calculator.data.iloc[:3])
+
+    assert calculator.get_explainer_cache_stats() == {"hits": 2, "misses": 1, "size": 1}
+    assert calculator.get_explainer() is explainer
+
+    calculator.data = calculator.data.iloc[:100]
+    assert calculator.get_explainer_cache_stats()["size"] == 0
+    assert calculator.get_explainer() is not explainer
+    assert calculator.explainer_cache_misses == 2
+
+
+def test_batch_results_have_one_row_per_instance_and_feature(calculator):
+    instances = calculator.data.iloc[:5]
+
+    results, explanation = calculator.calculate_shap_values_for_batch(instances)
+
+    assert list(results.columns) == ["Instance", "Feature", "SHAP Value", "Feature Value"]
+    assert len(results) == len(instances) * len(instances.columns)
+    assert results["Instance"].tolist() == np.repeat(instances.index.values, len(instances.columns)).tolist()
+    assert results["Feature"].tolist() == list(instances.columns) * len(instances)
+    assert results["SHAP Value"].tolist() == pytest.approx(explanation.values.ravel())
+
+
+def test_chunked_batch_results_match_a_single_chunk(calculator):
+    instances = calculator.data.iloc[:10]
+
+    chunked, chunked_explanation = calculator.calculate_shap_values_for_batch(instances, chunk_size=np.int64(3))
+
+    single, single_explanation = calculator.calculate_shap_values_for_batch(instances, chunk_size=len(instances))
+    assert chunked[["Instance", "Feature"]].equals(single[["Instance", "Feature"]])
+    assert chunked_explanation.values == pytest.approx(single_explanation.values)
+    assert chunked_explanation.base_values == pytest.approx(single_explanation.base_values)
+
+
+@pytest.mark.parametrize("chunk_size", [0, -1, True, 2.5])
+def test_batch_rejects_invalid_chunk_sizes(calculator, chunk_size):
+    with pytest.raises(ValueError, match="chunk_size"):
+        calculator.calculate_shap_values_for_batch(calculator.data.iloc[:3], chunk_size=chunk_size)
+
+
+def test_parallel_results_keep_the_input_order(calculator):
+    instances = calculator.data.iloc[::-1].iloc[:30]
+
+    results, explanation = calculator.calculate_shap_values_parallel(instances, n_workers=2, shard_size=7)
+
+    _, expected = calculator.calculate_shap_values_for_batch(instances)
+    assert results["Instance"].unique().tolist() == instances.index.tolist()
+    assert explanation.values == pytest.approx(expected.values)
+
+
+def test_parallel_falls_back_to_the_calling_process(calculator, monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise AssertionError("No worker pool should be started.")
+
+    monkeypatch.setattr(ShapCalculator, "ProcessPoolExecutor", no_pool)
+    instances = calculator.data.iloc[:10]
+
+    _, explanation = calculator.calculate_shap_values_parallel(instances, n_workers=1, shard_size=3)
+
+    _, expected = calculator.calculate_shap_values_for_batch(instances)
+    assert explanation.values == pytest.approx(expected.values)
+
+
+def is_memory_mapped(array):
+    while array is not None and not isinstance(array, np.memmap):
+        array = array.base
+    return array is not None
+
+
+@pytest.mark.parametrize("extension", ["parquet", "feather"])
+def test_columnar_files_load_with_projection_and_downcast(calculator, tmp_path, extension):
+    path = tmp_path / f"data.{extension}"
+    data = calculator.data.assign(name=[f"row-{index % 3}" for index in range(len(calculator.data))])
+    getattr(data, f"to_{extension}")(path)
+
+    calculator.load_data(str(path), columns=["c", "a", "name"], downcast=True)
+
+    assert list(calculator.data.columns) == ["c", "a", "name"]
+    assert calculator.data.dtypes.astype(str).tolist() == ["float32", "float32", "category"]
+    assert calculator.data["a"].to_numpy() == pytest.approx(data["a"].to_numpy(), abs=1e-6)
+
+
+def test_npy_cache_is_memory_mapped_and_rebuilt_when_the_source_changes(calculator, tmp_path):
+    cache_path = str(tmp_path / "data.npy")
+    expected = calculator.data.copy()
+
+    calculator.load_data(cache_path=cache_path)
+    calculator.load_data(cache_path=cache_path)
+
+    assert is_memory_mapped(calculator.data.to_numpy())
+    assert calculator.data.to_numpy() == pytest.approx(expected.to_numpy())
+
+    expected.iloc[:50].to_csv(calculator.data_path, index=False)
+    calculator.load_data(cache_path=cache_path)
+    assert len(calculator.data) == 50
+
+
+@pytest.mark.parametrize("counts, size", [([67, 67, 66], 10), ([190, 9, 1], 20), ([190, 5, 5], 3), ([3, 3], 6)])
+def test_stratified_allocation_adds_up_to_the_size(counts, size):
+    allocation = ShapCalculator.ShapCalculator._allocate_stratified(np.array(counts), size)
+
+    assert allocation.sum() == size
+    assert (allocation >= 1).all() and (allocation <= counts).all()
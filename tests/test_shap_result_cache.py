@@ -0,0 +1,62 @@
+import types
+import numpy as np
+import pytest
+import xai_gpt_shap.ShapResultCache as result_cache_module
+from xai_gpt_shap.ShapResultCache import ShapResultCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Replaces the time seen by the cache with a settable clock.
+    """
+    clock = types.SimpleNamespace(now=0.0)
+    clock.time = lambda: clock.now
+    monkeypatch.setattr(result_cache_module, "time", clock)
+    return clock
+
+
+def put_at(cache, clock, now, key):
+    clock.now = now
+    cache.put(key, np.full(4, now), now)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = ShapResultCache(str(tmp_path / "results.sqlite"), max_entries=3)
+    for now, key in enumerate(["a", "b", "c"]):
+        put_at(cache, clock, now, key)
+    clock.now = 3
+    values, base_value = cache.get("a")
+    put_at(cache, clock, 4, "d")
+
+    cache.evict()
+
+    assert values.tolist() == [0, 0, 0, 0] and base_value == 0
+    assert sorted(cache.get_many(["a", "b", "c", "d"])) == ["a", "c", "d"]
+
+
+def test_size_limit_evicts_the_oldest_entries(tmp_path, clock):
+    # Every entry holds four float64 values
+    cache = ShapResultCache(str(tmp_path / "results.sqlite"), max_bytes=2 * 32)
+    cache.EVICTION_INTERVAL = 3
+    for now, key in enumerate(["a", "b", "c"]):
+        put_at(cache, clock, now, key)
+
+    assert cache.get_stats()["bytes"] == 64
+    assert sorted(cache.get_many(["a", "b", "c"])) == ["b", "c"]
+
+
+def test_entries_expire_when_they_are_not_used(tmp_path, clock):
+    cache = ShapResultCache(str(tmp_path / "results.sqlite"), max_age_seconds=10)
+    put_at(cache, clock, 0, "a")
+
+    clock.now = 8
+    assert cache.get("a") is not None
+    clock.now = 16
+    assert cache.get("a") is not None
+    clock.now = 30
+    assert cache.get("a") is None
+    assert cache.get_stats()["entries"] == 1
+
+    cache.evict()
+    assert cache.get_stats() == {"hits": 2, "misses": 1, "entries": 0, "bytes": 0}
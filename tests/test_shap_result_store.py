@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+from xai_gpt_shap.ShapResultStore import ShapResultWriter, ShapResultReader
+from tests.conftest import create_dataset
+
+
+@pytest.mark.parametrize("extension", ["arrow", "parquet", "npz"])
+def test_chunks_round_trip_with_metadata(tmp_path, extension):
+    rng = np.random.default_rng(0)
+    shap_values = rng.normal(size=(100, 3))
+    feature_values = pd.DataFrame(rng.normal(size=(100, 3)), columns=["a", "b", "c"], index=np.arange(100, 200))
+    path = str(tmp_path / f"results.{extension}")
+
+    with ShapResultWriter(path, ["a", "b", "c"], {"target_class": 1, "model_fingerprint": "abc"}) as writer:
+        for start in range(0, 100, 30):
+            chunk = feature_values.iloc[start:start + 30]
+            writer.append(shap_values[start:start + 30], np.full(len(chunk), 0.25), chunk.index, chunk)
+
+    reader = ShapResultReader(path)
+    assert len(reader) == 100
+    assert reader.feature_names == ["a", "b", "c"]
+    assert reader.metadata == {"target_class": 1, "model_fingerprint": "abc"}
+    assert reader.read_shap_values().dtype == np.float32
+    assert reader.read_shap_values() == pytest.approx(shap_values.astype(np.float32))
+    assert reader.read_base_values().tolist() == [0.25] * 100
+    pd.testing.assert_frame_equal(reader.read_feature_values(), feature_values, check_index_type=False)
+    assert sum(len(index) for index, _, _ in reader.iter_chunks()) == 100
+    assert reader.to_dataframe().shape == (300, 4)
+
+
+def test_npz_arrays_are_memory_mapped_and_must_be_numeric(tmp_path):
+    path = str(tmp_path / "results.npz")
+    with ShapResultWriter(path, ["a", "b"]) as writer:
+        writer.append(np.ones((4, 2)), [0.5] * 4)
+        writer.append(np.zeros((2, 2)), 0.5)
+
+    values = ShapResultReader(path).read_shap_values()
+    assert isinstance(values, np.memmap)
+    assert values.sum(axis=1).tolist() == [2, 2, 2, 2, 0, 0]
+    assert np.load(path)["shap_values"].shape == (6, 2)
+
+    with pytest.raises(ValueError):
+        ShapResultWriter(str(tmp_path / "text.npz"), ["a"]).append(np.ones((1, 1)), 0, feature_values=pd.DataFrame({"a": ["x"]}))
+    with pytest.raises(ValueError):
+        ShapResultWriter(str(tmp_path / "results.txt"), ["a"])
+
+
+def test_calculator_saves_shap_values_with_model_metadata(create_calculator, tmp_path):
+    calculator = create_calculator(data=create_dataset(rows=120), explainer_type="linear")
+
+    rows = calculator.save_shap_values(str(tmp_path / "results.arrow"), calculator.data_path, chunk_size=50)
+    _, expected = calculator.calculate_shap_values_for_batch(calculator.data)
+
+    reader = ShapResultReader(str(tmp_path / "results.arrow"))
+    assert rows == 120
+    assert reader.metadata["model_fingerprint"] == calculator.get_model_fingerprint()
+    assert reader.metadata["explainer_engine"] == "linear"
+    assert reader.read_shap_values() == pytest.approx(expected.values.astype(np.float32), abs=1e-6)
+    assert reader.read_index().tolist() == list(range(120))
@@ -0,0 +1,49 @@
+import io
+import re
+from rich.console import Console
+from xai_gpt_shap.StreamRenderer import StreamRenderer
+
+
+ANSWER = (
+    "## Summary\n\nThe feature **age** increases the prediction.\n\n"
+    "- item one\n- item two\n  continued\n\n"
+    "```python\nx = 1\n\nprint(x)\n```\n\nDone."
+)
+
+
+def split_chunks(text):
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+def test_plain_output_for_non_terminal_console():
+    console = Console(file=io.StringIO())
+
+    text = StreamRenderer(console).render(split_chunks(ANSWER))
+
+    assert text == ANSWER
+    assert console.file.getvalue() == ANSWER + "\n"
+
+
+def test_live_rendering_is_throttled():
+    console = Console(file=io.StringIO(), force_terminal=True, width=80)
+    renderer = StreamRenderer(console, refresh_interval=60, render_chars=40)
+    chunks = split_chunks(ANSWER)
+
+    text = renderer.render(chunks)
+
+    assert text == ANSWER
+    assert 0 < renderer.renders <= len(ANSWER) // 40
+    assert "Assistant Response" in console.file.getvalue()
+
+
+def test_finished_blocks_are_parsed_once():
+    renderer = StreamRenderer(Console(file=io.StringIO(), force_terminal=True), refresh_interval=60)
+    renderer.render(split_chunks(ANSWER))
+
+    # The heading, paragraph, list and code block are finished, "Done." is the trailing block
+    assert [block.markup for block in renderer._blocks] == [
+        "## Summary",
+        "The feature **age** increases the prediction.",
+        "- item one\n- item two\n  continued",
+        "```python\nx = 1\n\nprint(x)\n```",
+    ]
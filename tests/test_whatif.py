@@ -0,0 +1,57 @@
+import io
+import numpy as np
+import pandas as pd
+from openai import OpenAI
+from rich.console import Console
+from sklearn.ensemble import RandomForestClassifier
+from xai_gpt_shap.ChatGptClient import ChatGptClient
+from tests.conftest import create_dataset
+from tests.mock_openai_server import MockChatCompletionsServer
+
+
+class ScriptedSession:
+    """
+    Returns prepared user inputs instead of reading them from the terminal.
+    """
+
+    def __init__(self, inputs):
+        self.inputs = list(inputs)
+
+    def prompt(self, message):
+        return self.inputs.pop(0)
+
+
+def test_whatif_command_adds_a_compact_diff_and_keeps_the_conversation(create_calculator, offline_encoding):
+    rng = np.random.default_rng(0)
+    data = create_dataset(rows=300, columns=[f"f{index}" for index in range(8)]).assign(age=rng.integers(20, 70, size=300))
+    noise = rng.normal(scale=15, size=300)
+    calculator = create_calculator(
+        model=RandomForestClassifier(n_estimators=20, random_state=0), data=data,
+        labels=lambda data: data["age"] + 10 * data["f0"] + noise > 45,
+    )
+    instance = calculator.data.iloc[[0]]
+    calculator.calculate_shap_values_for_instance(instance)
+
+    client = ChatGptClient("test-key")
+    client.console = Console(file=io.StringIO())
+    client.session = ScriptedSession([
+        "/whatif nope=1", "/whatif age=abc", "/whatif age=65 f0=1.5 would it change?", "/whatif reset", "exit",
+    ])
+    client.add_message("user", "Explain the SHAP values.")
+    client.add_message("assistant", "Age matters most.")
+    with MockChatCompletionsServer(answer="Yes, mostly because of age.") as server:
+        client.client = OpenAI(api_key="test-key", base_url=server.base_url)
+        client.interactive_chat(calculator, instance)
+
+    message = client.chat_history[-2]["content"]
+    before, after = calculator.model.predict_proba(pd.concat([instance, instance.assign(age=65, f0=1.5)]))[:, 1]
+    assert server.requests == 1
+    assert [entry["role"] for entry in client.chat_history] == ["user", "assistant", "user", "assistant"]
+    assert message.startswith(f"What-if: f0 {instance['f0'].iloc[0]:.4g} → 1.5, age {instance['age'].iloc[0]} → 65 (other")
+    assert f"Model output (probability of class 1): {before:.4f} → {after:.4f}" in message
+    assert message.count("\n- ") == 2 + ChatGptClient.WHATIF_FEATURES + 1
+    assert "other features changed by at most" in message
+    assert message.endswith("would it change?")
+    assert server.request_bodies[0]["messages"][0]["content"] == "Explain the SHAP values."
+    assert "Unknown feature: nope" in client.console.file.getvalue()
+    assert "expects a number" in client.console.file.getvalue()
@@ -0,0 +1,176 @@
+import time
+import numpy as np
+
+
+class ApproximateExplainer:
+    """
+    Estimates SHAP values by antithetic permutation sampling, with a budget and early stopping per instance.
+
+    Each sample is a random feature permutation and its reverse. Walking along the permutation, features are
+    switched from the background values to the instance values, and the change of the (background-averaged)
+    model output is attributed to the switched feature. The reversed permutation sees every feature in the
+    opposite context, which cancels much of the sampling noise. Every permutation satisfies additivity exactly,
+    so the estimates always sum to the prediction minus the base value.
+
+    Sampling stops for an instance when the standard errors of all estimates are below `tol`, when
+    `max_evals` coalitions were evaluated or when `deadline` seconds have passed, whichever comes first.
+
+    Example:
+        explainer = ApproximateExplainer(model.predict_proba, background, max_evals=2000, deadline=0.05, tol=0.005)
+        explanation = explainer(instances)
+        explanation.values, explanation.error_std
+    """
+
+    PAIRS_PER_ROUND = 4 # Permutation pairs evaluated together before the stopping rules are checked
+    MIN_PAIRS = 2 # Permutation pairs needed before the standard errors are trusted for early stopping
+    DEFAULT_MAX_EVALS = 5000 # Coalitions evaluated per instance if neither max_evals nor deadline is given
+    MAX_ROWS_PER_CALL = 20000 # Rows (coalitions × background rows) passed to the model in one call
+
+    def __init__(self, predict, background, weights=None, max_evals=None, deadline=None, tol=None, seed=None):
+        """
+        Initializes the explainer.
+
+        Args:
+            predict (callable): Returns class scores of shape (rows, classes) for a batch of rows.
+            background (DataFrame): Background rows that replace the features that are not in a coalition.
+            weights (ndarray, optional): Weights of the background rows. Defaults to equal weights.
+            max_evals (int, optional): Maximum coalitions evaluated per instance. Every coalition evaluates the
+                                       model on all background rows. Defaults to `DEFAULT_MAX_EVALS` when
+                                       no `deadline` is given.
+            deadline (float, optional): Maximum seconds spent per instance.
+            tol (float, optional): Stop when the standard errors of all SHAP values are at most this value.
+            seed (int, optional): Seed of the permutation sampling.
+
+        Raises:
+            ValueError: If a limit is not positive.
+        """
+        for name, value in (("max_evals", max_evals), ("deadline", deadline), ("tol", tol)):
+            if value is not None and value <= 0:
+                raise ValueError(f"{name} must be positive.")
+        if max_evals is None and deadline is None:
+            max_evals = self.DEFAULT_MAX_EVALS
+        self.predict = predict
+        self.background = background
+        self.feature_names = list(background.columns)
+        self._background = np.asarray(background)
+        self._weights = None if weights is None else np.asarray(weights, dtype=float) / np.sum(weights)
+        self.max_evals = max_evals
+        self.deadline = deadline
+        self.tol = tol
+        self._rng = np.random.default_rng(seed)
+        self.last_stats = []
+
+    def _get_minimum_evals(self):
+        n_features = len(self.feature_names)
+        # The empty and the full coalition, then the n_features - 1 intermediate coalitions of both permutations
+        return 2 + 2 * (n_features - 1) if n_features > 1 else 2
+
+    def __call__(self, instances):
+        """
+        Explains instances.
+
+        Args:
+            instances (DataFrame): Instances (rows) to explain.
+
+        Returns:
+            shap.Explanation: SHAP values of shape (instances, features, classes) with their standard errors
+                              in `error_std`. `last_stats` holds, per instance, the evaluated coalitions
+                              ("evals"), permutation pairs ("pairs"), whether the tolerance was reached
+                              ("converged") and the time spent in seconds ("elapsed").
+
+        Raises:
+            ValueError: If `max_evals` is too small for one permutation pair.
+        """
+        import shap
+
+        if self.max_evals is not None and self.max_evals < self._get_minimum_evals():
+            raise ValueError(
+                f"max_evals must be at least {self._get_minimum_evals()} for {len(self.feature_names)} features "
+                "(one permutation and its reverse)."
+            )
+        rows = np.asarray(instances[self.feature_names])
+        results = [self._explain_row(row) for row in rows]
+        self.last_stats = [stats for _, _, _, stats in results]
+        return shap.Explanation(
+            values=np.stack([values for values, _, _, _ in results]),
+            base_values=np.stack([base_values for _, base_values, _, _ in results]),
+            data=rows,
+            feature_names=self.feature_names,
+            error_std=np.stack([error_std for _, _, error_std, _ in results]),
+        )
+
+    def _evaluate(self, masks, row):
+        """
+        Returns the background-averaged model output of every coalition, shape (coalitions, classes).
+        """
+        n_background = len(self._background)
+        step = max(self.MAX_ROWS_PER_CALL // n_background, 1)
+        outputs = []
+        for start in range(0, len(masks), step):
+            # Every coalition is combined with every background row
+            part = masks[start:start + step]
+            combined = np.where(part[:, None, :], row[None, None, :], self._background[None, :, :])
+            output = np.asarray(self.predict(combined.reshape(-1, row.shape[0])), dtype=float)
+            output = output.reshape(len(part), n_background, -1)
+            if self._weights is None:
+                outputs.append(output.mean(axis=1))
+            else:
+                outputs.append(np.einsum("cbk,b->ck", output, self._weights))
+        return np.concatenate(outputs)
+
+    def _explain_row(self, row):
+        started = time.perf_counter()
+        n_features = len(row)
+        ends = self._evaluate(np.array([np.zeros(n_features, bool), np.ones(n_features, bool)]), row)
+        base_value, prediction = ends[0], ends[1]
+        evals = 2
+        if n_features == 1:
+            # A single feature gets the whole difference, there is nothing to sample
+            stats = {"evals": evals, "pairs": 0, "converged": True, "elapsed": time.perf_counter() - started}
+            return (prediction - base_value)[None], base_value, np.zeros((1, len(base_value))), stats
+        pair_estimates = []
+        converged = False
+
+        while True:
+            pairs = self.PAIRS_PER_ROUND
+            if self.max_evals is not None:
+                pairs = min(pairs, (self.max_evals - evals) // (2 * (n_features - 1)))
+            if pairs == 0:
+                break
+
+            permutations = np.argsort(self._rng.random((pairs, n_features)), axis=1)
+            permutations = np.concatenate([permutations, permutations[:, ::-1]])
+            # masks[p, k] contains the first k + 1 features of permutation p, only the intermediate coalitions are evaluated
+            ranks = np.empty_like(permutations)
+            np.put_along_axis(ranks, permutations, np.arange(n_features), axis=1)
+            masks = ranks[:, None, :] <= np.arange(n_features - 1)[None, :, None]
+            intermediate = self._evaluate(masks.reshape(-1, n_features), row).reshape(len(permutations), n_features - 1, -1)
+            evals += len(permutations) * (n_features - 1)
+
+            outputs = np.concatenate([
+                np.broadcast_to(base_value, (len(permutations), 1, len(base_value))),
+                intermediate,
+                np.broadcast_to(prediction, (len(permutations), 1, len(prediction))),
+            ], axis=1)
+            marginals = np.diff(outputs, axis=1)
+            contributions = np.empty_like(marginals)
+            np.put_along_axis(contributions, permutations[:, :, None], marginals, axis=1)
+            # A permutation and its reverse form one sample
+            pair_estimates.extend((contributions[:pairs] + contributions[pairs:]) / 2)
+
+            if len(pair_estimates) >= self.MIN_PAIRS and self.tol is not None:
+                error_std = np.std(pair_estimates, axis=0, ddof=1) / np.sqrt(len(pair_estimates))
+                if error_std.max() <= self.tol:
+                    converged = True
+                    break
+            if self.deadline is not None and time.perf_counter() - started >= self.deadline:
+                break
+
+        estimates = np.array(pair_estimates)
+        values = estimates.mean(axis=0)
+        if len(estimates) > 1:
+            error_std = estimates.std(axis=0, ddof=1) / np.sqrt(len(estimates))
+        else:
+            error_std = np.full_like(values, np.nan)
+        stats = {"evals": evals, "pairs": len(estimates), "converged": converged, "elapsed": time.perf_counter() - started}
+        return values, base_value, error_std, stats
@@ -0,0 +1,245 @@
+import time
+import random
+import asyncio
+import openai
+from openai import AsyncOpenAI
+import tiktoken
+from xai_gpt_shap.ChatGptClient import ChatGptClient
+from xai_gpt_shap.roles import get_role_message
+
+
+class _RateLimiter:
+    """
+    A token bucket that limits how much of a resource (requests or tokens) is used per minute.
+    """
+
+    def __init__(self, capacity_per_minute, clock=time.monotonic, sleep=asyncio.sleep):
+        """
+        Args:
+            capacity_per_minute (int): Units that may be used per minute, also the size of the bucket.
+            clock (callable, optional): Returns the current time in seconds, e.g. a fake clock in tests.
+            sleep (callable, optional): Coroutine function that waits for a number of seconds of `clock`.
+        """
+        self.capacity = capacity_per_minute
+        self.available = capacity_per_minute
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        """
+        Waits until `amount` units are available and takes them.
+
+        Args:
+            amount (int): Units to take. Requests larger than the bucket take the whole bucket.
+        """
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                now = self.clock()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.capacity / 60)
+                self.updated = now
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await self.sleep((amount - self.available) * 60 / self.capacity)
+
+
+class AsyncChatGptClient:
+    """
+    An asynchronous client for generating many explanations at once with OpenAI's GPT models.
+
+    Prompts (e.g. created with `ChatGptClient.create_summary_and_message`) are sent concurrently with a bounded
+    number of requests in flight. Requests and tokens per minute can be throttled, and requests that fail
+    with a rate limit (429), server error (5xx), timeout or connection error are retried with jittered
+    exponential backoff. Every result reports how long the request took.
+
+    Example:
+        prompts = [gpt_client.create_summary_and_message(df, "XGBoost", summary, "positive", "analyst") for df in shap_dfs]
+        results = AsyncChatGptClient(api_key).explain_many_sync(prompts, role="analyst")
+    """
+
+    DEFAULT_MODEL = ChatGptClient.DEFAULT_MODEL
+    DEFAULT_SYSTEM_MESSAGE = ChatGptClient.DEFAULT_SYSTEM_MESSAGE
+    TEMPERATURE = ChatGptClient.TEMPERATURE
+    MAX_RESPONSE_TOKENS = ChatGptClient.MAX_RESPONSE_TOKENS
+    MAX_CONCURRENCY = 8 # Maximum number of requests in flight
+    MAX_RETRIES = 5 # Retries after the first attempt
+    BACKOFF_BASE = 0.5 # Seconds, doubled after every failed attempt
+    BACKOFF_MAX = 30 # Maximum backoff in seconds
+    TIMEOUT = 60 # Seconds per request
+
+    def __init__(self, api_key, model=DEFAULT_MODEL, temperature=TEMPERATURE, max_response_tokens=MAX_RESPONSE_TOKENS,
+                 max_concurrency=MAX_CONCURRENCY, requests_per_minute=None, tokens_per_minute=None,
+                 max_retries=MAX_RETRIES, timeout=TIMEOUT, base_url=None, clock=time.monotonic, sleep=asyncio.sleep):
+        """
+        Initializes the AsyncChatGptClient class.
+
+        Args:
+            api_key (str): API key for OpenAI.
+            model (str, optional): GPT model name.
+            temperature (float, optional): Temperature of the responses.
+            max_response_tokens (int, optional): Maximum tokens per response.
+            max_concurrency (int, optional): Maximum number of requests in flight.
+            requests_per_minute (int, optional): Request limit per minute. No limit by default.
+            tokens_per_minute (int, optional): Token limit per minute (prompt and maximum response tokens).
+                                               No limit by default.
+            max_retries (int, optional): Retries after the first attempt of a request.
+            timeout (float, optional): Timeout of a single request in seconds.
+            base_url (str, optional): Base URL of the API, e.g. a local mock server.
+            clock (callable, optional): Clock in seconds used for throttling, e.g. a fake clock in tests.
+            sleep (callable, optional): Coroutine function that waits while throttled, in seconds of `clock`.
+        """
+        # Retries are handled here, so the OpenAI client must not retry on its own
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0, timeout=timeout)
+        self.model = model
+        self.temperature = temperature
+        self.max_response_tokens = max_response_tokens
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.clock = clock
+        self.sleep = sleep
+
+    def count_tokens(self, text):
+        """
+        Estimates the number of tokens in a string, used for token throttling.
+
+        Args:
+            text (str): The input text.
+
+        Returns:
+            int: The number of tokens, or a length based estimate if no encoder is available for the model.
+        """
+        encoding = ChatGptClient._ENCODINGS.get(self.model)
+        if encoding is None:
+            try:
+                encoding = tiktoken.encoding_for_model(self.model)
+            except Exception:
+                return len(text) // 4 + 1
+            ChatGptClient._ENCODINGS[self.model] = encoding
+        return len(encoding.encode(text))
+
+    async def explain_many(self, prompts, role=None, system_message=None):
+        """
+        Sends many prompts concurrently and returns the answers in input order.
+
+        Args:
+            prompts (list): Prompts to send, each one is a separate conversation.
+            role (str, optional): Role whose system message is sent with every prompt (e.g. "beginner").
+            system_message (str, optional): System message sent with every prompt. Overrides `role`.
+                                            Defaults to `DEFAULT_SYSTEM_MESSAGE`.
+
+        Returns:
+            list: One result dict per prompt with the keys "index", "answer", "error", "attempts", "latency"
+                  (seconds including retries and throttling), "queue_time" (seconds waiting for a free slot),
+                  "prompt_tokens" and "completion_tokens".
+        """
+        if system_message is None:
+            system_message = get_role_message(role) if role else self.DEFAULT_SYSTEM_MESSAGE
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        request_limiter = _RateLimiter(self.requests_per_minute, self.clock, self.sleep) if self.requests_per_minute else None
+        token_limiter = _RateLimiter(self.tokens_per_minute, self.clock, self.sleep) if self.tokens_per_minute else None
+
+        async def run(index, prompt):
+            queued = time.perf_counter()
+            async with semaphore:
+                started = time.perf_counter()
+                result = await self._send(prompt, system_message, request_limiter, token_limiter)
+                result["index"] = index
+                result["queue_time"] = started - queued
+                result["latency"] = time.perf_counter() - started
+                return result
+
+        return await asyncio.gather(*(run(index, prompt) for index, prompt in enumerate(prompts)))
+
+    def explain_many_sync(self, prompts, role=None, system_message=None):
+        """
+        Runs `explain_many` from synchronous code.
+
+        Args:
+            prompts (list): Prompts to send.
+            role (str, optional): Role whose system message is sent with every prompt.
+            system_message (str, optional): System message sent with every prompt.
+
+        Returns:
+            list: One result dict per prompt, see `explain_many`.
+        """
+        return asyncio.run(self.explain_many(prompts, role=role, system_message=system_message))
+
+    async def _send(self, prompt, system_message, request_limiter, token_limiter):
+        """
+        Sends one prompt, throttled and retried.
+
+        Args:
+            prompt (str): The prompt.
+            system_message (str): The system message.
+            request_limiter (_RateLimiter): Request limiter, or None.
+            token_limiter (_RateLimiter): Token limiter, or None.
+
+        Returns:
+            dict: The answer or the last error, the number of attempts and the token usage.
+        """
+        messages = [{"role": "system", "content": system_message}, {"role": "user", "content": prompt}]
+        estimated_tokens = None
+        if token_limiter is not None:
+            estimated_tokens = self.count_tokens(system_message) + self.count_tokens(prompt) + self.max_response_tokens
+
+        result = {"answer": None, "error": None, "attempts": 0, "prompt_tokens": None, "completion_tokens": None}
+        for attempt in range(self.max_retries + 1):
+            if request_limiter is not None:
+                await request_limiter.acquire()
+            if token_limiter is not None:
+                await token_limiter.acquire(estimated_tokens)
+
+            result["attempts"] = attempt + 1
+            try:
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=self.temperature,
+                    max_tokens=self.max_response_tokens,
+                )
+            except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+                # APITimeoutError is a subclass of APIConnectionError
+                result["error"] = str(e)
+                if attempt < self.max_retries:
+                    await asyncio.sleep(self._get_backoff(attempt, e))
+                continue
+            except openai.APIStatusError as e:
+                result["error"] = str(e)
+                if e.status_code >= 500 and attempt < self.max_retries:
+                    await asyncio.sleep(self._get_backoff(attempt, e))
+                    continue
+                break
+
+            result["answer"] = response.choices[0].message.content
+            result["error"] = None
+            if response.usage is not None:
+                result["prompt_tokens"] = response.usage.prompt_tokens
+                result["completion_tokens"] = response.usage.completion_tokens
+            break
+        return result
+
+    def _get_backoff(self, attempt, error):
+        """
+        Returns how long to wait before the next attempt.
+
+        Args:
+            attempt (int): Number of the failed attempt, starting with 0.
+            error (Exception): The error of the failed attempt.
+
+        Returns:
+            float: Seconds to wait. Uses the server's Retry-After header if present, otherwise full jitter.
+        """
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.BACKOFF_MAX)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** attempt))
@@ -0,0 +1,361 @@
+import os
+import json
+import time
+import hashlib
+import numbers
+import contextlib
+import pandas as pd
+
+
+class BatchPipeline:
+    """
+    Explains every instance of a large instance file without user interaction.
+
+    The instance file is read in chunks, SHAP values are calculated per chunk and, optionally, explained by GPT.
+    One JSON record per instance is appended to a JSONL output file as soon as its chunk is done, so memory
+    usage does not grow with the size of the input. After every chunk a checkpoint with the number of finished
+    rows, the size of the output file and a fingerprint of the explanation settings is written. A crashed run
+    started again with the same checkpoint truncates the partly written chunk and continues after the last
+    finished row. Resuming with different settings (model, background, target class, explainer or prompt
+    settings) is refused, so one output file never mixes records of two configurations.
+
+    Example:
+        pipeline = BatchPipeline(calculator, checkpoint_path="results.jsonl.checkpoint")
+        stats = pipeline.run("instances.csv", "results.jsonl")
+    """
+
+    DEFAULT_CHUNK_SIZE = 1000 # Rows read, explained and checkpointed together
+    CHECKPOINT_SUFFIX = ".checkpoint.json"
+    CSV_EXTENSIONS = (".csv", ".txt")
+    PARQUET_EXTENSIONS = (".parquet", ".pq")
+    FEATHER_EXTENSIONS = (".feather", ".arrow")
+
+    def __init__(self, calculator, gpt_client=None, llm_client=None, role=None, model_name="model",
+                 short_summary="", choice_class="", chunk_size=DEFAULT_CHUNK_SIZE, checkpoint_path=None,
+                 id_column=None, n_workers=None, token_budget=None, on_chunk=None):
+        """
+        Initializes the batch pipeline.
+
+        Args:
+            calculator (ShapCalculator): Calculator with the model, data and target class already set.
+            gpt_client (ChatGptClient, optional): Client used to build the GPT prompts. Required for explanations.
+            llm_client (AsyncChatGptClient, optional): Client that sends the prompts of a chunk concurrently.
+                                                       Without it, no GPT explanations are generated.
+            role (str, optional): Role of the explanations (e.g. "analyst").
+            model_name (str, optional): Model name used in the prompts.
+            short_summary (str, optional): Summary of what the model predicts, used in the prompts.
+            choice_class (str, optional): Name of the target class, used in the prompts.
+            chunk_size (int, optional): Rows read, explained and checkpointed together.
+            checkpoint_path (str, optional): Path of the checkpoint file. Defaults to the output path
+                                             with `CHECKPOINT_SUFFIX` appended.
+            id_column (str, optional): Column of the instance file copied into every record as "id".
+                                       It is not passed to the model.
+            n_workers (int, optional): Explain each chunk with `calculate_shap_values_parallel` on this many processes.
+                                       The worker pool is started once per run and reused for every chunk.
+            token_budget (int, optional): Token budget of every prompt, see `ChatGptClient.create_summary_and_message`.
+            on_chunk (callable, optional): Called with the number of finished rows after every chunk.
+
+        Raises:
+            ValueError: If `chunk_size` is not a positive integer or `llm_client` is given without `gpt_client`.
+        """
+        if not isinstance(chunk_size, numbers.Integral) or isinstance(chunk_size, bool) or chunk_size <= 0:
+            raise ValueError("chunk_size must be a positive integer.")
+        if llm_client is not None and gpt_client is None:
+            raise ValueError("gpt_client is required to build the prompts for llm_client.")
+        self.calculator = calculator
+        self.gpt_client = gpt_client
+        self.llm_client = llm_client
+        self.role = role
+        self.model_name = model_name
+        self.short_summary = short_summary
+        self.choice_class = choice_class
+        self.chunk_size = chunk_size
+        self.checkpoint_path = checkpoint_path
+        self.id_column = id_column
+        self.n_workers = n_workers
+        self.token_budget = token_budget
+        self.on_chunk = on_chunk
+
+    def run(self, instance_path, output_path, resume=True):
+        """
+        Explains all instances of a file and writes one JSON record per instance.
+
+        Args:
+            instance_path (str): Path to a CSV, Parquet or Feather file with the instances.
+            output_path (str): Path of the JSONL output file.
+            resume (bool, optional): Continue from the checkpoint of an earlier run of the same input and output.
+                                     With False the output is written from the start. Defaults to True.
+
+        Returns:
+            dict: Rows written in this run ("rows"), rows skipped because they were done earlier ("skipped"),
+                  rows whose GPT explanation failed ("errors") and the run time in seconds ("elapsed").
+
+        Raises:
+            ValueError: If the instance file format is not supported, or if the checkpoint was written with
+                        different settings and `resume` is True.
+        """
+        extension = os.path.splitext(instance_path)[1].lower()
+        if extension not in self.CSV_EXTENSIONS + self.PARQUET_EXTENSIONS + self.FEATHER_EXTENSIONS:
+            raise ValueError(f"Unsupported instance file format: {extension}")
+
+        started = time.perf_counter()
+        checkpoint_path = self.checkpoint_path or output_path + self.CHECKPOINT_SUFFIX
+        source = self._get_source_info(instance_path)
+        settings = self._get_settings_fingerprint()
+
+        checkpoint = self._read_checkpoint(checkpoint_path) if resume else None
+        if checkpoint is not None and (checkpoint["source"] != source or not os.path.exists(output_path)):
+            checkpoint = None
+        if checkpoint is not None and checkpoint.get("settings") != settings:
+            raise ValueError(
+                f"The checkpoint {checkpoint_path} was written with different settings. "
+                "Run with resume=False to explain the instances again."
+            )
+        rows_done = checkpoint["rows_done"] if checkpoint else 0
+        stats = {"rows": 0, "skipped": rows_done, "errors": 0, "elapsed": 0.0}
+        if checkpoint and checkpoint.get("complete"):
+            stats["elapsed"] = time.perf_counter() - started
+            return stats
+
+        with open(output_path, "r+b" if checkpoint else "wb") as output:
+            # Records written after the last checkpoint belong to an unfinished chunk
+            output.truncate(checkpoint["output_bytes"] if checkpoint else 0)
+            output.seek(0, os.SEEK_END)
+
+            with self._create_worker_pool() as executor:
+                for chunk in self.iter_chunks(instance_path, rows_done):
+                    records = self._explain_chunk(chunk, executor)
+                    with self.calculator.instrumentation.span("write_records", rows=len(records)):
+                        output.write("".join(json.dumps(record, default=self._to_json) + "\n" for record in records).encode("utf-8"))
+                        output.flush()
+                        os.fsync(output.fileno())
+
+                    rows_done += len(chunk)
+                    stats["rows"] += len(chunk)
+                    stats["errors"] += sum(record.get("error") is not None for record in records)
+                    self._write_checkpoint(checkpoint_path, {
+                        "source": source, "settings": settings, "rows_done": rows_done,
+                        "output_bytes": output.tell(), "complete": False,
+                    })
+                    if self.on_chunk is not None:
+                        self.on_chunk(rows_done)
+
+            self._write_checkpoint(checkpoint_path, {
+                "source": source, "settings": settings, "rows_done": rows_done,
+                "output_bytes": output.tell(), "complete": True,
+            })
+
+        stats["elapsed"] = time.perf_counter() - started
+        return stats
+
+    def iter_chunks(self, instance_path, start_row=0):
+        """
+        Reads the instance file in chunks of `chunk_size` rows, starting at `start_row`.
+
+        Args:
+            instance_path (str): Path to the instance file.
+            start_row (int, optional): Number of rows to skip.
+
+        Yields:
+            DataFrame: Chunks of instances, indexed by their row number in the file.
+        """
+        extension = os.path.splitext(instance_path)[1].lower()
+        if extension in self.PARQUET_EXTENSIONS or extension in self.FEATHER_EXTENSIONS:
+            for row, batch in self._iter_arrow_batches(instance_path, extension, start_row):
+                # Only the batch that contains start_row is partly skipped, earlier batches are never converted
+                skipped = max(start_row - row, 0)
+                chunk = batch.slice(skipped).to_pandas()
+                chunk.index = pd.RangeIndex(row + skipped, row + skipped + len(chunk))
+                yield chunk
+        elif extension in self.CSV_EXTENSIONS:
+            reader = pd.read_csv(instance_path, chunksize=self.chunk_size, skiprows=range(1, start_row + 1))
+            row = start_row
+            for chunk in reader:
+                chunk.index = pd.RangeIndex(row, row + len(chunk))
+                row += len(chunk)
+                yield chunk
+        else:
+            raise ValueError(f"Unsupported instance file format: {extension}")
+
+    def _iter_arrow_batches(self, instance_path, extension, start_row):
+        """
+        Reads a Parquet or Feather file in record batches of at most `chunk_size` rows with pyarrow.
+
+        Args:
+            instance_path (str): Path to the instance file.
+            extension (str): File extension.
+            start_row (int): Batches that end before this row are skipped.
+
+        Yields:
+            Tuple: Row number of the first row of the batch and the pyarrow RecordBatch.
+        """
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        if extension in self.PARQUET_EXTENSIONS:
+            parquet_file = pyarrow.parquet.ParquetFile(instance_path)
+            row = 0
+            row_groups = []
+            for index in range(parquet_file.num_row_groups):
+                group_rows = parquet_file.metadata.row_group(index).num_rows
+                if row + group_rows > start_row or row_groups:
+                    row_groups.append(index)
+                else:
+                    row += group_rows
+            if not row_groups:
+                return
+            for batch in parquet_file.iter_batches(batch_size=self.chunk_size, row_groups=row_groups):
+                if row + batch.num_rows > start_row:
+                    yield row, batch
+                row += batch.num_rows
+        else:
+            with pyarrow.memory_map(instance_path) as source:
+                reader = pyarrow.ipc.open_file(source)
+                row = 0
+                for index in range(reader.num_record_batches):
+                    batch = reader.get_batch(index)
+                    for start in range(0, batch.num_rows, self.chunk_size):
+                        part = batch.slice(start, self.chunk_size)
+                        if row + part.num_rows > start_row:
+                            yield row, part
+                        row += part.num_rows
+
+    def _create_worker_pool(self):
+        """
+        Starts the SHAP worker processes of a run, if `n_workers` is set to more than one.
+
+        Returns:
+            A context manager that returns the process pool, or None if the chunks are explained in this process.
+        """
+        if self.n_workers is None or self.n_workers <= 1:
+            return contextlib.nullcontext()
+        return self.calculator.create_worker_pool(self.n_workers)
+
+    def _explain_chunk(self, chunk, executor=None):
+        """
+        Calculates SHAP values (and GPT explanations) for one chunk.
+
+        Args:
+            chunk (DataFrame): Instances of the chunk, indexed by their row number.
+            executor (ProcessPoolExecutor, optional): Worker pool of the run, see `_create_worker_pool`.
+
+        Returns:
+            list: One record per instance.
+        """
+        feature_names = list(self.calculator.data.columns)
+        instances = chunk[feature_names]
+        if self.n_workers is not None:
+            _, explanation = self.calculator.calculate_shap_values_parallel(
+                instances, n_workers=self.n_workers, executor=executor
+            )
+        else:
+            _, explanation = self.calculator.calculate_shap_values_for_batch(instances)
+
+        shap_values = explanation.values
+        base_values = explanation.base_values
+        error_std = explanation.error_std
+        feature_values = instances.to_dict("records")
+        ids = chunk[self.id_column].tolist() if self.id_column else None
+
+        records = []
+        for position, row in enumerate(chunk.index):
+            record = {"row": int(row)}
+            if ids is not None:
+                record["id"] = ids[position]
+            record["base_value"] = float(base_values[position])
+            record["shap_values"] = dict(zip(feature_names, shap_values[position].tolist()))
+            if error_std is not None:
+                record["shap_std_errors"] = dict(zip(feature_names, error_std[position].tolist()))
+            record["feature_values"] = feature_values[position]
+            records.append(record)
+
+        if self.llm_client is not None:
+            self._add_explanations(records, feature_names, shap_values, error_std, instances)
+        return records
+
+    def _add_explanations(self, records, feature_names, shap_values, error_std, instances):
+        """
+        Generates the GPT explanations of a chunk concurrently and adds them to the records.
+        """
+        prompts = []
+        for position in range(len(records)):
+            shap_df = pd.DataFrame({
+                "Feature": feature_names,
+                "SHAP Value": shap_values[position],
+                "Feature Value": instances.iloc[position].values,
+            })
+            if error_std is not None:
+                shap_df["SHAP Std Error"] = error_std[position]
+            prompts.append(self.gpt_client.create_summary_and_message(
+                shap_df, self.model_name, self.short_summary, self.choice_class, self.role,
+                token_budget=self.token_budget,
+            ))
+
+        instrumentation = self.calculator.instrumentation
+        with instrumentation.span("llm_batch", prompts=len(prompts)):
+            results = self.llm_client.explain_many_sync(prompts, role=self.role)
+        for result in results:
+            if result["prompt_tokens"] is not None:
+                instrumentation.increment("prompt_tokens", result["prompt_tokens"])
+                instrumentation.increment("completion_tokens", result["completion_tokens"])
+        for record, result in zip(records, results):
+            record["explanation"] = result["answer"]
+            record["error"] = result["error"]
+
+    @staticmethod
+    def _get_source_info(instance_path):
+        """
+        Describes the input file, so a checkpoint is only used for the same, unchanged input.
+        """
+        stat = os.stat(instance_path)
+        return {"path": os.path.abspath(instance_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _get_settings_fingerprint(self):
+        """
+        Hashes everything that changes the records, so a checkpoint is only used with the same settings.
+
+        Returns:
+            str: A SHA-1 hex digest of the model and background fingerprints, the target class, the explainer
+                 type and options, and the id column and prompt settings.
+        """
+        calculator = self.calculator
+        settings = repr((
+            calculator.get_model_fingerprint(),
+            calculator.get_background_fingerprint(),
+            repr(calculator.target_class),
+            calculator.explainer_type,
+            sorted((name, repr(value)) for name, value in calculator.explainer_options.items()),
+            list(calculator.data.columns),
+            self.id_column,
+            self.llm_client is not None,
+            (self.role, self.model_name, self.short_summary, self.choice_class, self.token_budget),
+        ))
+        return hashlib.sha1(settings.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _read_checkpoint(checkpoint_path):
+        try:
+            with open(checkpoint_path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_checkpoint(checkpoint_path, checkpoint):
+        # Written to a temporary file and renamed, so a crash never leaves a half-written checkpoint
+        temporary_path = checkpoint_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(checkpoint, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, checkpoint_path)
+
+    @staticmethod
+    def _to_json(value):
+        """
+        Converts NumPy scalars and other values that `json` cannot serialize.
+        """
+        if hasattr(value, "item"):
+            return value.item()
+        return str(value)
@@ -1,20 +1,10 @@
-from openai import OpenAI
-from rich.console import Console
-from rich.panel import Panel
-from rich.live import Live
-from rich.markdown import Markdown
-from prompt_toolkit import PromptSession
-import tiktoken
+import re
+import time
+import numpy as np
 from xai_gpt_shap.roles import get_role_message
+from xai_gpt_shap.instrumentation import get_instrumentation
 
 
-"""
-TODO's:
-- Export chat history
-- Import chat history
-
-"""
-
 class ChatGptClient:
     """
     A client for interacting with OpenAI's GPT models. Provides methods for sending prompts, handling chat history
@@ -26,18 +16,74 @@ class ChatGptClient:
     TEMPERATURE = 0.7 # Controls the randomness of GPT's responses
     MAX_RESPONSE_TOKENS = 200 # Maximum tokens per response
     MAX_HISTORY_TOKENS = 4096 # Maximum tokens in the chat history 
+    TOP_FEATURES = 3 # Number of top positive and negative features highlighted in prompts
+    WHATIF_COMMAND = "/whatif" # Chat command that re-explains the instance with edited feature values
+    WHATIF_FEATURES = 5 # Largest attribution changes listed after a what-if edit, besides the edited features
+    _ENCODINGS = {} # Token encoders cached per model, shared by all clients
 
-    def __init__(self, api_key, model=DEFAULT_MODEL,temperature=TEMPERATURE, max_response_tokens=MAX_RESPONSE_TOKENS, max_history_tokens=MAX_HISTORY_TOKENS):
+    def __init__(self, api_key, model=DEFAULT_MODEL,temperature=TEMPERATURE, max_response_tokens=MAX_RESPONSE_TOKENS, max_history_tokens=MAX_HISTORY_TOKENS, response_cache=None, instrumentation=None, session_store=None, session_id=None):
         #TODO napisi docsstring
-        self.client = OpenAI(api_key=api_key)
+        # The OpenAI client, console and prompt session are created on first use, so prompt building
+        # and token counting do not import openai, rich and prompt_toolkit
+        self.api_key = api_key
+        self._client = None
+        self._console = None
+        self._session = None
         self.model = model
         self.chat_history = []
         self.system_message = self.DEFAULT_SYSTEM_MESSAGE
-        self.console = Console()
-        self.session = PromptSession()
         self.temperature = temperature
         self.max_response_tokens = max_response_tokens
         self.max_history_tokens = max_history_tokens
+        self.history_token_counts = [] # Token count of each message in chat_history
+        self._counted_contents = [] # Content each token count was computed for
+        self._history_tokens_total = 0
+        self.response_cache = response_cache # Optional ResponseCache for repeated prompts
+        self.session_store = session_store # Optional ChatSessionStore that logs every change of chat_history
+        self.session_id = session_id
+        self.instrumentation = instrumentation if instrumentation is not None else get_instrumentation()
+
+    @property
+    def client(self):
+        """
+        OpenAI: The OpenAI client.
+        """
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=self.api_key)
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    @property
+    def console(self):
+        """
+        Console: The rich console used for all output.
+        """
+        if self._console is None:
+            from rich.console import Console
+            self._console = Console()
+        return self._console
+
+    @console.setter
+    def console(self, console):
+        self._console = console
+
+    @property
+    def session(self):
+        """
+        PromptSession: The prompt session used to read user input.
+        """
+        if self._session is None:
+            from prompt_toolkit import PromptSession
+            self._session = PromptSession()
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
 
     def count_tokens(self, text):
         """
@@ -49,12 +95,80 @@ class ChatGptClient:
         Returns: 
             int: The number of tokens in the input text.
         """
-        encoding = tiktoken.encoding_for_model(self.model)
+        encoding = self._ENCODINGS.get(self.model)
+        if encoding is None:
+            import tiktoken
+            encoding = tiktoken.encoding_for_model(self.model)
+            self._ENCODINGS[self.model] = encoding
         return len(encoding.encode(text))
+
+    def add_message(self, role, content, index=None):
+        """
+        Adds a message to the chat history and stores its token count. Only the new message is tokenized,
+        direct edits of `chat_history` are picked up when the totals are read. If a session store is set,
+        the message is also logged.
+
+        Args:
+            role (str): Role of the message author ("system", "user" or "assistant").
+            content (str): The message text.
+            index (int, optional): Position to insert the message at. By default it is appended.
+
+        Returns:
+            dict: The added message.
+        """
+        message = {"role": role, "content": content}
+        tokens = self.count_tokens(content)
+        if index is None:
+            self.chat_history.append(message)
+            self.history_token_counts.append(tokens)
+            self._counted_contents.append(content)
+        else:
+            self.chat_history.insert(index, message)
+            self.history_token_counts.insert(index, tokens)
+            self._counted_contents.insert(index, content)
+        self._history_tokens_total += tokens
+        if self.session_store is not None:
+            self.session_store.append_message(self.session_id, role, content, tokens, self.model, index)
+        return message
+
+    def _sync_history_token_counts(self):
+        """
+        Updates the token counts if `chat_history` was changed directly instead of through `add_message`,
+        e.g. a message was added, removed or its content was edited in place. Counts are kept per message
+        content, so only new or edited messages are tokenized again. Such changes are not logged to the
+        session store. It scans the whole history, so it is only called where the totals are read.
+        """
+        contents = [message["content"] for message in self.chat_history]
+        if len(contents) == len(self._counted_contents) == len(self.history_token_counts) and all(
+            content is counted for content, counted in zip(contents, self._counted_contents)
+        ):
+            return
+        known = dict(zip(self._counted_contents, self.history_token_counts))
+        self.history_token_counts = [
+            known[content] if content in known else self.count_tokens(content) for content in contents
+        ]
+        self._counted_contents = contents
+        self._history_tokens_total = sum(self.history_token_counts)
+
+    def get_history_token_usage(self):
+        """
+        Reports the token usage of the chat history without re-encoding the messages.
+
+        Returns:
+            dict: Total tokens in the history, the number of messages and the maximum allowed tokens.
+        """
+        self._sync_history_token_counts()
+        return {
+            "total_tokens": self._history_tokens_total,
+            "messages": len(self.chat_history),
+            "max_history_tokens": self.max_history_tokens,
+        }
         
     def clean_chat_history(self, max_history_tokens=0):
         """
         Clean the chat history based on the maximum allowed tokens inside history.
+        The first three and the last two messages are always kept, the oldest messages in between
+        are removed until the history fits.
 
         Args: 
             max_history_tokens (int): Maximum allowed token count. Defaults to self.max_history_tokens
@@ -63,21 +177,18 @@ class ChatGptClient:
         if max_history_tokens == 0:
             max_history_tokens = self.max_history_tokens
 
-        total_tokens = sum([self.count_tokens(message['content']) for message in self.chat_history])
+        self._sync_history_token_counts()
+        total_tokens = self._history_tokens_total
         
-        if total_tokens < max_history_tokens or len(self.chat_history) <4:
-            # No cleaning required
+        if total_tokens < max_history_tokens or len(self.chat_history) < 5:
+            # No cleaning required, or no middle messages that could be removed
             return
         
         self.custom_console_message(f"Number of tokens: {total_tokens}. Cleaning the chat history based on the maximum tokens...", "red")
 
         # Keep first few and last messages (critical context)
-        first_three_messages = self.chat_history[:3]
-        last_two_messages = self.chat_history[-2:]
-        middle_messages = self.chat_history[3:-2]
-        
-        # Calculate token usage of critical messages
-        critical_tokens = sum(self.count_tokens(message['content']) for message in first_three_messages + last_two_messages) 
+        token_counts = self.history_token_counts
+        critical_tokens = sum(token_counts[:3]) + sum(token_counts[-2:])
         if critical_tokens > max_history_tokens:
             # TODO offer an user option to delete or continue/end?
             self.custom_console_message(
@@ -85,12 +196,89 @@ class ChatGptClient:
                 color="red"
             )
             
-        # Trim middle messages to fit within token limit
-        while total_tokens > max_history_tokens and middle_messages:
-            middle_messages.pop(0)
-            total_tokens = (critical_tokens + sum([self.count_tokens(message['content']) for message in middle_messages])) 
-            
-        self.chat_history = first_three_messages + middle_messages + last_two_messages
+        removed, total_tokens = self._count_trimmed_messages(token_counts, total_tokens, max_history_tokens)
+        del self.chat_history[3:3 + removed]
+        del self.history_token_counts[3:3 + removed]
+        del self._counted_contents[3:3 + removed]
+        self._history_tokens_total = total_tokens
+        if self.session_store is not None and removed:
+            self.session_store.delete_messages(self.session_id, 3, removed)
+
+    @staticmethod
+    def _count_trimmed_messages(token_counts, total_tokens, max_history_tokens):
+        """
+        Finds how many of the oldest middle messages (after the first three) must be removed for the history
+        to fit, using the running total, so only removed messages are visited. The last two messages are kept.
+
+        Args:
+            token_counts (list): Token count of each message.
+            total_tokens (int): Sum of the token counts.
+            max_history_tokens (int): Maximum allowed token count.
+
+        Returns:
+            tuple: Number of messages to remove from position 3 and the token count after removing them.
+        """
+        middle_end = len(token_counts) - 2
+        removed = 0
+        while total_tokens > max_history_tokens and 3 + removed < middle_end:
+            total_tokens -= token_counts[3 + removed]
+            removed += 1
+        return removed, total_tokens
+
+    def set_session_store(self, session_store, session_id):
+        """
+        Sets the store that logs every message of this chat, so the session can be resumed later.
+        The current history is not logged, use `resume_session` to continue a logged session.
+
+        Args:
+            session_store (ChatSessionStore): The store, or None to stop logging.
+            session_id (str): Id of the session in the store.
+        """
+        self.session_store = session_store
+        self.session_id = session_id
+
+    def resume_session(self, session_store, session_id, max_history_tokens=0):
+        """
+        Continues a logged session. The history is rebuilt from the stored token counts, trimmed the way
+        `clean_chat_history` would trim it, and only the texts of the kept messages are read. Messages are
+        tokenized again only if their tokens were counted for a different model. New messages are logged
+        to the same session.
+
+        Args:
+            session_store (ChatSessionStore): The store.
+            session_id (str): Id of the session.
+            max_history_tokens (int): Maximum allowed token count. Defaults to self.max_history_tokens
+
+        Returns:
+            int: Number of restored messages, 0 if the session was not logged before.
+        """
+        if max_history_tokens == 0:
+            max_history_tokens = self.max_history_tokens
+
+        headers = session_store.load_headers(session_id)
+        recount = [header["seq"] for header in headers if header["model"] != self.model]
+        contents = session_store.load_contents(session_id, recount)
+        for header in headers:
+            if header["seq"] in contents:
+                header["tokens"] = self.count_tokens(contents[header["seq"]])
+
+        token_counts = [header["tokens"] for header in headers]
+        removed, total_tokens = self._count_trimmed_messages(token_counts, sum(token_counts), max_history_tokens)
+        del headers[3:3 + removed]
+        del token_counts[3:3 + removed]
+        if removed:
+            # Logged, so later positions refer to the same history when the session is replayed again
+            session_store.delete_messages(session_id, 3, removed)
+
+        contents.update(session_store.load_contents(session_id, [header["seq"] for header in headers if header["seq"] not in contents]))
+        self.chat_history = [{"role": header["role"], "content": contents[header["seq"]]} for header in headers]
+        self.history_token_counts = token_counts
+        self._counted_contents = [message["content"] for message in self.chat_history]
+        self._history_tokens_total = total_tokens
+        if self.chat_history and self.chat_history[0]["role"] == "system":
+            self.system_message = self.chat_history[0]
+        self.set_session_store(session_store, session_id)
+        return len(self.chat_history)
 
 
     def set_temperature(self, temperature):
@@ -142,18 +330,46 @@ class ChatGptClient:
             message (str): The system-level message
         
         """
-        self.system_message = {"role": "system", "content": message}
-        self.chat_history.insert(0, self.system_message)
+        self.system_message = self.add_message("system", message, index=0)
 
-    def send_initial_prompt(self, prompt, print_response=True, max_response_tokens=0, temperature=0):
+    def set_response_cache(self, response_cache):
+        """
+        Sets the cache used to reuse answers to identical requests.
+
+        Args:
+            response_cache (ResponseCache): An `InMemoryResponseCache` or `SQLiteResponseCache`, or None to disable caching.
+        """
+        self.response_cache = response_cache
+
+    def _get_response_cache_key(self, temperature, max_response_tokens):
+        """
+        Creates the response cache key of the current chat history.
+
+        Args:
+            temperature (float): Temperature of the request.
+            max_response_tokens (int): Maximum response tokens of the request, or None.
+
+        Returns:
+            str: The cache key.
+        """
+        system_message = self.system_message
+        if isinstance(system_message, dict):
+            system_message = system_message["content"]
+        return self.response_cache.make_key(
+            self.model, temperature, max_response_tokens, system_message, self.chat_history
+        )
+
+    def send_initial_prompt(self, prompt, print_response=True, max_response_tokens=0, temperature=0, bypass_cache=False):
         """
         Sends the initial prompt to GPT and retrieves the assistant's response.
+        If a response cache is set, the answer to an identical earlier request is reused.
 
         Args:
             prompt (str): The initial prompt to send.
             print_response (bool): Whether to print the response to the console. Defaults to True.
             max_response_tokens (int): Maximum tokens for the response. Defaults to `self.max_response_tokens`.
             temperature (float): Temperature for the response. Defaults to `self.temperature`.
+            bypass_cache (bool): Always call the API, the new answer still replaces the cached one. Defaults to False.
 
         Returns:
             str: The assistant's response.
@@ -168,19 +384,36 @@ class ChatGptClient:
             temperature = self.temperature
 
         self.custom_console_message("Sending the initial SHAP results to the model...", "green")
-        self.chat_history.append({"role": "user", "content": prompt})
-        
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=self.chat_history,
-            temperature=temperature,
-            max_tokens=max_response_tokens,
-        )
+        self.add_message("user", prompt)
+
+        answer = None
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = self._get_response_cache_key(temperature, max_response_tokens)
+            if not bypass_cache:
+                answer = self.response_cache.get(cache_key)
+                self.instrumentation.increment("response_cache_hits" if answer is not None else "response_cache_misses")
+
+        if answer is None:
+            with self.instrumentation.span("llm_request", model=self.model):
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=self.chat_history,
+                    temperature=temperature,
+                    max_tokens=max_response_tokens,
+                )
+            if response.usage is not None:
+                self.instrumentation.increment("prompt_tokens", response.usage.prompt_tokens)
+                self.instrumentation.increment("completion_tokens", response.usage.completion_tokens)
+            answer = response.choices[0].message.content
+            if cache_key is not None and answer is not None:
+                self.response_cache.put(cache_key, answer)
 
-        answer = response.choices[0].message.content
-        self.chat_history.append({"role": "assistant", "content": answer})
+        self.add_message("assistant", answer)
 
         if print_response == True:
+            from rich.markdown import Markdown
+            from rich.panel import Panel
             self.console.print(
                 Panel(
                     Markdown(answer), title="Assistant Response", border_style="blue"
@@ -198,11 +431,26 @@ class ChatGptClient:
         """
         self.console.print(f"[bold {color}]{message}[/bold {color}]")
 
-    def interactive_chat(self):
+    def interactive_chat(self, calculator=None, instance=None):
         """
         Interactive chat with ChatGPT
+
+        If a calculator and the explained instance are given, "/whatif feature=value ... [question]" edits
+        feature values of the instance, explains it again with the already loaded model and explainer and
+        asks about the change. "/whatif reset" goes back to the original instance.
+
+        Args:
+            calculator (ShapCalculator, optional): The calculator that explained the instance.
+            instance (DataFrame, optional): The explained instance.
         """
         self.console.print("[bold cyan]You can now interact with ChatGPT. Type your questions below![/bold cyan]")
+        whatif_state = None
+        if calculator is not None and instance is not None:
+            whatif_state = {"original": instance.iloc[[0]], "current": instance.iloc[[0]], "baseline": None}
+            self.console.print(
+                f"[cyan]Type {self.WHATIF_COMMAND} feature=value ... [question] to change feature values, "
+                f"{self.WHATIF_COMMAND} reset to undo the changes.[/cyan]"
+            )
         while True:
             try:
                 
@@ -217,8 +465,17 @@ class ChatGptClient:
                 if not isinstance(user_message, str):
                     user_message = str(user_message)
 
+                if whatif_state is not None and user_message.split(maxsplit=1)[:1] == [self.WHATIF_COMMAND]:
+                    try:
+                        user_message = self._run_whatif(user_message, calculator, whatif_state)
+                    except ValueError as e:
+                        self.console.print(f"[bold red]{e}[/bold red]")
+                        continue
+                    if user_message is None:
+                        continue
+
                 # Append user message to chat history
-                self.chat_history.append({"role": "user", "content": user_message})
+                self.add_message("user", user_message)
 
                 # Send input and stream the response
                 self.stream_response()
@@ -230,78 +487,446 @@ class ChatGptClient:
                 self.exit_chat()
                 break
 
-    def stream_response(self):
+    def _run_whatif(self, command, calculator, state):
         """
-        Stream the response from ChatGPT
+        Applies a what-if command to the current instance and explains the edited instance.
+
+        Args:
+            command (str): The "/whatif ..." command.
+            calculator (ShapCalculator): The calculator that explained the instance.
+            state (dict): The original and the current instance and the explanation of the original instance.
+
+        Returns:
+            str: The message for the chat history, or None if there is nothing to ask (e.g. after a reset).
+
+        Raises:
+            ValueError: If the command is invalid or the instance cannot be explained.
         """
-        self.console.print("[bold green]Streaming response from ChatGPT...[/bold green]")
+        edits, question = self._parse_whatif(command, state["current"])
+        if edits is None:
+            state["current"] = state["original"]
+            self.console.print("[bold cyan]The instance was reset to its original values.[/bold cyan]")
+            return None
 
-        text = ""
-        block = "█ "
-
-        with Live(console=self.console, refresh_per_second=4) as live:
-            for token in self.client.chat.completions.create(
-                model=self.model,
-                messages=self.chat_history,
-                temperature=self.temperature,
-                stream=True,
-            ):
-                # Preveri, ali atribut "content" obstaja in ni None
-                content = getattr(token.choices[0].delta, "content", None)
-                if content:
-                    text += content
-                    markdown = Markdown(text + block)
-                    live.update(markdown, refresh=True)
-
-            live.update(
-                Panel(
-                    Markdown(text),
-                    title="Assistant Response",
-                    border_style="blue",
-                )
-            )
+        started = time.perf_counter()
+        with self.instrumentation.span("whatif_explanation"):
+            if state["baseline"] is None:
+                state["baseline"] = calculator.calculate_shap_values_for_instance(state["original"])
+            edited = state["current"].copy()
+            for feature, value in edits.items():
+                edited[feature] = value
+            after = calculator.calculate_shap_values_for_instance(edited)
+        state["current"] = edited
+        self.console.print(f"[cyan]Re-explained in {time.perf_counter() - started:.2f} s.[/cyan]")
+
+        before_results, before_values = state["baseline"]
+        after_results, after_values = after
+        changes = {
+            feature: (state["original"][feature].iloc[0], edited[feature].iloc[0]) for feature in edited.columns
+            if not state["original"][feature].equals(edited[feature])
+        }
+        return self._format_whatif_message(
+            changes, before_results, after_results,
+            float(np.ravel(before_values.base_values)[0] + before_values.values[0].sum()),
+            float(np.ravel(after_values.base_values)[0] + after_values.values[0].sum()),
+            f"{calculator.explainer_output} of class {calculator.target_class}",
+            question,
+        )
+
+    def _parse_whatif(self, command, instance):
+        """
+        Parses "/whatif feature=value ... [question]". Values are converted to the type of their column.
+
+        Args:
+            command (str): The command.
+            instance (DataFrame): The instance whose features are edited.
+
+        Returns:
+            tuple: The edited values by feature (None for "/whatif reset") and the question (or None).
+
+        Raises:
+            ValueError: If no feature is edited, a feature does not exist or a value does not fit its column.
+        """
+        rest = command[len(self.WHATIF_COMMAND):].strip()
+        if rest.lower() == "reset":
+            return None, None
+
+        edits = {}
+        while True:
+            match = re.match(r"""([^\s=]+)=("[^"]*"|'[^']*'|\S+)\s*""", rest)
+            if match is None:
+                break
+            feature, value = match.group(1), match.group(2)
+            if feature not in instance.columns:
+                raise ValueError(f"Unknown feature: {feature}. Available features: {', '.join(map(str, instance.columns))}")
+            if value[:1] in ("'", '"'):
+                value = value[1:-1]
+            if instance[feature].dtype.kind in "iuf":
+                try:
+                    value = float(value)
+                except ValueError:
+                    raise ValueError(f"Feature {feature} expects a number, got {value!r}.")
+                if instance[feature].dtype.kind in "iu" and value.is_integer():
+                    value = int(value)
+            edits[feature] = value
+            rest = rest[match.end():]
+
+        if not edits:
+            raise ValueError(f"Usage: {self.WHATIF_COMMAND} feature=value ... [question], or {self.WHATIF_COMMAND} reset")
+        return edits, rest or None
+
+    @classmethod
+    def _format_whatif_message(cls, changes, before, after, before_output, after_output, output, question=None):
+        """
+        Creates a compact message with the edited features and the largest attribution changes,
+        instead of the whole SHAP table.
+
+        Args:
+            changes (dict): Original and edited value of every feature that differs from the original instance.
+            before (DataFrame): SHAP results of the original instance.
+            after (DataFrame): SHAP results of the edited instance.
+            before_output (float): Model output of the original instance.
+            after_output (float): Model output of the edited instance.
+            output (str): Description of the model output (e.g. "probability of class 1").
+            question (str, optional): The user's question. By default the change is to be explained.
 
-        self.chat_history.append({"role": "assistant", "content": text})
+        Returns:
+            str: The message.
+        """
+        before_values = before["SHAP Value"].to_numpy(dtype=float)
+        after_values = after["SHAP Value"].to_numpy(dtype=float)
+        deltas = after_values - before_values
+        features = before["Feature"].astype(str).to_numpy()
+        is_changed = np.isin(features, [str(feature) for feature in changes])
+
+        # The edited features first, then the largest other changes
+        others = np.flatnonzero(~is_changed)
+        others = others[np.argsort(-np.abs(deltas[others]), kind="stable")]
+        listed = np.concatenate([np.flatnonzero(is_changed), others[:cls.WHATIF_FEATURES]])
+        remaining = others[cls.WHATIF_FEATURES:]
+
+        def formatted(value):
+            return f"{value:.4g}" if isinstance(value, (float, np.floating)) else str(value)
+
+        edits = ", ".join(f"{feature} {formatted(old)} → {formatted(new)}" for feature, (old, new) in changes.items())
+        lines = [
+            f"What-if: {edits} (other features unchanged)." if edits else "What-if: back to the original feature values.",
+            f"Model output ({output}): {before_output:.4f} → {after_output:.4f} ({after_output - before_output:+.4f}).",
+            "Attribution changes (SHAP before → after):",
+        ]
+        lines.extend(
+            f"- {features[position]}: {before_values[position]:.4f} → {after_values[position]:.4f} ({deltas[position]:+.4f})"
+            for position in listed
+        )
+        if len(remaining):
+            lines.append(f"- {len(remaining)} other features changed by at most {np.abs(deltas[remaining]).max():.4f}.")
+        lines.append(question or "Explain how and why the prediction changed.")
+        return "\n".join(lines)
+
+    def stream_response(self, bypass_cache=False):
+        """
+        Stream the response from ChatGPT. If a response cache is set, the answer to an identical earlier
+        request is replayed through the same rendering as a live response.
+
+        Args:
+            bypass_cache (bool): Always call the API, the new answer still replaces the cached one. Defaults to False.
+
+        Returns:
+            str: The assistant's response.
+        """
+        self.console.print("[bold green]Streaming response from ChatGPT...[/bold green]")
+
+        cached_answer = None
+        cache_key = None
+        if self.response_cache is not None:
+            # Streamed requests do not limit the response tokens
+            cache_key = self._get_response_cache_key(self.temperature, None)
+            if not bypass_cache:
+                cached_answer = self.response_cache.get(cache_key)
+                self.instrumentation.increment("response_cache_hits" if cached_answer is not None else "response_cache_misses")
+
+        if cached_answer is not None:
+            text = self._render_stream(self._replay_chunks(cached_answer))
+        else:
+            with self.instrumentation.span("llm_stream", model=self.model):
+                text = self._render_stream(self._stream_chunks())
+            if self.instrumentation.enabled:
+                # Streamed responses do not report usage, the tokens are counted locally
+                self.instrumentation.increment("prompt_tokens", self.get_history_token_usage()["total_tokens"])
+                self.instrumentation.increment("completion_tokens", self.count_tokens(text))
+            if cache_key is not None:
+                self.response_cache.put(cache_key, text)
+
+        self.add_message("assistant", text)
         return text
+
+    def _stream_chunks(self):
+        """
+        Yields the text chunks of a streamed API response. Reports the time to the first token.
+        """
+        started = time.perf_counter()
+        first_token = True
+        for token in self.client.chat.completions.create(
+            model=self.model,
+            messages=self.chat_history,
+            temperature=self.temperature,
+            stream=True,
+        ):
+            # Preveri, ali atribut "content" obstaja in ni None
+            content = getattr(token.choices[0].delta, "content", None)
+            if content:
+                if first_token:
+                    self.instrumentation.observe("time_to_first_token", time.perf_counter() - started)
+                    first_token = False
+                yield content
+
+    @staticmethod
+    def _replay_chunks(answer):
+        """
+        Splits a cached answer into word sized chunks, like a streamed response.
+        """
+        yield from re.findall(r"\s*\S+\s*|\s+", answer)
+
+    def _render_stream(self, chunks):
+        """
+        Renders text chunks live in the console and shows the final answer in a panel.
+        If the console is not a terminal the text is written as it arrives.
+
+        Args:
+            chunks (iterable): Text chunks of the response.
+
+        Returns:
+            str: The full response text.
+        """
+        from xai_gpt_shap.StreamRenderer import StreamRenderer
+        return StreamRenderer(self.console).render(chunks)
     
-    def create_summary_and_message(self,shap_df, model, short_summary, choice_class, role):
+    @staticmethod
+    def _format_feature_lines(shap_df):
+        """
+        Formats every row of a SHAP DataFrame as a prompt line, without iterating over the rows.
+
+        Args:
+            shap_df (DataFrame): A DataFrame of SHAP values, a global importance DataFrame with a "Mean |SHAP|" column
+                                 or a class contrast DataFrame with "SHAP (<class>)" columns.
+
+        Returns:
+            ndarray: One "- Feature: SHAP=..., Value=..." line per row (with the 95% confidence interval and a flag
+                     for intervals that include zero if there is a "SHAP Std Error" column), one
+                     "- Feature: mean |SHAP|=..., mean SHAP=..., std=..., mean value=..." line for global importance
+                     or one "- Feature: Value=..., SHAP (<class>)=..., ..., difference=..." line for a class contrast.
+        """
+        features = shap_df["Feature"].astype(str).to_numpy(dtype=object)
+        if "Mean |SHAP|" in shap_df.columns:
+            def formatted(column):
+                return np.char.mod("%.4f", shap_df[column].to_numpy(dtype=float)).astype(object)
+
+            lines = (
+                "- " + features + ": mean |SHAP|=" + formatted("Mean |SHAP|")
+                + ", mean SHAP=" + formatted("SHAP Value") + ", std=" + formatted("SHAP Std")
+            )
+            for column in shap_df.columns:
+                if column.startswith("SHAP Q"):
+                    lines = lines + f", {column[len('SHAP '):]}=" + formatted(column)
+            return lines + ", mean value=" + np.char.mod("%.4g", shap_df["Feature Value"].to_numpy(dtype=float)).astype(object)
+
+        class_columns = [column for column in shap_df.columns if column.startswith("SHAP (")]
+        if class_columns:
+            lines = "- " + features + ": Value=" + shap_df["Feature Value"].astype(str).to_numpy(dtype=object)
+            for column in class_columns:
+                lines = lines + f", {column}=" + np.char.mod("%.4f", shap_df[column].to_numpy(dtype=float)).astype(object)
+            return lines + ", difference=" + np.char.mod("%.4f", shap_df["SHAP Value"].to_numpy(dtype=float)).astype(object)
+
+        shap_values = np.char.mod("%.4f", shap_df["SHAP Value"].to_numpy(dtype=float)).astype(object)
+        feature_values = shap_df["Feature Value"].astype(str).to_numpy(dtype=object)
+        if "SHAP Std Error" in shap_df.columns:
+            # Approximate SHAP values: show the 95% confidence interval and flag values whose sign is uncertain
+            margins = 1.96 * shap_df["SHAP Std Error"].to_numpy(dtype=float)
+            uncertain = np.where(
+                np.abs(shap_df["SHAP Value"].to_numpy(dtype=float)) < margins, " (uncertain: 95% CI includes zero)", ""
+            ).astype(object)
+            shap_values = shap_values + " ± " + np.char.mod("%.4f", margins).astype(object)
+            return "- " + features + ": SHAP=" + shap_values + ", Value=" + feature_values + uncertain
+        return "- " + features + ": SHAP=" + shap_values + ", Value=" + feature_values
+
+    @staticmethod
+    def _get_top_features(shap_values, k):
+        """
+        Finds the k largest and k smallest SHAP values with a single partition.
+
+        Args:
+            shap_values (ndarray): SHAP values.
+            k (int): Number of features per side.
+
+        Returns:
+            tuple: Positions of the largest values (descending) and of the smallest values (ascending).
+        """
+        n = len(shap_values)
+        k = min(k, n)
+        if 2 * k < n:
+            partitioned = np.argpartition(shap_values, (k - 1, n - k))
+            smallest, largest = partitioned[:k], partitioned[n - k:]
+        else:
+            smallest = largest = np.arange(n)
+        # Ties keep the original row order, like DataFrame.nlargest and nsmallest
+        largest = largest[np.lexsort((largest, -shap_values[largest]))][:k]
+        smallest = smallest[np.lexsort((smallest, shap_values[smallest]))][:k]
+        return largest, smallest
+
+    def create_summary_and_message(self,shap_df, model, short_summary, choice_class, role, token_budget=None, return_token_count=False):
         """
         Generates a GPT prompt based on SHAP results, model details, and role-specific requirements.
 
+        With a `token_budget`, the "Full SHAP Results" list contains the features with the largest absolute
+        SHAP values that fit into the budget, and the remaining features are combined into one "Other features" line.
+
+        A global importance DataFrame (from `ShapCalculator.calculate_global_importance`) gives a dataset-level
+        prompt instead, with features ranked by their mean absolute SHAP value. A class contrast DataFrame
+        (from `MultiClassShapResult.to_contrast_dataframe`) gives a prompt that explains why the first class
+        was preferred over the competing classes.
+
         Args:
-            shap_df (DataFrame): A DataFrame of SHAP values.
+            shap_df (DataFrame): A DataFrame of SHAP values, or a global importance DataFrame.
             model (str): The name of the model.
             short_summary (str): A summary of the prediction.
             choice_class (str): The target class.
             role (str): The role for the explanation (e.g., "beginner").
+            token_budget (int, optional): Maximum tokens of the prompt. If even the prompt without any listed
+                                          features is larger, all features are combined. By default all features are listed.
+            return_token_count (bool, optional): Whether to also return the prompt's token count. Defaults to False.
+
+        Returns:
+            str: The generated GPT prompt, or a tuple (prompt, token count) if `return_token_count` is True.
+
+        Raises:
+            ValueError: If `shap_df` is empty or `token_budget` is not positive.
+        """
+        if len(shap_df) == 0:
+            raise ValueError("shap_df must contain at least one feature.")
+        if token_budget is not None and token_budget <= 0:
+            raise ValueError("token_budget must be a positive integer.")
+
+        with self.instrumentation.span("prompt_building", features=len(shap_df)):
+            message = self._create_message(shap_df, model, short_summary, choice_class, role, token_budget)
+
+        if return_token_count:
+            return message, self.count_tokens(message)
+        return message
+
+    def _create_message(self, shap_df, model, short_summary, choice_class, role, token_budget):
+        """
+        Builds the prompt, see `create_summary_and_message`.
 
         Returns:
             str: The generated GPT prompt.
         """
-        summary = "\n".join(
-            [
-                f"- {row['Feature']}: SHAP={row['SHAP Value']:.4f}, Value={row['Feature Value']}"
-                for _, row in shap_df.iterrows()
-            ]
-        )
-        
-        top_positive = shap_df.nlargest(3, "SHAP Value")
-        top_negative = shap_df.nsmallest(3, "SHAP Value")
-        
-        top_positive_summary = "\n".join(
-            [
-                f"- {row['Feature']}: SHAP={row['SHAP Value']:.4f}, Value={row['Feature Value']}"
-                for _, row in top_positive.iterrows()
-            ]
-        )
-        
-        top_negative_summary = "\n".join(
-            [
-                f"- {row['Feature']}: SHAP={row['SHAP Value']:.4f}, Value={row['Feature Value']}"
-                for _, row in top_negative.iterrows()
-            ]
-        )
+        lines = self._format_feature_lines(shap_df)
+        shap_values = shap_df["SHAP Value"].to_numpy(dtype=float)
+        feature_names = shap_df["Feature"].to_numpy(dtype=object)
+        is_global = "Mean |SHAP|" in shap_df.columns
+        importance = shap_df["Mean |SHAP|"].to_numpy(dtype=float) if is_global else np.abs(shap_values)
+
+        positive_index, negative_index = self._get_top_features(shap_values, self.TOP_FEATURES)
+        top_positive_summary = "\n".join(lines[positive_index])
+        top_negative_summary = "\n".join(lines[negative_index])
+        top_positive_feature = feature_names[positive_index[0]]
+        top_negative_feature = feature_names[negative_index[0]]
+
+        class_columns = [column for column in shap_df.columns if column.startswith("SHAP (")]
+
+        if class_columns:
+            classes = [column[len("SHAP ("):-1] for column in class_columns]
+            scores = shap_df.attrs.get("scores")
+            output = shap_df.attrs.get("output", "probability")
+
+            def build_message(summary):
+                return self._build_contrast_prompt(
+                    role, model, short_summary, summary, classes, scores, output,
+                    top_positive_feature, top_negative_feature, top_positive_summary, top_negative_summary,
+                )
+        elif is_global:
+            instances = shap_df.attrs.get("instances")
+            top_important = np.argsort(-importance, kind="stable")[:self.TOP_FEATURES]
+            top_important_summary = "\n".join(lines[top_important])
+
+            def build_message(summary):
+                return self._build_global_prompt(
+                    role, model, short_summary, choice_class, summary, instances,
+                    top_positive_feature, top_negative_feature, top_important_summary,
+                )
+        else:
+            output = shap_df.attrs.get("output", "probability")
+
+            def build_message(summary):
+                return self._build_prompt(
+                    role, model, short_summary, choice_class, summary,
+                    top_positive_feature, top_negative_feature, top_positive_summary, top_negative_summary, output,
+                )
+
+        if token_budget is None:
+            return build_message("\n".join(lines))
+        return self._build_budgeted_message(build_message, lines, shap_values, importance, token_budget)
+
+    def _build_budgeted_message(self, build_message, lines, shap_values, importance, token_budget):
+        """
+        Builds the prompt with as many features, by descending importance, as fit into the token budget.
 
+        Args:
+            build_message (callable): Builds the prompt from the "Full SHAP Results" text.
+            lines (ndarray): Formatted feature lines.
+            shap_values (ndarray): SHAP values of the features.
+            importance (ndarray): Importance of the features, the absolute (or mean absolute) SHAP values.
+            token_budget (int): Maximum tokens of the prompt.
+
+        Returns:
+            str: The generated GPT prompt.
+        """
+        order = np.argsort(-importance, kind="stable")
+        ordered_lines = lines[order]
+
+        def other_features_line(count):
+            if count == 0:
+                return None
+            rest = order[len(order) - count:]
+            return (
+                f"- Other features ({count}): combined SHAP={shap_values[rest].sum():.4f}, "
+                f"mean |SHAP|={importance[rest].mean():.4f}"
+            )
+
+        def summary_for(included):
+            summary_lines = list(ordered_lines[:included])
+            other_line = other_features_line(len(order) - included)
+            if other_line is not None:
+                summary_lines.append(other_line)
+            return "\n".join(summary_lines)
+
+        # Estimate how many lines fit from the per-line token counts, then correct with the exact count
+        fixed_tokens = self.count_tokens(build_message(summary_for(0)))
+        line_tokens = np.cumsum([self.count_tokens(line + "\n") for line in ordered_lines])
+        included = int(np.searchsorted(line_tokens, token_budget - fixed_tokens, side="right"))
+
+        message = build_message(summary_for(included))
+        while included > 0 and self.count_tokens(message) > token_budget:
+            included -= 1
+            message = build_message(summary_for(included))
+        while included < len(order):
+            candidate = build_message(summary_for(included + 1))
+            if self.count_tokens(candidate) > token_budget:
+                break
+            included += 1
+            message = candidate
+        return message
+
+    def _build_prompt(self, role, model, short_summary, choice_class, summary,
+                      top_positive_feature, top_negative_feature, top_positive_summary, top_negative_summary,
+                      output="probability"):
+        """
+        Fills the role-specific prompt template. SHAP values in log-odds space (`output` "log_odds",
+        e.g. from the linear explainer) are pointed out, so they are not read as probabilities.
+
+        Returns:
+            str: The generated GPT prompt.
+        """
         # Prompt bassed on role
         if role == "beginner":
             message = f"""
@@ -310,8 +935,8 @@ class ChatGptClient:
             Focus only on the most important features and their effects. Avoid using numbers.
 
             Key Insights:
-            The most important positive feature is {top_positive.iloc[0]['Feature']}.
-            The most important negative feature is {top_negative.iloc[0]['Feature']}.
+            The most important positive feature is {top_positive_feature}.
+            The most important negative feature is {top_negative_feature}.
 
             Full SHAP Results:
             {summary}
@@ -325,8 +950,8 @@ class ChatGptClient:
             Focus on the most important features and their contributions without technical details.
 
             Key Insights:
-            Positive: {top_positive.iloc[0]['Feature']} (positive impact).
-            Negative: {top_negative.iloc[0]['Feature']} (negative impact).
+            Positive: {top_positive_feature} (positive impact).
+            Negative: {top_negative_feature} (negative impact).
 
             Full SHAP Results:
             {summary}
@@ -355,7 +980,150 @@ class ChatGptClient:
 
             Use clear and concise language based on the expertise level selected earlier.
             """
-        
+
+        if output == "log_odds":
+            message += """
+            Note: The SHAP values are in log-odds units, not probabilities. They add up to the difference
+            between the log-odds score of this prediction and the average log-odds score.
+            """
+        return message
+
+    def _build_global_prompt(self, role, model, short_summary, choice_class, summary, instances,
+                             top_positive_feature, top_negative_feature, top_important_summary):
+        """
+        Fills the role-specific prompt template of a dataset-level (global importance) explanation.
+
+        Returns:
+            str: The generated GPT prompt.
+        """
+        dataset = f"{instances} instances" if instances else "many instances"
+        if role == "beginner":
+            message = f"""
+            Imagine you are explaining SHAP values to a beginner. 
+            The model predicts: {short_summary}. 
+            The SHAP values were averaged over {dataset}, so they describe the model as a whole, not a single prediction.
+            Focus only on the most important features and their effects. Avoid using numbers.
+
+            Key Insights:
+            The feature that raises the predictions most on average is {top_positive_feature}.
+            The feature that lowers the predictions most on average is {top_negative_feature}.
+
+            Global SHAP Results:
+            {summary}
+
+
+            Explain in simple terms what the model relies on.
+            """
+        elif role == "executive_summary":
+            message = f"""
+            Provide a concise summary of what drives the model's predictions: {short_summary}.
+            The SHAP values were averaged over {dataset}.
+            Focus on the most important features and their contributions without technical details.
+
+            Key Insights:
+            Positive on average: {top_positive_feature}.
+            Negative on average: {top_negative_feature}.
+
+            Global SHAP Results:
+            {summary}
+
+            """
+        else:  # Default for other roles
+            message = f"""
+            I have a global explanation based on SHAP values aggregated over {dataset}. 
+            The model used is {model}, and it predicts: {short_summary}. 
+            Below are the aggregated SHAP values for the {choice_class} class. For every feature, mean |SHAP| is its
+            overall importance, mean SHAP its average direction and std how much its effect varies between instances:
+
+            Global SHAP Results:
+            {summary}
+
+            Key Insights:
+            The top 3 most important features are:
+            {top_important_summary}
+
+            Please analyze the global SHAP results and explain:
+            1. Which features the model relies on most and in which direction they push the predictions.
+            2. Which features have effects that vary strongly between instances.
+            3. Any potential insights or counterintuitive results.
+
+            Use clear and concise language based on the expertise level selected earlier.
+            """
+
+        return message
+
+    def _build_contrast_prompt(self, role, model, short_summary, summary, classes, scores, output,
+                               top_positive_feature, top_negative_feature, top_positive_summary, top_negative_summary):
+        """
+        Fills the role-specific prompt template that contrasts the predicted class with its competitors.
+
+        Returns:
+            str: The generated GPT prompt.
+        """
+        winner, runner_up = classes[0], classes[1]
+        score_name = "probability" if output == "probability" else "log-odds score"
+        if scores:
+            ranking = ", ".join(f"{name} ({score_name} {score:.3f})" for name, score in zip(classes, scores))
+        else:
+            ranking = ", ".join(classes)
+
+        if role == "beginner":
+            message = f"""
+            Imagine you are explaining SHAP values to a beginner. 
+            The model predicts: {short_summary}. 
+            It chose the class {winner} over {runner_up}. The competing classes were: {ranking}.
+            Focus only on the features that made the difference. Avoid using numbers.
+
+            Key Insights:
+            The feature that favoured {winner} the most is {top_positive_feature}.
+            The feature that favoured {runner_up} the most is {top_negative_feature}.
+
+            SHAP Results per Class:
+            {summary}
+
+
+            Explain in simple terms why the model chose {winner} and not {runner_up}.
+            """
+        elif role == "executive_summary":
+            message = f"""
+            Provide a concise summary of why the model chose {winner} over {runner_up} for the prediction: {short_summary}.
+            The competing classes were: {ranking}.
+            Focus on the features that decided between the classes without technical details.
+
+            Key Insights:
+            For {winner}: {top_positive_feature}.
+            For {runner_up}: {top_negative_feature}.
+
+            SHAP Results per Class:
+            {summary}
+
+            """
+        else:  # Default for other roles
+            message = f"""
+            I have an explanation based on SHAP values for a single instance, compared across the competing classes. 
+            The model used is {model}, and it predicts: {short_summary}. 
+            The classes with the highest scores were: {ranking}.
+            Below are the SHAP values of every feature for each class. The difference is the SHAP value for
+            {winner} minus the SHAP value for {runner_up}, positive differences favour {winner}:
+
+            SHAP Results per Class:
+            {summary}
+
+            Key Insights:
+            The top 3 features favouring {winner} over {runner_up} are:
+            {top_positive_summary}
+
+            The top 3 features favouring {runner_up} over {winner} are:
+            {top_negative_summary}
+
+            Please analyze the SHAP results and explain:
+            1. Why the model preferred {winner} over {runner_up}.
+            2. Which features would have to change for the prediction to switch to {runner_up}.
+            3. Any potential insights or counterintuitive results.
+
+            Use clear and concise language based on the expertise level selected earlier.
+            """
+
         return message
 
     def choose_system_role_interactive(self):
@@ -0,0 +1,208 @@
+import os
+import time
+import sqlite3
+import threading
+
+
+class ChatSessionStore:
+    """
+    An append-only log of chat histories stored in a SQLite database, keyed by session id.
+
+    Every change of a chat history is appended as one entry: an "insert" of a message (with its role,
+    content, token count and the model the tokens were counted for) at a position, or a "delete" of
+    consecutive messages, e.g. when the history is trimmed. Entries are never updated, so writing a message
+    costs one small insert. A session is resumed by replaying its entries, which needs only the positions
+    and token counts; the content is read afterwards, and only for the messages that are kept. The database
+    runs in WAL mode, so many sessions can be written by several processes at the same time.
+
+    Example:
+        store = ChatSessionStore("chat_sessions.sqlite")
+        client = ChatGptClient(api_key)
+        if not client.resume_session(store, "user-42"):
+            client.send_initial_prompt(message)
+
+    Attributes:
+        path (str): Path to the SQLite database.
+    """
+
+    DEFAULT_PATH = "chat_sessions.sqlite" # Database used when no path is given
+    BUSY_TIMEOUT = 30 # Seconds to wait for other processes holding a write lock
+
+    def __init__(self, path=DEFAULT_PATH):
+        """
+        Initializes the ChatSessionStore class and creates the database if needed.
+
+        Args:
+            path (str, optional): Path to the SQLite database file.
+        """
+        self.path = path
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        with connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS chat_log (
+                    session_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    op TEXT NOT NULL,
+                    position INTEGER,
+                    count INTEGER,
+                    role TEXT,
+                    content TEXT,
+                    tokens INTEGER,
+                    model TEXT,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (session_id, seq)
+                )
+            """)
+
+    def _connect(self):
+        """
+        Returns the SQLite connection of the current thread and process.
+
+        Returns:
+            sqlite3.Connection: An open connection.
+        """
+        # Connections must not be shared between threads or inherited by forked processes
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.BUSY_TIMEOUT, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _append(self, session_id, op, position=None, count=None, role=None, content=None, tokens=None, model=None):
+        """
+        Appends one entry to the log of a session.
+
+        Returns:
+            int: Sequence number of the entry.
+        """
+        connection = self._connect()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            (seq,) = connection.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM chat_log WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            connection.execute(
+                "INSERT INTO chat_log (session_id, seq, op, position, count, role, content, tokens, model, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, seq, op, position, count, role, content, tokens, model, time.time()),
+            )
+        return seq
+
+    def append_message(self, session_id, role, content, tokens, model, position=None):
+        """
+        Logs a message added to a chat history.
+
+        Args:
+            session_id (str): The session.
+            role (str): Role of the message author ("system", "user" or "assistant").
+            content (str): The message text.
+            tokens (int): Token count of the message.
+            model (str): Model the tokens were counted for.
+            position (int, optional): Position the message was inserted at. By default it was appended.
+
+        Returns:
+            int: Sequence number of the entry.
+        """
+        return self._append(session_id, "insert", position=position, role=role, content=content, tokens=tokens, model=model)
+
+    def delete_messages(self, session_id, position, count):
+        """
+        Logs that consecutive messages were removed from a chat history.
+
+        Args:
+            session_id (str): The session.
+            position (int): Position of the first removed message.
+            count (int): Number of removed messages.
+
+        Returns:
+            int: Sequence number of the entry.
+        """
+        return self._append(session_id, "delete", position=position, count=count)
+
+    def load_headers(self, session_id):
+        """
+        Replays the log of a session without reading the message texts.
+
+        Args:
+            session_id (str): The session.
+
+        Returns:
+            list: One dict with "seq", "role", "tokens" and "model" per message of the current history, in order.
+        """
+        headers = []
+        rows = self._connect().execute(
+            "SELECT seq, op, position, count, role, tokens, model FROM chat_log WHERE session_id = ? ORDER BY seq",
+            (session_id,),
+        )
+        for seq, op, position, count, role, tokens, model in rows:
+            if op == "insert":
+                header = {"seq": seq, "role": role, "tokens": tokens, "model": model}
+                if position is None:
+                    headers.append(header)
+                else:
+                    headers.insert(position, header)
+            elif op == "delete":
+                del headers[position:position + count]
+            else:
+                raise ValueError(f"Unknown operation {op!r} in the log of session {session_id}.")
+        return headers
+
+    def load_contents(self, session_id, seqs):
+        """
+        Reads the texts of logged messages.
+
+        Args:
+            session_id (str): The session.
+            seqs (list): Sequence numbers of the messages.
+
+        Returns:
+            dict: Maps each sequence number to the message text.
+        """
+        contents = {}
+        connection = self._connect()
+        seqs = list(seqs)
+        # Stay below SQLite's limit on the number of query parameters
+        for start in range(0, len(seqs), 500):
+            chunk = seqs[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            query = f"SELECT seq, content FROM chat_log WHERE session_id = ? AND seq IN ({placeholders})"
+            contents.update(connection.execute(query, [session_id, *chunk]))
+        return contents
+
+    def has_session(self, session_id):
+        """
+        Args:
+            session_id (str): The session.
+
+        Returns:
+            bool: Whether anything was logged for the session.
+        """
+        query = "SELECT 1 FROM chat_log WHERE session_id = ? LIMIT 1"
+        return self._connect().execute(query, (session_id,)).fetchone() is not None
+
+    def get_session_ids(self):
+        """
+        Returns:
+            list: Ids of all logged sessions, most recently used first.
+        """
+        query = "SELECT session_id FROM chat_log GROUP BY session_id ORDER BY MAX(created_at) DESC"
+        return [session_id for (session_id,) in self._connect().execute(query)]
+
+    def delete_session(self, session_id):
+        """
+        Removes the whole log of a session.
+
+        Args:
+            session_id (str): The session.
+        """
+        connection = self._connect()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("DELETE FROM chat_log WHERE session_id = ?", (session_id,))
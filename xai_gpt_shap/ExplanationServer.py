@@ -0,0 +1,588 @@
+import os
+import json
+import time
+import queue
+import asyncio
+import argparse
+import threading
+import socketserver
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+import pandas as pd
+from xai_gpt_shap.ShapCalculator import ShapCalculator
+from xai_gpt_shap.instrumentation import PrometheusExporter
+
+
+class ServerBusyError(Exception):
+    """
+    Raised when the request queue of a model is full.
+    """
+
+
+class UnknownModelError(Exception):
+    """
+    Raised when a request names a model that is not loaded.
+    """
+
+
+class ExplanationTimeoutError(Exception):
+    """
+    Raised when the SHAP values or the GPT explanations of a request are not ready in time.
+    """
+
+
+class MicroBatcher:
+    """
+    Groups concurrent explain requests for one warm `ShapCalculator` into micro-batches.
+
+    A worker thread takes the first waiting request and then collects more requests until the batch has
+    `max_batch_size` rows or `max_wait` seconds have passed. The batch is explained with a single
+    `calculate_shap_values_for_batch` call and the results are split back to the requests. Only the worker
+    thread uses the calculator, so it does not need to be thread-safe.
+
+    Example:
+        batcher = MicroBatcher(calculator, max_batch_size=64, max_wait=0.005)
+        future = batcher.submit(instances)
+        shap_values, base_values, error_std = future.result()
+    """
+
+    MAX_BATCH_SIZE = 64 # Maximum rows explained in one explainer call
+    MAX_WAIT = 0.005 # Seconds to wait for more requests after the first one
+    MAX_QUEUE_SIZE = 256 # Requests that may wait, more are rejected with ServerBusyError
+    _STOP = object() # Queued by `close` to stop the worker
+
+    def __init__(self, calculator, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_WAIT, max_queue_size=MAX_QUEUE_SIZE):
+        """
+        Initializes the batcher and starts its worker thread.
+
+        Args:
+            calculator (ShapCalculator): Calculator with the model, data and target class set.
+            max_batch_size (int, optional): Maximum rows explained in one explainer call. A single larger
+                                            request is still explained in one call.
+            max_wait (float, optional): Seconds to wait for more requests after the first one of a batch.
+            max_queue_size (int, optional): Requests that may wait, more are rejected.
+
+        Raises:
+            ValueError: If `max_batch_size` or `max_queue_size` is not a positive integer or `max_wait` is negative.
+        """
+        if not isinstance(max_batch_size, int) or max_batch_size <= 0:
+            raise ValueError("max_batch_size must be a positive integer.")
+        if not isinstance(max_queue_size, int) or max_queue_size <= 0:
+            raise ValueError("max_queue_size must be a positive integer.")
+        if max_wait < 0:
+            raise ValueError("max_wait must not be negative.")
+        self.calculator = calculator
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue(max_queue_size)
+        self._pending = []
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "rows": 0, "batches": 0, "rejected": 0, "errors": 0, "batch_seconds": 0.0}
+        # Build the explainer now, so the first request does not pay for it
+        calculator.get_explainer()
+        self._thread = threading.Thread(target=self._run, name="MicroBatcher", daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_size(self):
+        """
+        int: Number of waiting requests.
+        """
+        return self._queue.qsize()
+
+    def submit(self, instances):
+        """
+        Queues instances for explanation.
+
+        Args:
+            instances (DataFrame): Instances with the calculator's feature columns.
+
+        Returns:
+            Future: Resolves to a tuple of the SHAP values (ndarray, one row per instance), the base values and
+                    the standard errors of the SHAP values (None unless the explainer is approximate).
+
+        Raises:
+            ServerBusyError: If the queue is full.
+        """
+        future = Future()
+        try:
+            self._queue.put_nowait((instances, future))
+        except queue.Full:
+            with self._lock:
+                self.stats["rejected"] += 1
+            raise ServerBusyError("The explanation queue is full, try again later.")
+        return future
+
+    def close(self):
+        """
+        Stops the worker thread after the waiting requests are explained.
+        """
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            request = self._pending.pop() if self._pending else self._queue.get()
+            if request is self._STOP:
+                return
+            batch = [request]
+            rows = len(request[0])
+            deadline = time.monotonic() + self.max_wait
+
+            while rows < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is self._STOP or rows + len(request[0]) > self.max_batch_size:
+                    # Explained with the next batch, or stops the worker after this batch
+                    self._pending.append(request)
+                    break
+                batch.append(request)
+                rows += len(request[0])
+
+            self._explain_batch(batch)
+
+    def _explain_batch(self, batch):
+        # Requests whose clients stopped waiting are cancelled and not explained
+        batch = [(instances, future) for instances, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            instances = pd.concat([instances for instances, _ in batch], ignore_index=True)
+            _, explanation = self.calculator.calculate_shap_values_for_batch(instances, chunk_size=max(len(instances), 1))
+        except Exception as e:
+            with self._lock:
+                self.stats["errors"] += len(batch)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for instances, future in batch:
+            end = offset + len(instances)
+            error_std = None if explanation.error_std is None else explanation.error_std[offset:end]
+            future.set_result((explanation.values[offset:end], explanation.base_values[offset:end], error_std))
+            offset = end
+        with self._lock:
+            self.stats["requests"] += len(batch)
+            self.stats["rows"] += offset
+            self.stats["batches"] += 1
+            self.stats["batch_seconds"] += time.perf_counter() - started
+
+
+class ExplanationServer:
+    """
+    A long-running HTTP service that keeps models and explainers warm and explains instances on request.
+
+    Every model has its own `ShapCalculator` and `MicroBatcher`, so concurrent requests are grouped into
+    micro-batches. Optionally, a GPT explanation is generated for every explained instance.
+
+    Endpoints:
+        POST /explain: {"instances": [{feature: value, ...}, ...], "model": name, "explain": bool, "role": str}.
+                       Returns the SHAP values of every instance. Answers 404 for an unknown model,
+                       503 if the queue is full and 504 if the request is not answered within `request_timeout`.
+        GET /health: Status, loaded models and queue sizes as JSON.
+        GET /metrics: Request, batch and stage metrics in the Prometheus text format.
+
+    Example:
+        server = ExplanationServer({"income": calculator}, port=8080)
+        server.serve_forever()
+    """
+
+    DEFAULT_HOST = "127.0.0.1"
+    DEFAULT_PORT = 8080
+    RETRY_AFTER = 1 # Seconds suggested to clients that were rejected because of a full queue
+    REQUEST_TIMEOUT = 30 # Seconds a request waits for its SHAP values, and again for its GPT explanations
+
+    def __init__(self, calculators, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_socket=None,
+                 max_batch_size=MicroBatcher.MAX_BATCH_SIZE, max_wait=MicroBatcher.MAX_WAIT,
+                 max_queue_size=MicroBatcher.MAX_QUEUE_SIZE, gpt_client=None, llm_client=None, role="analyst",
+                 model_name="model", short_summary="", choice_class="", request_timeout=REQUEST_TIMEOUT):
+        """
+        Initializes the server and warms up the explainers.
+
+        Args:
+            calculators (dict): Model names mapped to `ShapCalculator` instances with the model, data and target class set.
+                                The first model is used for requests that do not name one.
+            host (str, optional): Host of the HTTP server.
+            port (int, optional): Port of the HTTP server, 0 selects a free port.
+            unix_socket (str, optional): Path of a Unix socket to listen on instead of `host` and `port`.
+            max_batch_size (int, optional): Maximum rows explained in one explainer call.
+            max_wait (float, optional): Seconds to wait for more requests after the first one of a batch.
+            max_queue_size (int, optional): Requests that may wait per model, more are answered with 503.
+            gpt_client (ChatGptClient, optional): Client used to build the GPT prompts.
+            llm_client (AsyncChatGptClient, optional): Client that generates GPT explanations. Without it,
+                                                       requests asking for an explanation are rejected.
+            role (str, optional): Default role of the GPT explanations.
+            model_name (str, optional): Model description used in the prompts.
+            short_summary (str, optional): Summary of what the model predicts, used in the prompts.
+            choice_class (str, optional): Name of the target class, used in the prompts.
+            request_timeout (float, optional): Seconds a request waits for its SHAP values, and again for its
+                                               GPT explanations, before it is answered with 504.
+
+        Raises:
+            ValueError: If no calculator is given or `llm_client` is given without `gpt_client`.
+        """
+        if not calculators:
+            raise ValueError("At least one ShapCalculator is required.")
+        if llm_client is not None and gpt_client is None:
+            raise ValueError("gpt_client is required to build the prompts for llm_client.")
+        self.calculators = dict(calculators)
+        self.default_model = next(iter(self.calculators))
+        self.batchers = {
+            name: MicroBatcher(calculator, max_batch_size, max_wait, max_queue_size)
+            for name, calculator in self.calculators.items()
+        }
+        self.gpt_client = gpt_client
+        self.llm_client = llm_client
+        self.role = role
+        self.model_name = model_name
+        self.short_summary = short_summary
+        self.choice_class = choice_class
+        self.request_timeout = request_timeout
+        self.started = time.time()
+
+        self._loop = None
+        if llm_client is not None:
+            # One event loop serves the GPT requests of all HTTP threads
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._loop.run_forever, name="ExplanationServerLLM", daemon=True).start()
+
+        handler = self._create_handler()
+        self.unix_socket = unix_socket
+        if unix_socket is not None:
+            if os.path.exists(unix_socket):
+                os.remove(unix_socket)
+            self._server = _ThreadingUnixHTTPServer(unix_socket, handler)
+        else:
+            self._server = ThreadingHTTPServer((host, port), handler)
+            self._server.daemon_threads = True
+
+    @property
+    def address(self):
+        """
+        The address the server listens on: (host, port) or the Unix socket path.
+        """
+        return self._server.server_address
+
+    def serve_forever(self):
+        """
+        Serves requests until `shutdown` is called.
+        """
+        self._server.serve_forever()
+
+    def start(self):
+        """
+        Serves requests in a background thread.
+
+        Returns:
+            ExplanationServer: The server.
+        """
+        threading.Thread(target=self.serve_forever, name="ExplanationServer", daemon=True).start()
+        return self
+
+    def shutdown(self):
+        """
+        Stops the server and the batchers.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        for batcher in self.batchers.values():
+            batcher.close()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self.unix_socket is not None and os.path.exists(self.unix_socket):
+            os.remove(self.unix_socket)
+
+    def explain(self, payload):
+        """
+        Explains the instances of a request.
+
+        Args:
+            payload (dict): The decoded request, see the class documentation.
+
+        Returns:
+            dict: The model name and one result per instance with "base_value", "shap_values",
+                  "shap_std_errors" (approximate explainer only) and, if requested, "explanation" and "error".
+
+        Raises:
+            ValueError: If the request is invalid.
+            UnknownModelError: If the model is unknown.
+            ServerBusyError: If the model's queue is full.
+            ExplanationTimeoutError: If the SHAP values or the GPT explanations are not ready within `request_timeout`.
+        """
+        model = payload.get("model") or self.default_model
+        if model not in self.batchers:
+            raise UnknownModelError(f"Unknown model: {model}")
+        records = payload.get("instances")
+        if records is None and "instance" in payload:
+            records = [payload["instance"]]
+        if not isinstance(records, list) or not records or not all(isinstance(record, dict) for record in records):
+            raise ValueError('"instances" must be a non-empty list of objects mapping feature names to values.')
+        explain = bool(payload.get("explain"))
+        if explain and self.llm_client is None:
+            raise ValueError("GPT explanations are not enabled on this server.")
+
+        calculator = self.calculators[model]
+        feature_names = list(calculator.data.columns)
+        for position, record in enumerate(records):
+            missing = [name for name in feature_names if name not in record]
+            if missing:
+                raise ValueError(f"Instance {position} is missing features: {', '.join(missing)}")
+        try:
+            instances = pd.DataFrame.from_records(records, columns=feature_names).astype(calculator.data.dtypes.to_dict())
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid feature values: {e}")
+
+        future = self.batchers[model].submit(instances)
+        try:
+            shap_values, base_values, error_std = future.result(timeout=self.request_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise ExplanationTimeoutError(f"The SHAP values were not calculated within {self.request_timeout} seconds.")
+
+        results = [
+            {"base_value": float(base_value), "shap_values": dict(zip(feature_names, values.tolist()))}
+            for values, base_value in zip(shap_values, base_values)
+        ]
+        if error_std is not None:
+            for result, errors in zip(results, error_std):
+                result["shap_std_errors"] = dict(zip(feature_names, errors.tolist()))
+        if explain:
+            self._add_explanations(results, feature_names, shap_values, error_std, instances, payload.get("role") or self.role)
+        return {"model": model, "results": results}
+
+    def _add_explanations(self, results, feature_names, shap_values, error_std, instances, role):
+        prompts = []
+        for position, values in enumerate(shap_values):
+            shap_df = pd.DataFrame({"Feature": feature_names, "SHAP Value": values, "Feature Value": instances.iloc[position].values})
+            if error_std is not None:
+                shap_df["SHAP Std Error"] = error_std[position]
+            prompts.append(self.gpt_client.create_summary_and_message(
+                shap_df, self.model_name, self.short_summary, self.choice_class, role,
+            ))
+        future = asyncio.run_coroutine_threadsafe(self.llm_client.explain_many(prompts, role=role), self._loop)
+        try:
+            answers = future.result(timeout=self.request_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise ExplanationTimeoutError(f"The GPT explanations were not generated within {self.request_timeout} seconds.")
+        for result, answer in zip(results, answers):
+            result["explanation"] = answer["answer"]
+            result["error"] = answer["error"]
+
+    def get_health(self):
+        """
+        Returns:
+            dict: Server status, uptime, loaded models and their queue sizes.
+        """
+        return {
+            "status": "ok",
+            "uptime": time.time() - self.started,
+            "models": {
+                name: {"queue_size": batcher.queue_size, "explainer_engine": self.calculators[name].explainer_engine}
+                for name, batcher in self.batchers.items()
+            },
+        }
+
+    def get_metrics(self):
+        """
+        Returns:
+            str: Batching statistics per model and the instrumentation metrics in the Prometheus text format.
+        """
+        lines = []
+        for stat in ("requests", "rows", "batches", "rejected", "errors"):
+            name = f"{PrometheusExporter.PREFIX}_server_{stat}_total"
+            lines.append(f"# TYPE {name} counter")
+            for model, batcher in self.batchers.items():
+                lines.append(f'{name}{{model="{model}"}} {batcher.stats[stat]}')
+        name = f"{PrometheusExporter.PREFIX}_server_queue_size"
+        lines.append(f"# TYPE {name} gauge")
+        for model, batcher in self.batchers.items():
+            lines.append(f'{name}{{model="{model}"}} {batcher.queue_size}')
+        memoized = {model: calculator.memoized_predictor for model, calculator in self.calculators.items()
+                    if calculator.memoized_predictor is not None}
+        if memoized:
+            name = f"{PrometheusExporter.PREFIX}_server_prediction_dedup_ratio"
+            lines.append(f"# TYPE {name} gauge")
+            for model, predictor in memoized.items():
+                lines.append(f'{name}{{model="{model}"}} {predictor.get_stats()["dedup_ratio"]}')
+
+        text = "\n".join(lines) + "\n"
+        instrumentation = next(iter(self.calculators.values())).instrumentation
+        if instrumentation.enabled:
+            text += PrometheusExporter.render(instrumentation.get_metrics())
+        return text
+
+    def _create_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path == "/health":
+                    self._send_json(200, server.get_health())
+                elif path == "/metrics":
+                    self._send(200, server.get_metrics().encode("utf-8"), "text/plain; version=0.0.4")
+                else:
+                    self._send_json(404, {"error": f"Unknown path: {path}"})
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                if path != "/explain":
+                    self._send_json(404, {"error": f"Unknown path: {path}"})
+                    return
+                try:
+                    payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                    if not isinstance(payload, dict):
+                        raise ValueError("The request body must be a JSON object.")
+                    self._send_json(200, server.explain(payload))
+                except ServerBusyError as e:
+                    self._send_json(503, {"error": str(e)}, {"Retry-After": str(server.RETRY_AFTER)})
+                except ExplanationTimeoutError as e:
+                    self._send_json(504, {"error": str(e)})
+                except UnknownModelError as e:
+                    self._send_json(404, {"error": str(e)})
+                except ValueError as e:
+                    self._send_json(400, {"error": str(e)})
+                except Exception as e:
+                    self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+            def _send_json(self, status, payload, headers=None):
+                self._send(status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+            def _send(self, status, body, content_type, headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ("unix", 0)
+
+
+def parse_arguments(argv=None):
+    """
+    Reads the server arguments from the command line.
+    """
+    parser = argparse.ArgumentParser(description="Serve SHAP explanations over HTTP with warm models and micro-batching.")
+    parser.add_argument("--model_path", required=True, action="append",
+                        help="Path to a model, optionally named as NAME=PATH. Can be given several times.")
+    parser.add_argument("--data_path", required=True, help="Path to the dataset (e.g., shap_dataset.csv)")
+    parser.add_argument("--target_class", type=int, required=True, help="Target class for SHAP analysis (e.g., 1)")
+    parser.add_argument("--explainer_type", default="auto", choices=ShapCalculator.EXPLAINER_TYPES, help="Explainer to use")
+    parser.add_argument("--max_evals", type=int, required=False, help="Approximate SHAP values with at most this many model evaluations per instance")
+    parser.add_argument("--deadline_ms", type=float, required=False, help="Approximate SHAP values within this many milliseconds per instance")
+    parser.add_argument("--tol", type=float, required=False, help="Approximate SHAP values until their standard errors are below this value")
+    parser.add_argument("--memoize_predictions", required=False, action="store_true", help="Evaluate repeated masked rows only once (helps with expensive models)")
+    parser.add_argument("--host", default=ExplanationServer.DEFAULT_HOST, help="Host to listen on")
+    parser.add_argument("--port", type=int, default=ExplanationServer.DEFAULT_PORT, help="Port to listen on")
+    parser.add_argument("--unix_socket", required=False, help="Listen on this Unix socket instead of host and port")
+    parser.add_argument("--max_batch_size", type=int, default=MicroBatcher.MAX_BATCH_SIZE, help="Maximum rows per explainer call")
+    parser.add_argument("--max_wait_ms", type=float, default=MicroBatcher.MAX_WAIT * 1000, help="Milliseconds to wait for more requests")
+    parser.add_argument("--max_queue_size", type=int, default=MicroBatcher.MAX_QUEUE_SIZE, help="Waiting requests per model before answering 503")
+    parser.add_argument("--request_timeout", type=float, default=ExplanationServer.REQUEST_TIMEOUT, help="Seconds to wait for SHAP values and GPT explanations before answering 504")
+    parser.add_argument("--api_key", required=False, help="API key for OpenAI, enables GPT explanations")
+    parser.add_argument("--role", default="analyst", help="Default role of the GPT explanations")
+    parser.add_argument("--model_name", default="model", help="Model description used in the GPT prompts (e.g., XGBoost)")
+    parser.add_argument("--short_summary", default="", help="Summary of what the model predicts, used in the GPT prompts")
+    parser.add_argument("--choice_class", default="", help="Name of the target class, used in the GPT prompts")
+    return parser.parse_args(argv)
+
+
+def parse_model_spec(spec):
+    """
+    Splits a --model_path value into the model name and the model path.
+
+    The value is NAME=PATH or just PATH. The part before the first "=" is only used as the name if it contains
+    no path separator and the whole value is not an existing file, so paths that contain "=" keep working.
+
+    Args:
+        spec (str): The --model_path value.
+
+    Returns:
+        Tuple: The model name (the file name without extension if none is given) and the model path.
+    """
+    name, separator, path = spec.partition("=")
+    separators = {"/", os.sep} | ({os.altsep} if os.altsep else set())
+    if not separator or not name or any(character in name for character in separators) or os.path.exists(spec):
+        name, path = "", spec
+    return name or os.path.splitext(os.path.basename(path))[0], path
+
+
+def main(argv=None):
+    """
+    Loads the models and serves explanations until interrupted.
+    """
+    args = parse_arguments(argv)
+
+    calculators = {}
+    for model in args.model_path:
+        name, path = parse_model_spec(model)
+        calculator = ShapCalculator(target_class=args.target_class, explainer_type=args.explainer_type)
+        if args.max_evals is not None or args.deadline_ms is not None or args.tol is not None:
+            calculator.set_explainer_type("approximate")
+            calculator.set_explainer_options(
+                max_evals=args.max_evals, deadline=args.deadline_ms / 1000 if args.deadline_ms else None, tol=args.tol,
+            )
+        if args.memoize_predictions:
+            calculator.set_prediction_memoization()
+        calculator.load_model(path)
+        calculator.load_data(args.data_path)
+        calculators[name] = calculator
+
+    gpt_client = None
+    llm_client = None
+    if args.api_key:
+        from xai_gpt_shap.ChatGptClient import ChatGptClient
+        from xai_gpt_shap.AsyncChatGptClient import AsyncChatGptClient
+        gpt_client = ChatGptClient(args.api_key)
+        llm_client = AsyncChatGptClient(args.api_key)
+
+    server = ExplanationServer(
+        calculators,
+        host=args.host,
+        port=args.port,
+        unix_socket=args.unix_socket,
+        max_batch_size=args.max_batch_size,
+        max_wait=args.max_wait_ms / 1000,
+        max_queue_size=args.max_queue_size,
+        gpt_client=gpt_client,
+        llm_client=llm_client,
+        role=args.role,
+        model_name=args.model_name,
+        short_summary=args.short_summary,
+        choice_class=args.choice_class,
+        request_timeout=args.request_timeout,
+    )
+    print(f"Serving {', '.join(calculators)} on {server.address}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class MemoizedPredictor:
+    """
+    Wraps a prediction function and evaluates every distinct input row only once.
+
+    SHAP maskers replace features with background values, so the rows they pass to the model repeat a lot,
+    both within one batch and across explained instances. The rows of a batch are deduplicated by comparing
+    their raw bytes (a vectorized `np.unique` over a void view of the rows), outputs of recent rows are kept
+    in a bounded LRU cache across calls, and only unique rows that are not cached are passed to the model.
+    The outputs are the ones the model returned for the same bytes, so the result is the same as calling
+    the model directly, as long as the model evaluates every row independently of the other rows.
+
+    Example:
+        predict = MemoizedPredictor(model.predict_proba, max_entries=100_000)
+        explainer = shap.Explainer(predict, background)
+        predict.get_stats()["dedup_ratio"]
+    """
+
+    DEFAULT_MAX_ENTRIES = 100_000 # Maximum number of row outputs kept across calls
+
+    def __init__(self, predict, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Initializes the predictor.
+
+        Args:
+            predict (callable): Returns one output row (e.g. class probabilities) per input row.
+            max_entries (int, optional): Maximum number of row outputs kept across calls.
+
+        Raises:
+            ValueError: If `max_entries` is negative.
+        """
+        if max_entries < 0:
+            raise ValueError("max_entries must not be negative.")
+        self.predict = predict
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._row_format = None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.rows = 0
+        self.cached_rows = 0
+        self.evaluated_rows = 0
+
+    def __call__(self, x):
+        """
+        Returns the outputs of the prediction function for a batch of rows.
+
+        Args:
+            x (ndarray or DataFrame): Input rows. Object (e.g. string) rows are passed to the model as they are.
+
+        Returns:
+            ndarray: One output per input row, in input order.
+        """
+        rows = np.asarray(x)
+        if rows.ndim != 2 or rows.dtype.hasobject or len(rows) == 0:
+            with self._lock:
+                self.calls += 1
+                self.rows += len(rows)
+                self.evaluated_rows += len(rows)
+            return self.predict(x)
+
+        rows = np.ascontiguousarray(rows)
+        # Every row becomes one opaque value, so rows are compared and sorted by their bytes
+        keys = rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).reshape(-1)
+        unique_keys, first_positions, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        unique_keys = unique_keys.tolist()
+
+        with self._lock:
+            row_format = (rows.dtype.str, rows.shape[1])
+            if row_format != self._row_format:
+                # The same bytes mean different rows in another dtype or width
+                self._cache.clear()
+                self._row_format = row_format
+            hits = []
+            cached_outputs = []
+            missing = []
+            for position, key in enumerate(unique_keys):
+                output = self._cache.get(key)
+                if output is None:
+                    missing.append(position)
+                else:
+                    self._cache.move_to_end(key)
+                    hits.append(position)
+                    cached_outputs.append(output)
+            self.calls += 1
+            self.rows += len(rows)
+            self.cached_rows += len(unique_keys) - len(missing)
+            self.evaluated_rows += len(missing)
+
+        outputs = None
+        if missing:
+            positions = first_positions[missing]
+            subset = x.iloc[positions] if hasattr(x, "iloc") else rows[positions]
+            # The model may return a buffer it reuses on the next call (e.g. ONNX I/O binding), so it is copied
+            outputs = np.array(self.predict(subset), copy=True)
+            if self.max_entries:
+                with self._lock:
+                    self._cache.update(zip([unique_keys[position] for position in missing], outputs))
+                    while len(self._cache) > self.max_entries:
+                        self._cache.popitem(last=False)
+
+        template = outputs if outputs is not None else np.asarray(cached_outputs)
+        unique_outputs = np.empty((len(unique_keys),) + template.shape[1:], dtype=template.dtype)
+        if missing:
+            unique_outputs[missing] = outputs
+        if hits:
+            unique_outputs[hits] = cached_outputs
+        return unique_outputs[inverse.reshape(-1)]
+
+    def clear(self):
+        """
+        Removes all cached outputs.
+        """
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self):
+        """
+        Returns statistics about the deduplication.
+
+        Returns:
+            dict: Number of calls, requested rows, unique rows answered from the cache, rows passed
+                  to the model, currently cached rows and the dedup ratio (share of requested rows that
+                  were not passed to the model).
+        """
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "rows": self.rows,
+                "cached_rows": self.cached_rows,
+                "evaluated_rows": self.evaluated_rows,
+                "size": len(self._cache),
+                "dedup_ratio": 1 - self.evaluated_rows / self.rows if self.rows else 0.0,
+            }
@@ -0,0 +1,247 @@
+import numpy as np
+import pandas as pd
+
+
+class MultiClassShapResult:
+    """
+    SHAP values of all classes of one explanation, kept as an instance × feature × class float32 tensor.
+
+    The explainer output for every class is computed once. Per-class, predicted-class and top-k-class views
+    are sliced from the tensor without evaluating the model again. The class scores are reconstructed from
+    the SHAP values (base value + sum of SHAP values), which is exact for SHAP explanations.
+
+    Example:
+        result = calculator.calculate_multiclass_shap_values(instances)
+        shap_df = result.to_dataframe(class_index=2)
+        contrast_df = result.to_contrast_dataframe(row=0, k=2)
+    """
+
+    def __init__(self, values, base_values, data, feature_names, class_names=None, output="probability", error_std=None,
+                 dtype=np.float32):
+        """
+        Initializes the result.
+
+        Args:
+            values (ndarray): SHAP values of shape (instances, features, classes).
+            base_values (ndarray): Base values of shape (instances, classes).
+            data (DataFrame): Feature values of the explained instances.
+            feature_names (list): Names of the features.
+            class_names (list, optional): Names of the classes. Defaults to the class indexes.
+            output (str, optional): Output space of the explainer ("probability" or "log_odds").
+            error_std (ndarray, optional): Standard errors of estimated SHAP values, same shape as `values`.
+            dtype (dtype, optional): Float type of the stored tensors. float32 halves the memory of the
+                                     explainer output; float64 keeps it exact, e.g. for caching.
+
+        Raises:
+            ValueError: If the shapes do not match.
+        """
+        values = np.asarray(values, dtype=dtype)
+        if values.ndim != 3 or values.shape[1] != len(feature_names):
+            raise ValueError(f"Expected SHAP values of shape (instances, {len(feature_names)}, classes), got {values.shape}.")
+        if error_std is not None:
+            error_std = np.asarray(error_std, dtype=values.dtype)
+            if error_std.shape != values.shape:
+                raise ValueError(f"Expected standard errors of shape {values.shape}, got {error_std.shape}.")
+        self.values = values
+        self.error_std = error_std
+        self.base_values = np.broadcast_to(np.asarray(base_values, dtype=values.dtype), values.shape[::2]).copy()
+        self.data = data
+        self.feature_names = list(feature_names)
+        n_classes = values.shape[2]
+        self.class_names = [str(name) for name in class_names] if class_names is not None else [str(index) for index in range(n_classes)]
+        if len(self.class_names) != n_classes:
+            raise ValueError(f"Expected {n_classes} class names, got {len(self.class_names)}.")
+        self.output = output
+
+    @classmethod
+    def from_explanation(cls, explanation, output, data, class_names=None, dtype=np.float32):
+        """
+        Creates the result from a shap explanation.
+
+        Args:
+            explanation (shap.Explanation): Explanation with one output per class, or a single output for
+                                            the positive class (binary tree and linear explainers).
+            output (str): Output space of the explainer ("probability" or "log_odds").
+            data (DataFrame): The explained instances.
+            class_names (list, optional): Names of the classes. Ignored if their number does not match the output.
+            dtype (dtype, optional): Float type of the stored tensors.
+
+        Returns:
+            MultiClassShapResult: The result with all classes.
+        """
+        values = np.asarray(explanation.values)
+        base_values = np.asarray(explanation.base_values)
+        error_std = explanation.error_std
+        if values.ndim == 2:
+            # The negative class mirrors the positive one: p(0) = 1 - p(1), logit(0) = -logit(1)
+            base_values = np.broadcast_to(base_values.reshape(-1), (len(values),))
+            negative_base = 1 - base_values if output == "probability" else -base_values
+            values = np.stack([-values, values], axis=2)
+            base_values = np.stack([negative_base, base_values], axis=1)
+            if error_std is not None:
+                error_std = np.stack([error_std, error_std], axis=2)
+        if class_names is not None and len(class_names) != values.shape[2]:
+            class_names = None
+        return cls(values, base_values, data, list(data.columns), class_names, output, error_std, dtype)
+
+    def astype(self, dtype):
+        """
+        Args:
+            dtype (dtype): Float type of the stored tensors.
+
+        Returns:
+            MultiClassShapResult: The same result with tensors of the given type.
+        """
+        return MultiClassShapResult(
+            self.values, self.base_values, self.data, self.feature_names, self.class_names, self.output,
+            self.error_std, dtype,
+        )
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    @property
+    def n_classes(self):
+        """
+        int: Number of classes.
+        """
+        return self.values.shape[2]
+
+    def get_scores(self):
+        """
+        Returns:
+            ndarray: Model output of every instance and class, shape (instances, classes).
+        """
+        return self.base_values + self.values.sum(axis=1)
+
+    def get_predicted_classes(self):
+        """
+        Returns:
+            ndarray: Index of the class with the highest score for every instance.
+        """
+        return self.get_scores().argmax(axis=1)
+
+    def get_top_classes(self, k=2, row=0):
+        """
+        Returns the classes with the highest scores for one instance.
+
+        Args:
+            k (int, optional): Number of classes.
+            row (int, optional): Position of the instance.
+
+        Returns:
+            ndarray: Class indexes, by descending score.
+        """
+        scores = self.get_scores()[row]
+        return np.argsort(-scores, kind="stable")[:k]
+
+    def _check_class(self, class_index):
+        if not -self.n_classes <= class_index < self.n_classes:
+            raise ValueError(f"Target class {class_index} is not available, the model has {self.n_classes} classes.")
+
+    def get_explanation(self, class_index):
+        """
+        Returns the SHAP values of one class as a shap explanation, e.g. for `shap.plots.waterfall`.
+
+        Args:
+            class_index (int): Index of the class.
+
+        Returns:
+            shap.Explanation: SHAP values of shape (instances, features).
+
+        Raises:
+            ValueError: If the class does not exist.
+        """
+        import shap
+
+        self._check_class(class_index)
+        return shap.Explanation(
+            values=self.values[:, :, class_index],
+            base_values=self.base_values[:, class_index],
+            data=np.asarray(self.data),
+            feature_names=self.feature_names,
+            error_std=None if self.error_std is None else self.error_std[:, :, class_index],
+        )
+
+    def get_predicted_class_explanation(self):
+        """
+        Returns the SHAP values of every instance's predicted class.
+
+        Returns:
+            shap.Explanation: SHAP values of shape (instances, features).
+        """
+        import shap
+
+        predicted = self.get_predicted_classes()
+        rows = np.arange(len(self))
+        return shap.Explanation(
+            values=self.values[rows, :, predicted],
+            base_values=self.base_values[rows, predicted],
+            data=np.asarray(self.data),
+            feature_names=self.feature_names,
+            error_std=None if self.error_std is None else self.error_std[rows, :, predicted],
+        )
+
+    def to_dataframe(self, class_index, row=0):
+        """
+        Returns the SHAP values of one class and instance in the format of `ShapCalculator.shap_results`.
+
+        Args:
+            class_index (int): Index of the class.
+            row (int, optional): Position of the instance.
+
+        Returns:
+            DataFrame: Columns "Feature", "SHAP Value" and "Feature Value", and "SHAP Std Error"
+                       if the SHAP values are estimates. `attrs["output"]` holds the output space.
+
+        Raises:
+            ValueError: If the class does not exist.
+        """
+        self._check_class(class_index)
+        shap_df = pd.DataFrame({
+            "Feature": self.feature_names,
+            "SHAP Value": self.values[row, :, class_index],
+            "Feature Value": self.data.values[row],
+        })
+        if self.error_std is not None:
+            shap_df["SHAP Std Error"] = self.error_std[row, :, class_index]
+        shap_df.attrs["output"] = self.output
+        return shap_df
+
+    def to_contrast_dataframe(self, row=0, k=2, classes=None):
+        """
+        Returns the SHAP values of competing classes side by side, for a prompt that contrasts them.
+
+        Args:
+            row (int, optional): Position of the instance.
+            k (int, optional): Number of classes with the highest scores to compare. Ignored if `classes` is given.
+            classes (list, optional): Class indexes to compare. The first one is contrasted with the second one,
+                                      further classes are listed for reference.
+
+        Returns:
+            DataFrame: Columns "Feature", "Feature Value", one "SHAP (<class>)" column per class and "SHAP Value",
+                       the SHAP value of the first class minus the one of the second class. Positive values
+                       favour the first class. `attrs` holds "scope" ("contrast"), "classes"
+                       (class names), "scores" (class scores) and "output" (output space of the scores).
+
+        Raises:
+            ValueError: If fewer than two classes are compared or a class does not exist.
+        """
+        classes = list(self.get_top_classes(k, row)) if classes is None else list(classes)
+        if len(classes) < 2:
+            raise ValueError("At least two classes are needed for a contrast.")
+        for class_index in classes:
+            self._check_class(class_index)
+
+        values = self.values[row][:, classes]
+        contrast = pd.DataFrame({"Feature": self.feature_names, "Feature Value": self.data.values[row]})
+        for position, class_index in enumerate(classes):
+            contrast[f"SHAP ({self.class_names[class_index]})"] = values[:, position]
+        contrast["SHAP Value"] = values[:, 0] - values[:, 1]
+
+        scores = self.get_scores()[row]
+        contrast.attrs["scope"] = "contrast"
+        contrast.attrs["classes"] = [self.class_names[class_index] for class_index in classes]
+        contrast.attrs["scores"] = [float(scores[class_index]) for class_index in classes]
+        contrast.attrs["output"] = self.output
+        return contrast
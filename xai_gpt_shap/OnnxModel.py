@@ -0,0 +1,201 @@
+import numpy as np
+import onnxruntime
+
+
+class OnnxModel:
+    """
+    A thin, high-throughput wrapper around an ONNX Runtime inference session, used by `ShapCalculator`
+    to evaluate the many masked batches an explainer produces.
+
+    The session is created with tuned options, input and output metadata is read once, float32
+    C-contiguous inputs are passed to the runtime without a copy and large batches are written into
+    a reused output buffer through IO binding. Probability maps produced by scikit-learn converters
+    (ZipMap) are removed from the graph when the `onnx` package is installed, so the runtime returns
+    a plain probability matrix.
+
+    Attributes not defined here (e.g. `get_inputs`, `run`) are forwarded to the underlying session.
+
+    Attributes:
+        model_path (str): Path to the ONNX model.
+        session (onnxruntime.InferenceSession): The inference session.
+        input_name (str): Name of the model input.
+        output_names (list): Names of all model outputs.
+        probability_output_index (int): Index of the output that holds class probabilities.
+        probability_output_name (str): Name of the output that holds class probabilities.
+        io_binding_min_batch (int): Smallest batch that is evaluated with IO binding and a reused output buffer.
+    """
+
+    GRAPH_OPTIMIZATION_LEVELS = {
+        "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+    IO_BINDING_MIN_BATCH = 1024 # Batches with at least this many rows use IO binding
+
+    def __init__(self, model_path, intra_op_num_threads=None, inter_op_num_threads=None,
+                 graph_optimization_level="all", io_binding_min_batch=IO_BINDING_MIN_BATCH, strip_zipmap=True):
+        """
+        Initializes the OnnxModel class and creates the inference session.
+
+        Args:
+            model_path (str): Path to the ONNX model.
+            intra_op_num_threads (int, optional): Threads used inside one operator. Defaults to the runtime default.
+            inter_op_num_threads (int, optional): Threads used to run independent operators. Defaults to the runtime default.
+            graph_optimization_level (str, optional): "disable", "basic", "extended" or "all". Defaults to "all".
+            io_binding_min_batch (int, optional): Smallest batch evaluated with IO binding. Defaults to 1024.
+            strip_zipmap (bool, optional): Whether ZipMap probability maps are removed from the graph. Defaults to True.
+
+        Raises:
+            ValueError: If the graph optimization level is unknown.
+        """
+        if graph_optimization_level not in self.GRAPH_OPTIMIZATION_LEVELS:
+            raise ValueError(
+                f"Unknown graph optimization level: {graph_optimization_level}. "
+                f"Available levels: {', '.join(self.GRAPH_OPTIMIZATION_LEVELS.keys())}"
+            )
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = self.GRAPH_OPTIMIZATION_LEVELS[graph_optimization_level]
+        if intra_op_num_threads is not None:
+            options.intra_op_num_threads = intra_op_num_threads
+        if inter_op_num_threads is not None:
+            options.inter_op_num_threads = inter_op_num_threads
+
+        self.model_path = model_path
+        with open(model_path, "rb") as file:
+            model_bytes = file.read()
+        if strip_zipmap:
+            model_bytes = self._strip_zipmap(model_bytes)
+        self.session = onnxruntime.InferenceSession(model_bytes, options, providers=["CPUExecutionProvider"])
+
+        # Metadata is read once instead of on every explanation
+        self.input_name = self.session.get_inputs()[0].name
+        outputs = self.session.get_outputs()
+        self.output_names = [output.name for output in outputs]
+        self.probability_output_index = self._find_probability_output(outputs)
+        self.probability_output_name = self.output_names[self.probability_output_index]
+        probability_output = outputs[self.probability_output_index]
+        self._returns_map = probability_output.type.startswith("seq(map")
+        self._can_bind_output = probability_output.type == "tensor(float)" and len(probability_output.shape) == 2
+        self._class_keys = None
+        self._n_outputs = None
+        self._output_buffer = None
+        self._io_binding = None
+        self.io_binding_min_batch = io_binding_min_batch
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not found on the wrapper, e.g. `get_inputs` or `run`
+        if name == "session":
+            raise AttributeError(name)
+        return getattr(self.session, name)
+
+    def _strip_zipmap(self, model_bytes):
+        """
+        Removes a ZipMap node, so the probability output stays a float tensor.
+
+        Args:
+            model_bytes (bytes): The serialized model.
+
+        Returns:
+            bytes: The serialized model without ZipMap, or the original bytes if the model has no ZipMap
+                   or the `onnx` package is not installed.
+        """
+        try:
+            import onnx
+        except ImportError:
+            return model_bytes
+
+        model = onnx.load_from_string(model_bytes)
+        zipmaps = [node for node in model.graph.node if node.op_type == "ZipMap"]
+        if not zipmaps:
+            return model_bytes
+
+        for zipmap in zipmaps:
+            source, target = zipmap.input[0], zipmap.output[0]
+            model.graph.node.remove(zipmap)
+            # The probability tensor takes over the name of the map output
+            for node in model.graph.node:
+                for index, name in enumerate(node.output):
+                    if name == source:
+                        node.output[index] = target
+                for index, name in enumerate(node.input):
+                    if name == source:
+                        node.input[index] = target
+            for output in model.graph.output:
+                if output.name == target:
+                    output.CopyFrom(onnx.helper.make_tensor_value_info(target, onnx.TensorProto.FLOAT, [None, None]))
+        return model.SerializeToString()
+
+    def _find_probability_output(self, outputs):
+        """
+        Finds the output that holds class probabilities.
+
+        Args:
+            outputs (list): Output metadata of the session.
+
+        Returns:
+            int: Index of the probability output. Falls back to the first output.
+        """
+        for index, output in enumerate(outputs):
+            if output.type == "tensor(float)" and len(output.shape) == 2:
+                return index
+        for index, output in enumerate(outputs):
+            if output.type.startswith("seq(map"):
+                return index
+        for index, output in enumerate(outputs):
+            if output.type in ("tensor(float)", "tensor(double)"):
+                return index
+        return 0
+
+    def predict_proba(self, x):
+        """
+        Evaluates the model on a batch of rows.
+
+        Batches with at least `io_binding_min_batch` rows are written into a buffer that is reused by the
+        next large batch, so the returned array must be copied if it is kept after the next call.
+
+        Args:
+            x (numpy.ndarray or DataFrame): A 2D batch of rows.
+
+        Returns:
+            numpy.ndarray: Class probabilities, one row per input row.
+        """
+        # No copy is made when the input is already float32 and C-contiguous
+        x = np.ascontiguousarray(x, dtype=np.float32)
+
+        if self._can_bind_output and self._n_outputs is not None and x.shape[0] >= self.io_binding_min_batch:
+            return self._run_with_io_binding(x)
+
+        output = self.session.run([self.probability_output_name], {self.input_name: x})[0]
+        if self._returns_map:
+            # Only used when the ZipMap could not be removed from the graph
+            if self._class_keys is None:
+                self._class_keys = sorted(output[0].keys())
+            output = np.array([[row[key] for key in self._class_keys] for row in output], dtype=np.float32)
+        elif self._n_outputs is None and output.ndim == 2:
+            self._n_outputs = output.shape[1]
+        return output
+
+    def _run_with_io_binding(self, x):
+        """
+        Evaluates a large batch with IO binding, writing the probabilities into a reused buffer.
+
+        Args:
+            x (numpy.ndarray): A float32, C-contiguous batch of rows.
+
+        Returns:
+            numpy.ndarray: A view of the output buffer with one row per input row.
+        """
+        if self._output_buffer is None or self._output_buffer.shape[0] < x.shape[0]:
+            self._output_buffer = np.empty((x.shape[0], self._n_outputs), dtype=np.float32)
+        if self._io_binding is None:
+            self._io_binding = self.session.io_binding()
+
+        output = self._output_buffer[:x.shape[0]]
+        self._io_binding.bind_cpu_input(self.input_name, x)
+        self._io_binding.bind_output(
+            self.probability_output_name, "cpu", 0, np.float32, list(output.shape), output.ctypes.data
+        )
+        self.session.run_with_iobinding(self._io_binding)
+        return output
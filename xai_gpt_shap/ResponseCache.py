@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class ResponseCache(ABC):
+    """
+    Base class of GPT response caches used by `ChatGptClient`.
+
+    Responses are keyed by a hash of the model, temperature, maximum response tokens, system message and
+    the full message list, so an answer is only reused for exactly the same request. Entries older than
+    `ttl_seconds` are ignored and the least recently used entries are removed above `max_entries`.
+
+    Attributes:
+        max_entries (int): Maximum number of cached responses. None means no limit.
+        ttl_seconds (float): Time to live of a response in seconds. None keeps responses forever.
+        hits (int): Number of requests answered from the cache.
+        misses (int): Number of requests that were not in the cache.
+    """
+
+    DEFAULT_MAX_ENTRIES = 1000 # Maximum number of cached responses
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=None):
+        """
+        Initializes the response cache.
+
+        Args:
+            max_entries (int, optional): Maximum number of cached responses. None means no limit.
+            ttl_seconds (float, optional): Time to live of a response in seconds. None keeps responses forever.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model, temperature, max_tokens, system_message, messages):
+        """
+        Creates a cache key for a request.
+
+        Args:
+            model (str): GPT model name.
+            temperature (float): Temperature of the request.
+            max_tokens (int): Maximum response tokens, or None.
+            system_message (str): The system message.
+            messages (list): The full message list sent to the model.
+
+        Returns:
+            str: A SHA-256 hex digest.
+        """
+        payload = json.dumps(
+            [model, temperature, max_tokens, system_message, messages], sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Returns a cached response.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            str: The cached response, or None if it is not cached or has expired.
+        """
+        answer = self._get(key)
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
+    @abstractmethod
+    def put(self, key, answer):
+        """
+        Stores a response.
+
+        Args:
+            key (str): Cache key.
+            answer (str): The response text.
+        """
+
+    @abstractmethod
+    def clear(self):
+        """
+        Removes all cached responses.
+        """
+
+    def get_stats(self):
+        """
+        Returns cache statistics.
+
+        Returns:
+            dict: Number of hits, misses and cached responses.
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self)}
+
+    @abstractmethod
+    def _get(self, key):
+        """
+        Returns a cached response without counting a hit or a miss.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            str: The cached response, or None if it is not cached or has expired.
+        """
+
+    @abstractmethod
+    def __len__(self):
+        """
+        Returns:
+            int: Number of cached responses.
+        """
+
+
+class InMemoryResponseCache(ResponseCache):
+    """
+    A response cache kept in memory, with least recently used eviction.
+    """
+
+    def __init__(self, max_entries=ResponseCache.DEFAULT_MAX_ENTRIES, ttl_seconds=None):
+        super().__init__(max_entries, ttl_seconds)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            answer, created_at = entry
+            if self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return answer
+
+    def put(self, key, answer):
+        with self._lock:
+            self._entries[key] = (answer, time.time())
+            self._entries.move_to_end(key)
+            while self.max_entries is not None and len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    A response cache stored in a SQLite database, so answers survive restarts and can be shared
+    by several processes.
+    """
+
+    BUSY_TIMEOUT = 30 # Seconds to wait for other processes holding a write lock
+
+    def __init__(self, path, max_entries=ResponseCache.DEFAULT_MAX_ENTRIES, ttl_seconds=None):
+        """
+        Initializes the SQLite response cache and creates the database if needed.
+
+        Args:
+            path (str): Path to the SQLite database file.
+            max_entries (int, optional): Maximum number of cached responses. None means no limit.
+            ttl_seconds (float, optional): Time to live of a response in seconds. None keeps responses forever.
+        """
+        super().__init__(max_entries, ttl_seconds)
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        connection = self._connect()
+        with connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    answer TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+
+    def _connect(self):
+        # Connections must not be shared between threads or inherited by forked processes
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.BUSY_TIMEOUT, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _get(self, key):
+        connection = self._connect()
+        row = connection.execute("SELECT answer, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        answer, created_at = row
+        now = time.time()
+        if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        return answer
+
+    def put(self, key, answer):
+        now = time.time()
+        connection = self._connect()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, answer, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, answer, now, now),
+            )
+            if self.ttl_seconds is not None:
+                connection.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            if self.max_entries is not None:
+                connection.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_access DESC, rowid DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+
+    def clear(self):
+        connection = self._connect()
+        with connection:
+            connection.execute("DELETE FROM responses")
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
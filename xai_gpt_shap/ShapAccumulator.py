@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+
+
+class ShapAccumulator:
+    """
+    Aggregates SHAP values chunk by chunk into global feature importance, without keeping the per-row values.
+
+    For every feature it keeps the mean absolute SHAP value, the mean signed SHAP value, the variance (merged
+    per chunk with Welford's parallel update) and the mean feature value. Optionally, a uniform reservoir sample
+    of `sketch_size` rows is kept to estimate quantiles of the SHAP values. Memory usage depends on the number
+    of features and the sketch size, not on the number of explained rows.
+
+    Example:
+        accumulator = ShapAccumulator(feature_names, quantiles=(0.05, 0.5, 0.95))
+        for chunk in chunks:
+            accumulator.update(shap_values_of_chunk, chunk)
+        summary = accumulator.to_dataframe()
+    """
+
+    DEFAULT_SKETCH_SIZE = 2048 # Rows kept in the reservoir sample used for quantiles
+
+    def __init__(self, feature_names, quantiles=None, sketch_size=DEFAULT_SKETCH_SIZE, seed=None):
+        """
+        Initializes an empty accumulator.
+
+        Args:
+            feature_names (list): Names of the features, in the column order of the SHAP values.
+            quantiles (list, optional): Quantiles (between 0 and 1) of the SHAP values to estimate.
+                                        By default no reservoir is kept.
+            sketch_size (int, optional): Rows kept in the reservoir sample. Larger samples give more accurate quantiles.
+            seed (int, optional): Seed of the reservoir sampling.
+
+        Raises:
+            ValueError: If a quantile is not between 0 and 1 or `sketch_size` is not a positive integer.
+        """
+        if quantiles is not None and any(not 0 <= quantile <= 1 for quantile in quantiles):
+            raise ValueError("Quantiles must be between 0 and 1.")
+        if not isinstance(sketch_size, int) or sketch_size <= 0:
+            raise ValueError("sketch_size must be a positive integer.")
+        self.feature_names = list(feature_names)
+        self.quantiles = tuple(quantiles) if quantiles else ()
+        self.sketch_size = sketch_size
+        self.count = 0
+        n_features = len(self.feature_names)
+        self._mean = np.zeros(n_features)
+        self._m2 = np.zeros(n_features)
+        self._abs_sum = np.zeros(n_features)
+        self._value_sum = np.zeros(n_features)
+        self._value_count = np.zeros(n_features, dtype=np.int64)
+        self._reservoir = np.empty((sketch_size, n_features), dtype=np.float32) if self.quantiles else None
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, shap_values, feature_values=None):
+        """
+        Adds the SHAP values of a chunk of rows.
+
+        Args:
+            shap_values (ndarray): SHAP values of shape (rows, features).
+            feature_values (DataFrame, optional): Feature values of the same rows. Non-numeric
+                                                  and missing values are left out of the mean feature value.
+
+        Raises:
+            ValueError: If the number of columns does not match the feature names.
+        """
+        shap_values = np.asarray(shap_values, dtype=float)
+        if shap_values.ndim != 2 or shap_values.shape[1] != len(self.feature_names):
+            raise ValueError(f"Expected SHAP values of shape (rows, {len(self.feature_names)}), got {shap_values.shape}.")
+        rows = len(shap_values)
+        if rows == 0:
+            return
+
+        # Welford's update for merging the statistics of a whole chunk (Chan et al.)
+        chunk_mean = shap_values.mean(axis=0)
+        chunk_m2 = ((shap_values - chunk_mean) ** 2).sum(axis=0)
+        total = self.count + rows
+        delta = chunk_mean - self._mean
+        self._mean += delta * rows / total
+        self._m2 += chunk_m2 + delta ** 2 * self.count * rows / total
+        self._abs_sum += np.abs(shap_values).sum(axis=0)
+
+        if feature_values is not None:
+            values = pd.DataFrame(feature_values).apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+            present = ~np.isnan(values)
+            self._value_sum += np.where(present, values, 0.0).sum(axis=0)
+            self._value_count += present.sum(axis=0)
+
+        if self._reservoir is not None:
+            self._update_reservoir(shap_values)
+        self.count = total
+
+    def _update_reservoir(self, shap_values):
+        """
+        Keeps a uniform sample of all rows seen so far (reservoir sampling, algorithm R).
+        """
+        filled = min(self.count, self.sketch_size)
+        take = min(self.sketch_size - filled, len(shap_values))
+        self._reservoir[filled:filled + take] = shap_values[:take]
+
+        rest = shap_values[take:]
+        if len(rest) == 0:
+            return
+        # Row i (0-based over all rows) replaces a random slot with probability sketch_size / (i + 1)
+        positions = np.arange(self.count + take, self.count + take + len(rest))
+        slots = (self._rng.random(len(rest)) * (positions + 1)).astype(np.int64)
+        replaced = np.flatnonzero(slots < self.sketch_size)
+        if len(replaced) == 0:
+            return
+        # When several rows draw the same slot, the last one wins, like in the sequential algorithm
+        reversed_slots = slots[replaced][::-1]
+        _, last = np.unique(reversed_slots, return_index=True)
+        winners = replaced[::-1][last]
+        self._reservoir[slots[winners]] = rest[winners]
+
+    def get_quantiles(self):
+        """
+        Estimates the quantiles of the SHAP values from the reservoir sample.
+
+        Returns:
+            ndarray: Array of shape (quantiles, features), empty if no quantiles were requested.
+        """
+        if self._reservoir is None or self.count == 0:
+            return np.empty((len(self.quantiles), len(self.feature_names)))
+        sample = self._reservoir[:min(self.count, self.sketch_size)]
+        return np.quantile(sample, self.quantiles, axis=0)
+
+    def to_dataframe(self):
+        """
+        Returns the global feature importance, sorted by descending mean absolute SHAP value.
+
+        The DataFrame can be passed to `ChatGptClient.create_summary_and_message` to get a dataset-level prompt.
+
+        Returns:
+            DataFrame: One row per feature with columns "Feature", "SHAP Value" (mean signed SHAP value),
+                       "Mean |SHAP|", "SHAP Std", one "SHAP Q<quantile>" column per quantile and "Feature Value"
+                       (mean feature value, NaN for non-numeric features). `attrs` holds "scope" ("global")
+                       and "instances" (number of explained rows).
+
+        Raises:
+            ValueError: If no SHAP values were added.
+        """
+        if self.count == 0:
+            raise ValueError("No SHAP values were added.")
+        summary = pd.DataFrame({
+            "Feature": self.feature_names,
+            "SHAP Value": self._mean,
+            "Mean |SHAP|": self._abs_sum / self.count,
+            "SHAP Std": np.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else np.zeros(len(self.feature_names)),
+        })
+        for quantile, values in zip(self.quantiles, self.get_quantiles()):
+            summary[f"SHAP Q{quantile:g}"] = values
+        with np.errstate(invalid="ignore", divide="ignore"):
+            summary["Feature Value"] = np.where(self._value_count > 0, self._value_sum / self._value_count, np.nan)
+
+        summary = summary.sort_values("Mean |SHAP|", ascending=False, kind="stable").reset_index(drop=True)
+        summary.attrs["scope"] = "global"
+        summary.attrs["instances"] = self.count
+        return summary
@@ -1,7 +1,19 @@
-import shap
+import numpy as np
 import pandas as pd
+import os
+import json
 import pickle
-import onnxruntime
+import hashlib
+import numbers
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from xai_gpt_shap.instrumentation import get_instrumentation, NullInstrumentation
+from xai_gpt_shap.ShapAccumulator import ShapAccumulator
+from xai_gpt_shap.ShapResultStore import ShapResultWriter
+from xai_gpt_shap.MultiClassShapResult import MultiClassShapResult
+from xai_gpt_shap.ApproximateExplainer import ApproximateExplainer
+from xai_gpt_shap.MemoizedPredictor import MemoizedPredictor
 
 class ShapCalculator:
 
@@ -16,9 +28,33 @@ class ShapCalculator:
         model (object): Loaded machine learning model.
         data (DataFrame): Loaded dataset.
         shap_results (DataFrame): DataFrame containing SHAP values and feature contributions.
+        multiclass_result (MultiClassShapResult): SHAP values of all classes of the last explained instance.
         model_type (str): Type of the loaded moddel (onnx, pickle or unknown)
+        background (DataFrame): Background data prepared from `data` by the background strategy.
+        background_weights (numpy.ndarray): Weights of the background rows (only set for k-means centroids).
+        background_strategy (dict): The selected background strategy and its settings, None uses `data` as is.
+        explainer_type (str): Requested explainer ("auto", "tree", "linear" or "model_agnostic").
+        explainer_engine (str): Explainer used for the last explanation ("tree", "linear", "model_agnostic" or "kernel").
+        explainer_output (str): Output space of the explainer used for the last explanation ("probability" or "log_odds").
+        explainer_options (dict): Extra keyword arguments passed to `shap.Explainer`.
+        onnx_options (dict): Keyword arguments passed to `OnnxModel` when an ONNX model is loaded.
+        result_cache (ShapResultCache): Optional persistent cache of SHAP results.
+        prediction_memo_size (int): Model outputs of masked rows kept per explainer, see `set_prediction_memoization`.
+                                    None disables the memoization.
+        memoized_predictor (MemoizedPredictor): Memoized prediction function of the last used explainer, if enabled.
+        explainer_cache_hits (int): Number of times a cached explainer was reused.
+        explainer_cache_misses (int): Number of times a new explainer had to be built.
     """
-    def __init__(self, model_path=None, data_path=None, target_class=None):
+
+    MAX_CACHED_EXPLAINERS = 4 # Maximum number of explainers kept in the cache
+    DEFAULT_CHUNK_SIZE = 1000 # Maximum number of instances explained in one explainer call
+    BACKGROUND_STRATEGIES = ("full", "sample", "stratified", "kmeans")
+    EXPLAINER_TYPES = ("auto", "tree", "linear", "model_agnostic", "approximate")
+    FAST_EXPLAINER_BACKGROUND_SIZE = 100 # Background rows used by tree/linear explainers when no strategy is set
+    DTYPE_SAMPLE_ROWS = 1000 # Rows read from a CSV file to detect which columns can be downcast
+
+    def __init__(self, model_path=None, data_path=None, target_class=None, explainer_options=None, explainer_type="auto",
+                 onnx_options=None, result_cache=None, instrumentation=None, prediction_memo_size=None):
         """
         Initializes the ShapCalculator class.
 
@@ -26,14 +62,81 @@ class ShapCalculator:
             model_path (str, optional): Path to the saved model.
             data_path (str, optional): Path to the dataset (CSV).
             target_class (int, optional): Target class for SHAP analysis.
+            explainer_options (dict, optional): Extra keyword arguments passed to `shap.Explainer`
+                                                (e.g. {"algorithm": "permutation"}).
+            explainer_type (str, optional): Explainer to use, see `set_explainer_type`. Defaults to "auto".
+            onnx_options (dict, optional): Session settings for ONNX models passed to `OnnxModel`
+                                           (e.g. {"intra_op_num_threads": 4, "graph_optimization_level": "all"}).
+            result_cache (ShapResultCache, optional): Persistent cache of SHAP results, see `set_result_cache`.
+            instrumentation (Instrumentation, optional): Receives timings and counters of every stage.
+                                                         Defaults to `instrumentation.get_instrumentation()`.
+            prediction_memo_size (int, optional): Enables memoization of model outputs, see `set_prediction_memoization`.
         """
         self.model_path = model_path
         self.data_path = data_path
         self.target_class = target_class
         self.model = None
-        self.data = None
+        self._model_fingerprint = None
+        self._n_classes = None
+        self._data = None
+        self._background = None
+        self._background_summary = None
+        self.background_weights = None
+        self.background_strategy = None
+        self._background_fingerprint = None
+        self._data_cache_path = None
         self.shap_results = None 
+        self.multiclass_result = None
         self.model_type = None
+        self.explainer_options = dict(explainer_options or {})
+        self.onnx_options = dict(onnx_options or {})
+        self.result_cache = result_cache
+        self.prediction_memo_size = prediction_memo_size
+        self.memoized_predictor = None
+        self.explainer_type = None
+        self.set_explainer_type(explainer_type)
+        self.explainer_engine = None
+        self.explainer_output = None
+        self._explainer_cache = OrderedDict()
+        self.explainer_cache_hits = 0
+        self.explainer_cache_misses = 0
+        self.instrumentation = instrumentation if instrumentation is not None else get_instrumentation()
+
+    @property
+    def data(self):
+        """
+        DataFrame: The loaded dataset, used as the SHAP background.
+        Assigning a new dataset invalidates the cached explainers.
+        """
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._data_cache_path = None
+        self._reset_background()
+
+    @property
+    def background(self):
+        """
+        DataFrame: Background data for the explainer, prepared from `data` with the selected
+        background strategy. Without a strategy this is `data` itself.
+        """
+        if self._background is None and self._data is not None:
+            self._background, self._background_summary = self._prepare_background(self._data, self.background_strategy)
+            if self._background_summary is not None:
+                self.background_weights = self._background_summary.weights
+        return self._background
+
+    def _reset_background(self):
+        """
+        Drops the prepared background so it is rebuilt on next use and invalidates the cached explainers.
+        """
+        self._background = None
+        self._background_summary = None
+        self.background_weights = None
+        self._background_fingerprint = None
+        self.invalidate_explainer_cache()
 
     def load_model(self, model_path=None):
         """
@@ -50,24 +153,38 @@ class ShapCalculator:
         if not self.model_path:
             raise ValueError("Path to model is not set.")
         try:
-            # Check if the model is an ONNX model
-            if self.model_path.endswith(".onnx"):
-                self.model = onnxruntime.InferenceSession(self.model_path)
-                self.model_type = "onnx"
-            else:
-                # Asume that the model is a pickle file
-                with open(self.model_path, "rb") as file:
-                    self.model = pickle.load(file)
-                    self.model_type = "pickle"
+            with self.instrumentation.span("load_model"):
+                # Check if the model is an ONNX model
+                if self.model_path.endswith(".onnx"):
+                    # onnxruntime is only imported when an ONNX model is used
+                    from xai_gpt_shap.OnnxModel import OnnxModel
+                    self.model = OnnxModel(self.model_path, **self.onnx_options)
+                    self.model_type = "onnx"
+                else:
+                    # Asume that the model is a pickle file
+                    with open(self.model_path, "rb") as file:
+                        self.model = pickle.load(file)
+                        self.model_type = "pickle"
         except Exception as e:
             raise ValueError(f"Failed to load model from {self.model_path}: {e}")
-        
-    def load_data(self, data_path=None):
+        self._model_fingerprint = None
+        self._n_classes = None
+        self.multiclass_result = None
+        self.invalidate_explainer_cache()
+
+    def load_data(self, data_path=None, columns=None, downcast=False, cache_path=None):
         """
-        Loads a dataset from a CSV file.
+        Loads a dataset from a CSV, Parquet (.parquet, .pq) or Feather (.feather, .arrow) file.
 
         Args:
             data_path (str, optional): Path to the dataset file. If not provided, uses `self.data_path`.
+            columns (list or str, optional): Columns to load, in this order. "model" loads the features
+                                             the loaded model expects. By default all columns are loaded.
+            downcast (bool, optional): Whether float columns are stored as float32 and text columns as category.
+            cache_path (str, optional): Path of a `.npy` cache of the parsed data. The first load writes it,
+                                        later loads memory-map it instead of parsing the file again, as long as the
+                                        source file and the load settings did not change. All loaded columns must
+                                        be numeric, they are cached as one float32 (or float64) matrix.
 
         Raises:
             ValueError: If the `data_path` is not set or the file cannot be loaded.
@@ -76,20 +193,686 @@ class ShapCalculator:
             self.data_path = data_path
         if not self.data_path:
             raise ValueError("Path to data is not given.")
+        if isinstance(columns, str):
+            if columns != "model":
+                raise ValueError('columns must be a list of column names or "model".')
+            columns = self.get_model_feature_names()
+            if columns is None:
+                raise ValueError("The loaded model does not report its feature names.")
+
         try:
-            self.data = pd.read_csv(self.data_path)
+            with self.instrumentation.span("load_data"):
+                if cache_path:
+                    cache_key = self._get_data_cache_key(columns, downcast)
+                    data = self._read_data_cache(cache_path, cache_key)
+                    if data is None:
+                        data = self._read_data_file(columns, downcast)
+                        self._write_data_cache(data, cache_path, cache_key)
+                        data = self._read_data_cache(cache_path, cache_key)
+                    self.data = data
+                    self._data_cache_path = cache_path
+                else:
+                    self.data = self._read_data_file(columns, downcast)
         except Exception as e:
             raise ValueError(f"Failed to load data from {self.data_path}: {e}")
 
+    def _read_data_file(self, columns, downcast):
+        """
+        Parses the dataset file.
+
+        Args:
+            columns (list): Columns to load, or None for all columns.
+            downcast (bool): Whether float columns are stored as float32 and text columns as category.
+
+        Returns:
+            DataFrame: The loaded dataset.
+        """
+        extension = os.path.splitext(self.data_path)[1].lower()
+        if extension in (".parquet", ".pq"):
+            data = pd.read_parquet(self.data_path, columns=columns)
+        elif extension in (".feather", ".arrow"):
+            data = pd.read_feather(self.data_path, columns=columns)
+        else:
+            dtype = None
+            if downcast:
+                # Detect the column types on a sample, so the full file is parsed straight into small dtypes
+                sample = pd.read_csv(self.data_path, usecols=columns, nrows=self.DTYPE_SAMPLE_ROWS)
+                dtype = {name: "float32" for name in sample.select_dtypes(include="float").columns}
+                dtype.update({name: "category" for name in sample.select_dtypes(include="object").columns})
+            data = pd.read_csv(self.data_path, usecols=columns, dtype=dtype)
+
+        if columns is not None:
+            data = data[list(columns)]
+        if downcast:
+            float_columns = data.select_dtypes(include="float64").columns
+            object_columns = data.select_dtypes(include="object").columns
+            if len(float_columns) or len(object_columns):
+                data = data.astype({
+                    **{name: "float32" for name in float_columns},
+                    **{name: "category" for name in object_columns},
+                })
+        return data
+
+    def _get_data_cache_key(self, columns, downcast):
+        """
+        Describes the source file and load settings a data cache was created from.
+
+        Args:
+            columns (list): Loaded columns, or None for all columns.
+            downcast (bool): Whether the data was downcast.
+
+        Returns:
+            dict: The cache key.
+        """
+        stat = os.stat(self.data_path)
+        return {
+            "source": os.path.abspath(self.data_path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "columns": None if columns is None else list(columns),
+            "downcast": bool(downcast),
+        }
+
+    def _write_data_cache(self, data, cache_path, cache_key):
+        """
+        Writes the data as a `.npy` matrix with a JSON sidecar holding the column names and the cache key.
+
+        Args:
+            data (DataFrame): Numeric data to cache.
+            cache_path (str): Path of the `.npy` file.
+            cache_key (dict): Key created by `_get_data_cache_key`.
+
+        Raises:
+            ValueError: If the data has non-numeric columns.
+        """
+        if len(data.select_dtypes(exclude="number").columns):
+            raise ValueError("Only numeric data can be cached as a .npy file.")
+        dtype = np.float32 if all(dtype == np.float32 for dtype in data.dtypes) else np.float64
+
+        # Write to temporary files first, so readers never see a half written cache
+        temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            np.save(file, data.to_numpy(dtype=dtype))
+        with open(f"{temporary_path}.json", "w") as file:
+            json.dump({"key": cache_key, "columns": [str(name) for name in data.columns]}, file)
+        os.replace(temporary_path, cache_path)
+        os.replace(f"{temporary_path}.json", f"{cache_path}.json")
+
+    def _read_data_cache(self, cache_path, cache_key=None):
+        """
+        Memory-maps a data cache written by `_write_data_cache`.
+
+        Args:
+            cache_path (str): Path of the `.npy` file.
+            cache_key (dict, optional): Expected cache key. If it does not match, the cache is ignored.
+
+        Returns:
+            DataFrame: A read-only DataFrame backed by the memory-mapped file, or None if the cache is missing or stale.
+        """
+        try:
+            with open(f"{cache_path}.json") as file:
+                metadata = json.load(file)
+            if cache_key is not None and metadata["key"] != cache_key:
+                return None
+            values = np.load(cache_path, mmap_mode="r")
+        except (OSError, ValueError, KeyError):
+            return None
+        return pd.DataFrame(values, columns=metadata["columns"], copy=False)
+
+    def get_model_feature_names(self):
+        """
+        Returns the feature names the loaded model was trained with.
+
+        Returns:
+            list: Feature names, or None if the model does not report them (e.g. ONNX models).
+
+        Raises:
+            ValueError: If the model is not loaded.
+        """
+        if self.model is None:
+            raise ValueError("Model is not loaded")
+        if self.model_type != "pickle":
+            return None
+        names = getattr(self.model, "feature_names_in_", None)
+        if names is None and hasattr(self.model, "get_booster"):
+            names = self.model.get_booster().feature_names
+        if names is None:
+            names = getattr(self.model, "feature_name_", None)
+        return None if names is None else [str(name) for name in names]
+
     def set_target_class(self, target_class):
         """
         Sets the target class for SHAP analysis.
 
+        If an instance was explained, `shap_results` is switched to the new class from `multiclass_result`,
+        without explaining the instance again.
+
         Args:
             target_class (int): The target class index for SHAP analysis.
+
+        Raises:
+            ValueError: If an instance was explained and its model has no such class.
         """
+        if self.multiclass_result is not None:
+            self.shap_results = self.multiclass_result.to_dataframe(target_class)
         self.target_class = target_class
 
+    def set_background_strategy(self, strategy, size=100, seed=None, labels=None):
+        """
+        Selects how the background data is summarized before it is passed to the explainer.
+        The raw `data` is kept unchanged, the summary is available as `background`.
+
+        Available strategies:
+            - "full": Uses every row of `data`.
+            - "sample": Random subsample of `size` rows.
+            - "stratified": Random subsample of `size` rows that keeps the class proportions.
+                            Classes are taken from `labels` or, if not given, predicted by the model.
+            - "kmeans": `size` k-means centroids weighted by the number of rows they represent.
+
+        Args:
+            strategy (str): One of the strategies above. None restores the default behaviour.
+            size (int or float, optional): Number of background rows (or centroids). A float between 0 and 1
+                                           is treated as a fraction of `data`. Defaults to 100.
+            seed (int, optional): Random seed used for sampling and for the k-means initialization.
+            labels (array-like, optional): Class label for each row of `data`, used by "stratified".
+
+        Raises:
+            ValueError: If the strategy is unknown or `size` is not valid.
+        """
+        if strategy is not None and strategy not in self.BACKGROUND_STRATEGIES:
+            raise ValueError(f"Unknown background strategy: {strategy}. Available strategies: {', '.join(self.BACKGROUND_STRATEGIES)}")
+        if isinstance(size, bool) or not isinstance(size, (int, float)) or size <= 0:
+            raise ValueError("size must be a positive integer or a fraction between 0 and 1.")
+        if isinstance(size, float) and size > 1:
+            raise ValueError("A fractional size must be between 0 and 1.")
+
+        if strategy is None:
+            self.background_strategy = None
+        else:
+            self.background_strategy = {"strategy": strategy, "size": size, "seed": seed, "labels": labels}
+        self._reset_background()
+
+    def _prepare_background(self, data, background_strategy):
+        """
+        Builds the background data for the given strategy.
+
+        Args:
+            data (DataFrame): The full dataset.
+            background_strategy (dict): Strategy settings as stored by `set_background_strategy`.
+
+        Returns:
+            Tuple:
+                - DataFrame: The background rows.
+                - DenseData: The weighted k-means summary, or None if all rows weigh the same.
+        """
+        import shap
+
+        if background_strategy is None or background_strategy["strategy"] == "full":
+            return data, None
+
+        strategy = background_strategy["strategy"]
+        size = background_strategy["size"]
+        if isinstance(size, float):
+            size = max(1, int(round(size * len(data))))
+        size = min(size, len(data))
+        rng = np.random.default_rng(background_strategy["seed"])
+
+        if strategy == "sample":
+            positions = np.sort(rng.choice(len(data), size, replace=False))
+            return data.iloc[positions], None
+
+        if strategy == "stratified":
+            labels = background_strategy["labels"]
+            if labels is None:
+                if self.model is None:
+                    raise ValueError("Stratified background needs labels or a loaded model.")
+                labels = np.argmax(self._create_prediction_function()(data.values), axis=1)
+            labels = np.asarray(labels)
+            if len(labels) != len(data):
+                raise ValueError("The number of labels does not match the number of data rows.")
+            _, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+            allocation = self._allocate_stratified(counts, size)
+            positions = np.concatenate([
+                rng.choice(np.flatnonzero(inverse == label), count, replace=False)
+                for label, count in enumerate(allocation)
+            ])
+            return data.iloc[np.sort(positions)], None
+
+        # k-means centroids, weighted by the share of rows in each cluster
+        from sklearn.cluster import KMeans
+        from sklearn.impute import SimpleImputer
+
+        values = SimpleImputer(strategy="mean").fit_transform(data.to_numpy(dtype=float))
+        kmeans = KMeans(n_clusters=size, random_state=background_strategy["seed"], n_init=10).fit(values)
+        # Like shap.kmeans, every centroid coordinate is moved to the nearest value of its feature,
+        # so discrete features keep valid values
+        centers = kmeans.cluster_centers_.copy()
+        for feature in range(values.shape[1]):
+            column = np.unique(values[:, feature])
+            if len(column) == 1:
+                centers[:, feature] = column[0]
+                continue
+            position = np.clip(np.searchsorted(column, centers[:, feature]), 1, len(column) - 1)
+            lower, upper = column[position - 1], column[position]
+            centers[:, feature] = np.where(centers[:, feature] - lower <= upper - centers[:, feature], lower, upper)
+        weights = np.bincount(kmeans.labels_, minlength=size).astype(float)
+        summary = shap.utils._legacy.DenseData(centers, list(data.columns), None, weights)
+        return pd.DataFrame(centers, columns=data.columns), summary
+
+    @staticmethod
+    def _allocate_stratified(counts, size):
+        """
+        Splits a sample size over classes in proportion to their sizes (largest remainder method),
+        so the allocations add up to exactly `size`. If there are at least as many rows as classes,
+        every class keeps at least one row.
+
+        Args:
+            counts (ndarray): Number of rows of each class.
+            size (int): Number of rows to sample, at most the sum of `counts`.
+
+        Returns:
+            ndarray: Number of rows to sample from each class.
+        """
+        quotas = counts * size / counts.sum()
+        allocation = np.floor(quotas).astype(int)
+        shortfall = size - allocation.sum()
+        allocation[np.argsort(allocation - quotas, kind="stable")[:shortfall]] += 1
+        while size >= len(counts) and (allocation == 0).any():
+            allocation[np.argmax(allocation)] -= 1
+            allocation[np.argmin(allocation)] += 1
+        return allocation
+
+    def evaluate_background_accuracy(self, instances, reference_size=None):
+        """
+        Compares SHAP values computed with the prepared background to values computed with
+        a full-background reference, to help choose the smallest background that is accurate enough.
+        Both sides use the same explainer engine, so only the background differs. The result cache
+        is neither read nor written.
+
+        Args:
+            instances (DataFrame): Instances to explain for the comparison.
+            reference_size (int, optional): Caps the reference background to a random sample of this many rows.
+                                            By default every row of `data` is used.
+
+        Returns:
+            dict: Background and reference row counts, mean and max absolute difference of the attributions,
+                  relative error (sum of absolute differences divided by the sum of absolute reference values)
+                  and the share of instances whose most important feature is the same.
+        """
+        import shap
+
+        explainer = self.get_explainer()
+        engine, output = self.explainer_engine, self.explainer_output
+        shap_values = self._select_target_class(explainer(instances), output)
+
+        reference_strategy = None
+        if reference_size is not None:
+            reference_strategy = {"strategy": "sample", "size": reference_size, "seed": 0, "labels": None}
+        reference, _ = self._prepare_background(self.data, reference_strategy)
+        if engine == "kernel":
+            # Weighted centroids are explained by the kernel explainer, so the reference uses it on every row
+            pred_func = self._create_prediction_function()
+            reference_explainer = shap.KernelExplainer(lambda x: pred_func(x), reference)
+        else:
+            reference_explainer, _, output = self._build_explainer(reference)
+        reference_values = self._select_target_class(reference_explainer(instances), output).values
+
+        difference = np.abs(shap_values.values - reference_values)
+        same_top_feature = np.argmax(np.abs(shap_values.values), axis=1) == np.argmax(np.abs(reference_values), axis=1)
+        return {
+            "background_rows": len(self.background),
+            "reference_rows": len(reference),
+            "mean_abs_error": float(difference.mean()),
+            "max_abs_error": float(difference.max()),
+            "relative_error": float(difference.sum() / max(np.abs(reference_values).sum(), 1e-12)),
+            "top_feature_agreement": float(same_top_feature.mean()),
+        }
+
+    def set_result_cache(self, result_cache):
+        """
+        Sets a persistent cache of SHAP results. Explanations of instances that were explained before
+        with the same model file, background, explainer settings and target class are read from the cache.
+        Results of the "approximate" explainer type are random estimates with standard errors, so they are
+        neither read from nor written to the cache.
+
+        Args:
+            result_cache (ShapResultCache): The cache, or None to disable caching.
+        """
+        self.result_cache = result_cache
+
+    def set_prediction_memoization(self, max_entries=MemoizedPredictor.DEFAULT_MAX_ENTRIES):
+        """
+        Wraps the prediction function of model-agnostic explainers in a `MemoizedPredictor`, so masked rows
+        that repeat within a batch or across explained instances are evaluated only once. This helps with
+        expensive models. The SHAP values are the same as without memoization. Tree and linear explainers
+        do not call the prediction function and are not affected.
+
+        After an explanation, `memoized_predictor.get_stats()` reports the dedup ratio.
+
+        Args:
+            max_entries (int, optional): Model outputs kept across calls. None disables the memoization.
+        """
+        self.prediction_memo_size = max_entries
+
+    def _get_active_result_cache(self):
+        """
+        Returns:
+            ShapResultCache: The result cache used for the current explainer type, or None.
+        """
+        if self.explainer_type == "approximate":
+            return None
+        return self.result_cache
+
+    def get_model_fingerprint(self):
+        """
+        Returns a hash of the loaded model file. It is computed once per loaded model.
+
+        Returns:
+            str: A SHA-256 hex digest of the model file.
+
+        Raises:
+            ValueError: If the model is not loaded.
+        """
+        if self.model is None:
+            raise ValueError("Model is not loaded")
+        if self._model_fingerprint is None:
+            digest = hashlib.sha256()
+            with open(self.model_path, "rb") as file:
+                for block in iter(lambda: file.read(1024 * 1024), b""):
+                    digest.update(block)
+            self._model_fingerprint = digest.hexdigest()
+        return self._model_fingerprint
+
+    def _get_result_cache_keys(self, instances, target_class=None):
+        """
+        Creates result cache keys for instances.
+
+        Args:
+            instances (DataFrame): Instances to explain.
+            target_class (int, optional): Class of the cached SHAP values. Defaults to `target_class`.
+
+        Returns:
+            list: One cache key per instance.
+        """
+        target_class = self.target_class if target_class is None else target_class
+        settings = repr((
+            list(self.data.columns),
+            self.explainer_type,
+            sorted((name, repr(value)) for name, value in self.explainer_options.items()),
+        ))
+        try:
+            rows = [row.tobytes() for row in np.ascontiguousarray(instances.to_numpy(dtype=np.float64))]
+        except (TypeError, ValueError):
+            rows = [repr(tuple(row)).encode("utf-8") for row in instances.itertuples(index=False)]
+
+        model_fingerprint = self.get_model_fingerprint()
+        background_fingerprint = self.get_background_fingerprint()
+        return [
+            self.result_cache.make_key(model_fingerprint, background_fingerprint, settings, target_class, row)
+            for row in rows
+        ]
+
+    def set_explainer_options(self, **options):
+        """
+        Sets extra keyword arguments that are passed to `shap.Explainer`, or to `ApproximateExplainer`
+        for the "approximate" explainer type.
+
+        Args:
+            **options: Explainer settings (e.g. algorithm="permutation", seed=0, or max_evals=2000,
+                       deadline=0.05, tol=0.005 for the "approximate" explainer type).
+        """
+        self.explainer_options = dict(options)
+
+    def set_explainer_type(self, explainer_type):
+        """
+        Selects which SHAP explainer is used.
+
+        Available explainers:
+            - "auto": Inspects the model and uses `TreeExplainer` for tree ensembles (XGBoost, LightGBM,
+                      scikit-learn forests, ...), falling back to the model-agnostic explainer for everything
+                      else. Only pickled models are inspected. The attributions are always probabilities.
+            - "tree": Always uses `TreeExplainer` (probability output, interventional).
+            - "linear": Always uses `LinearExplainer`. Its attributions are in log-odds space, which
+                        `shap_results.attrs["output"]` reports and the GPT prompt mentions.
+            - "model_agnostic": Always uses the model-agnostic sampling explainer on `predict_proba`.
+            - "approximate": Uses `ApproximateExplainer`, antithetic permutation sampling on `predict_proba`
+                             with a budget per instance. Set the budget with `set_explainer_options`
+                             (max_evals, deadline, tol, seed). Its results include standard errors.
+
+        The selected engine is reported in `explainer_engine` after the explainer is built.
+
+        Args:
+            explainer_type (str): One of the explainers above.
+
+        Raises:
+            ValueError: If the explainer type is unknown.
+        """
+        if explainer_type not in self.EXPLAINER_TYPES:
+            raise ValueError(f"Unknown explainer type: {explainer_type}. Available types: {', '.join(self.EXPLAINER_TYPES)}")
+        self.explainer_type = explainer_type
+
+    def invalidate_explainer_cache(self):
+        """
+        Removes all cached explainers. Called automatically when the model or the background data changes.
+        """
+        self._explainer_cache.clear()
+
+    def get_explainer_cache_stats(self):
+        """
+        Returns statistics about explainer reuse.
+
+        Returns:
+            dict: Number of cache hits, misses and currently cached explainers.
+        """
+        return {
+            "hits": self.explainer_cache_hits,
+            "misses": self.explainer_cache_misses,
+            "size": len(self._explainer_cache),
+        }
+
+    def get_background_fingerprint(self):
+        """
+        Returns a fingerprint of the background data. It is computed once per background.
+
+        Returns:
+            str: A SHA-1 hex digest of the background data, its weights and its column names.
+        """
+        if self._background_fingerprint is None:
+            background = self.background
+            digest = hashlib.sha1()
+            digest.update(repr(list(background.columns)).encode("utf-8"))
+            digest.update(pd.util.hash_pandas_object(background, index=False).values.tobytes())
+            if self.background_weights is not None:
+                digest.update(np.asarray(self.background_weights, dtype=np.float64).tobytes())
+            self._background_fingerprint = digest.hexdigest()
+        return self._background_fingerprint
+
+    def _create_prediction_function(self):
+        """
+        Creates the prediction function that the explainer evaluates.
+
+        Returns:
+            callable: A function returning class probabilities for a batch of rows.
+
+        Raises:
+            ValueError: If the model type is not supported or the model cannot return probabilities.
+        """
+        if self.model_type == "onnx":
+            predict = self.model.predict_proba
+        elif self.model_type == "pickle":
+            if not hasattr(self.model, "predict_proba"):
+                raise ValueError("Pickle model does not support 'predict_proba'.")
+            predict = self.model.predict_proba
+        else:
+            raise ValueError(f"Unsupported model type: {self.model_type}")
+
+        instrumentation = self.instrumentation
+        if not instrumentation.enabled:
+            return predict
+
+        def instrumented_predict(x):
+            instrumentation.increment("model_evaluations")
+            instrumentation.increment("model_evaluated_rows", len(x))
+            instrumentation.observe("masker_batch_size", len(x))
+            return predict(x)
+
+        return instrumented_predict
+
+    def get_explainer(self):
+        """
+        Returns a SHAP explainer for the loaded model and data. Explainers are cached by model identity,
+        background fingerprint and explainer settings, so repeated explanations reuse the same setup.
+        Also sets `explainer_engine` and `explainer_output` for the returned explainer.
+
+        Returns:
+            shap.Explainer: The explainer for the current model and background data.
+
+        Raises:
+            ValueError: If the model or the data is not loaded or the model type is not supported.
+        """
+        if self.model is None:
+            raise ValueError("Model is not loaded")
+        if self.data is None:
+            raise ValueError("Data is not loaded.")
+
+        key = (
+            id(self.model),
+            self.get_background_fingerprint(),
+            self.explainer_type,
+            tuple(sorted((name, repr(value)) for name, value in self.explainer_options.items())),
+            self.prediction_memo_size,
+        )
+        cached = self._explainer_cache.get(key)
+        if cached is not None:
+            self.explainer_cache_hits += 1
+            self.instrumentation.increment("explainer_cache_hits")
+            self._explainer_cache.move_to_end(key)
+        else:
+            self.explainer_cache_misses += 1
+            self.instrumentation.increment("explainer_cache_misses")
+            predict = self._create_prediction_function()
+            memoized_predictor = None
+            if self.prediction_memo_size is not None:
+                predict = memoized_predictor = MemoizedPredictor(predict, self.prediction_memo_size)
+            with self.instrumentation.span("explainer_construction"):
+                cached = self._build_explainer(
+                    self.background, self._background_summary, subsample=self.background_strategy is None, predict=predict
+                ) + (memoized_predictor,)
+            self._explainer_cache[key] = cached
+            if len(self._explainer_cache) > self.MAX_CACHED_EXPLAINERS:
+                self._explainer_cache.popitem(last=False)
+
+        explainer, self.explainer_engine, self.explainer_output, self.memoized_predictor = cached
+        return explainer
+
+    def _build_explainer(self, background, background_summary=None, subsample=False, predict=None):
+        """
+        Builds an explainer for the loaded model, selecting the engine according to `explainer_type`.
+
+        Args:
+            background (DataFrame): Background data.
+            background_summary (DenseData, optional): Weighted k-means summary of the background.
+            subsample (bool, optional): Whether the background may be subsampled the way shap does by default.
+                                        If False, every background row is used.
+            predict (callable, optional): Prediction function for model-agnostic explainers.
+                                          Defaults to `_create_prediction_function()`.
+
+        Returns:
+            Tuple: The explainer, the selected engine name and its output space.
+
+        Raises:
+            ValueError: If the requested explainer does not support the loaded model.
+        """
+        import shap
+
+        pred_func = predict if predict is not None else self._create_prediction_function()
+        explainer_type = self.explainer_type
+
+        if explainer_type in ("tree", "linear") and self.model_type != "pickle":
+            raise ValueError(f"The {explainer_type} explainer is only available for pickled models.")
+
+        if explainer_type == "approximate":
+            # Every coalition is evaluated on the whole background, so it is kept small unless a strategy is set
+            if subsample and len(background) > self.FAST_EXPLAINER_BACKGROUND_SIZE:
+                background = shap.utils.sample(background, self.FAST_EXPLAINER_BACKGROUND_SIZE)
+            weights = self.background_weights if background_summary is not None else None
+            return ApproximateExplainer(pred_func, background, weights, **self.explainer_options), "approximate", "probability"
+
+        # Weighted centroids are only honoured by the kernel explainer, so "auto" does not use fast engines for them
+        use_fast_engines = self.model_type == "pickle" and (
+            explainer_type in ("tree", "linear") or (explainer_type == "auto" and background_summary is None)
+        )
+        if use_fast_engines:
+            fast_background = background
+            if subsample and len(background) > self.FAST_EXPLAINER_BACKGROUND_SIZE:
+                fast_background = shap.utils.sample(background, self.FAST_EXPLAINER_BACKGROUND_SIZE)
+            masker = shap.maskers.Independent(fast_background, max_samples=len(fast_background))
+
+            if explainer_type in ("auto", "tree"):
+                try:
+                    explainer = shap.TreeExplainer(
+                        self.model, data=fast_background, model_output="probability", feature_perturbation="interventional"
+                    )
+                    return explainer, "tree", "probability"
+                except Exception as e:
+                    if explainer_type == "tree":
+                        raise ValueError(f"TreeExplainer does not support this model: {e}")
+
+            # "auto" does not switch to log-odds attributions, linear models use the model-agnostic explainer
+            if explainer_type == "linear":
+                try:
+                    return shap.LinearExplainer(self.model, masker), "linear", "log_odds"
+                except Exception as e:
+                    raise ValueError(f"LinearExplainer does not support this model: {e}")
+
+        if background_summary is not None:
+            # Weighted centroids are only supported by the kernel explainer. The model is wrapped,
+            # because the kernel explainer tries to reset `feature_names_in_` on bound methods.
+            return shap.KernelExplainer(lambda x: pred_func(x), background_summary), "kernel", "probability"
+        if subsample:
+            explainer = shap.Explainer(pred_func, background, **self.explainer_options)
+        else:
+            # Pass an explicit masker, otherwise shap subsamples the background to 100 rows
+            masker = shap.maskers.Independent(background, max_samples=len(background))
+            explainer = shap.Explainer(pred_func, masker, **self.explainer_options)
+        return explainer, "model_agnostic", "probability"
+
+    def _select_target_class(self, shap_values, explainer_output):
+        """
+        Selects the SHAP values of the target class from an explanation.
+
+        Args:
+            shap_values (shap.Explanation): Explanation with one output per class, or a single output
+                                            for the positive class (binary tree and linear explainers).
+            explainer_output (str): Output space of the explainer ("probability" or "log_odds").
+
+        Returns:
+            shap.Explanation: SHAP values for the target class.
+
+        Raises:
+            ValueError: If the target class does not exist, for a single-output explanation
+                        if it is not 0 or 1.
+        """
+        import shap
+
+        if shap_values.values.ndim == 3:
+            n_classes = shap_values.values.shape[2]
+            if not -n_classes <= self.target_class < n_classes:
+                raise ValueError(f"Target class {self.target_class} is not available, the model has {n_classes} classes.")
+            return shap_values[..., self.target_class]
+        if self.target_class == 1:
+            return shap_values
+        if self.target_class == 0:
+            # The negative class mirrors the positive one: p(0) = 1 - p(1), logit(0) = -logit(1)
+            base_values = np.asarray(shap_values.base_values)
+            return shap.Explanation(
+                values=-shap_values.values,
+                base_values=1 - base_values if explainer_output == "probability" else -base_values,
+                data=shap_values.data,
+                feature_names=shap_values.feature_names,
+            )
+        raise ValueError(f"Target class {self.target_class} is not available, the explainer only has a binary output.")
+
     def calculate_shap_values_for_instance(self, instance):
         """
         Calculates SHAP values for a single instance.
@@ -117,29 +900,487 @@ class ShapCalculator:
             raise ValueError("Data is not loaded.")
         if self.target_class is None:
             raise ValueError("Target class is not set.")
-        
-        if self.model_type == "onnx":
-            input_name = self.model.get_inputs()[0].name
-            pred_func = lambda x: self.model.run(None,{input_name: x.astype('float32')})[0]
-        elif self.model_type == "pickle":
-            if not hasattr(self.model, "predict_proba"):
-                raise ValueError("Pickle model does not support 'predict_proba'.")
-            pred_func = self.model.predict_proba
-        else:
-            raise ValueError("Unsupported model type: {self.model_type}")
 
-        explainer = shap.Explainer(pred_func, self.data)
-        shap_values = explainer(instance)
-        shap_values_for_class = shap_values[..., self.target_class]
+        result_cache = self._get_active_result_cache()
+        if result_cache is None:
+            explainer = self.get_explainer()
+            with self.instrumentation.span("shap_evaluation", rows=len(instance)):
+                shap_values = explainer(instance)
+            self.instrumentation.increment("explained_rows", len(instance))
+            shap_values_for_class = self._select_target_class(shap_values, self.explainer_output)
+            # All classes are kept, so `set_target_class` can switch without explaining again
+            self.multiclass_result = MultiClassShapResult.from_explanation(
+                shap_values[:1], self.explainer_output, instance.iloc[:1], self._get_class_names(),
+            )
+        else:
+            multiclass_result = self._explain_instance_with_cache(instance.iloc[:1], result_cache)
+            shap_values_for_class = multiclass_result.get_explanation(self.target_class)
+            self.multiclass_result = multiclass_result.astype(np.float32)
         
         self.shap_results = pd.DataFrame({
             "Feature": self.data.columns,
             "SHAP Value": shap_values_for_class.values[0],
             "Feature Value": instance.values[0]
         })
+        if shap_values_for_class.error_std is not None:
+            self.shap_results["SHAP Std Error"] = shap_values_for_class.error_std[0]
+        self.shap_results.attrs["output"] = self.explainer_output
 
         return self.shap_results, shap_values_for_class 
 
+    def _explain_instance_with_cache(self, instance, result_cache):
+        """
+        Explains one instance for all classes. Every class is cached under its own key, the same key
+        `calculate_shap_values_for_batch` uses for that target class, so the instance is only explained
+        if one of its classes is not cached.
+
+        Args:
+            instance (DataFrame): A single instance.
+            result_cache (ShapResultCache): The result cache.
+
+        Returns:
+            MultiClassShapResult: SHAP values of all classes of the instance, as float64 so cached
+                                  and returned values are not rounded.
+        """
+        class_names = self._get_class_names()
+        keys = [self._get_result_cache_keys(instance, class_index)[0] for class_index in range(self._get_class_count())]
+        cached = result_cache.get_many(keys)
+        if len(cached) == len(keys):
+            self.instrumentation.increment("result_cache_hits", 1)
+            return MultiClassShapResult(
+                np.stack([cached[key][0] for key in keys], axis=1)[np.newaxis],
+                [[cached[key][1] for key in keys]],
+                instance, list(self.data.columns), class_names, self.explainer_output, dtype=np.float64,
+            )
+        self.instrumentation.increment("result_cache_misses", 1)
+
+        explainer = self.get_explainer()
+        with self.instrumentation.span("shap_evaluation", rows=1):
+            shap_values = explainer(instance)
+        self.instrumentation.increment("explained_rows", 1)
+        multiclass_result = MultiClassShapResult.from_explanation(
+            shap_values, self.explainer_output, instance, class_names, dtype=np.float64,
+        )
+        if multiclass_result.n_classes == len(keys):
+            result_cache.put_many([
+                (key, multiclass_result.values[0, :, class_index], multiclass_result.base_values[0, class_index])
+                for class_index, key in enumerate(keys)
+            ])
+        return multiclass_result
+
+    def calculate_multiclass_shap_values(self, instances):
+        """
+        Calculates SHAP values of all classes in one pass.
+
+        Args:
+            instances (DataFrame): Instances (rows) to explain.
+
+        Returns:
+            MultiClassShapResult: SHAP values of every instance, feature and class, with per-class,
+                                  predicted-class and top-k-class views.
+
+        Raises:
+            ValueError: If the model or the data is not set or if `instances` is empty.
+        """
+        if self.model is None:
+            raise ValueError("Model is not loaded")
+        if self.data is None:
+            raise ValueError("Data is not loaded.")
+        if instances is None or len(instances) == 0:
+            raise ValueError("No instances were given.")
+
+        explainer = self.get_explainer()
+        with self.instrumentation.span("shap_evaluation", rows=len(instances)):
+            shap_values = explainer(instances)
+        self.instrumentation.increment("explained_rows", len(instances))
+        return MultiClassShapResult.from_explanation(shap_values, self.explainer_output, instances, self._get_class_names())
+
+    def _get_class_names(self):
+        """
+        Returns:
+            list: Class labels of the model (`classes_` of scikit-learn style models), or None if it has none.
+        """
+        classes = getattr(self.model, "classes_", None)
+        return None if classes is None else [str(label) for label in classes]
+
+    def _get_class_count(self):
+        """
+        Returns the number of classes the model scores. Models without `classes_` (e.g. ONNX models) are
+        asked for one prediction. It is computed once per loaded model.
+
+        Returns:
+            int: Number of classes.
+        """
+        if self._n_classes is None:
+            class_names = self._get_class_names()
+            if class_names is not None:
+                self._n_classes = len(class_names)
+            else:
+                self._n_classes = np.shape(self._create_prediction_function()(self.background.iloc[:1]))[-1]
+        return self._n_classes
+
+    def calculate_shap_values_for_batch(self, instances, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Calculates SHAP values for many instances, passing them through the explainer in chunks
+        instead of one row at a time.
+
+        Args:
+            instances (DataFrame): Instances (rows) to explain. The index is used as the instance id.
+            chunk_size (int, optional): Maximum number of rows explained in one explainer call.
+                                        Smaller chunks lower the peak memory usage.
+
+        Returns:
+            Tuple:
+                - DataFrame: A long-format DataFrame with columns "Instance", "Feature", "SHAP Value"
+                             and "Feature Value" (one row per instance and feature).
+                - shap.Explanation: SHAP values for the target class for all instances, in input order.
+
+        Raises:
+            ValueError: If the model, the data or the target class is not set, if `instances` is empty
+                        or if `chunk_size` is not a positive integer.
+        """
+        if self.model is None:
+            raise ValueError("Model is not loaded")
+        if self.data is None:
+            raise ValueError("Data is not loaded.")
+        if self.target_class is None:
+            raise ValueError("Target class is not set.")
+        if instances is None or len(instances) == 0:
+            raise ValueError("No instances were given.")
+        if not isinstance(chunk_size, numbers.Integral) or isinstance(chunk_size, bool) or chunk_size <= 0:
+            raise ValueError("chunk_size must be a positive integer.")
+
+        cache_keys = None
+        cached = {}
+        missing = instances
+        result_cache = self._get_active_result_cache()
+        if result_cache is not None:
+            cache_keys = self._get_result_cache_keys(instances)
+            cached = result_cache.get_many(cache_keys)
+            self.instrumentation.increment("result_cache_hits", len(cached))
+            self.instrumentation.increment("result_cache_misses", len(instances) - len(cached))
+            missing = instances.iloc[[position for position, key in enumerate(cache_keys) if key not in cached]]
+
+        chunks = []
+        if len(missing):
+            explainer = self.get_explainer()
+            for start in range(0, len(missing), chunk_size):
+                chunk = missing.iloc[start:start + chunk_size]
+                with self.instrumentation.span("shap_evaluation", rows=len(chunk)):
+                    shap_values = explainer(chunk)
+                self.instrumentation.increment("explained_rows", len(chunk))
+                chunks.append(self._select_target_class(shap_values, self.explainer_output))
+
+        if result_cache is None:
+            shap_values_for_class = self._concatenate_explanations(chunks)
+        else:
+            shap_values_for_class = self._merge_cached_results(instances, cache_keys, cached, chunks)
+
+        return self._create_batch_results(instances, shap_values_for_class), shap_values_for_class
+
+    def calculate_global_importance(self, instances, chunk_size=DEFAULT_CHUNK_SIZE, quantiles=None,
+                                    sketch_size=ShapAccumulator.DEFAULT_SKETCH_SIZE, seed=None):
+        """
+        Calculates global feature importance over many instances without keeping the per-row SHAP values.
+
+        The instances are explained chunk by chunk and every chunk is added to a `ShapAccumulator`, so memory
+        usage does not grow with the number of instances. Instance files are read in chunks as well.
+
+        Args:
+            instances (DataFrame | str | iterable): Instances to explain: a DataFrame, the path of a CSV,
+                                                    Parquet or Feather file, or an iterable of DataFrame chunks.
+            chunk_size (int, optional): Maximum number of rows read and explained together.
+            quantiles (list, optional): Quantiles of the SHAP values to estimate (e.g. (0.05, 0.5, 0.95)).
+            sketch_size (int, optional): Rows kept in the reservoir sample used for the quantiles.
+            seed (int, optional): Seed of the reservoir sampling.
+
+        Returns:
+            DataFrame: The global importance, see `ShapAccumulator.to_dataframe`. It can be passed to
+                       `ChatGptClient.create_summary_and_message` for a dataset-level explanation.
+
+        Raises:
+            ValueError: If the model, the data or the target class is not set, or if there are no instances.
+        """
+        if self.data is None:
+            raise ValueError("Data is not loaded.")
+
+        accumulator = None
+        for chunk in self._iter_instance_chunks(instances, chunk_size):
+            if accumulator is None:
+                accumulator = ShapAccumulator(self.data.columns, quantiles, sketch_size, seed)
+            _, shap_values_for_class = self.calculate_shap_values_for_batch(chunk, chunk_size=chunk_size)
+            accumulator.update(shap_values_for_class.values, chunk)
+
+        if accumulator is None:
+            raise ValueError("No instances were given.")
+        return accumulator.to_dataframe()
+
+    def save_shap_values(self, output_path, instances, chunk_size=DEFAULT_CHUNK_SIZE, include_feature_values=True):
+        """
+        Explains instances chunk by chunk and writes the SHAP values to a compact binary file.
+
+        The SHAP values are stored as float32 together with the base values, the instance ids and the
+        target class, model fingerprint and explainer as metadata. See `ShapResultWriter` for the formats
+        and `ShapResultReader` to read the file.
+
+        Args:
+            output_path (str): Path of the output file. Its extension selects the format (.arrow, .parquet or .npz).
+            instances (DataFrame | str | iterable): Instances to explain: a DataFrame, the path of a CSV,
+                                                    Parquet or Feather file, or an iterable of DataFrame chunks.
+            chunk_size (int, optional): Maximum number of rows read, explained and written together.
+            include_feature_values (bool, optional): Also store the feature values. Defaults to True.
+
+        Returns:
+            int: Number of rows written.
+
+        Raises:
+            ValueError: If the model, the data or the target class is not set, or if the format is not supported.
+        """
+        if self.data is None:
+            raise ValueError("Data is not loaded.")
+
+        writer = ShapResultWriter(output_path, self.data.columns, {
+            "target_class": self.target_class,
+            "model_fingerprint": self.get_model_fingerprint(),
+        })
+        with writer:
+            for chunk in self._iter_instance_chunks(instances, chunk_size):
+                _, shap_values_for_class = self.calculate_shap_values_for_batch(chunk, chunk_size=chunk_size)
+                # The metadata is written with the first chunk, after the explainer was chosen
+                writer.metadata["explainer_engine"] = self.explainer_engine
+                writer.metadata["explainer_output"] = self.explainer_output
+                writer.append(
+                    shap_values_for_class.values, shap_values_for_class.base_values, chunk.index,
+                    chunk if include_feature_values else None,
+                )
+        if writer.rows == 0:
+            raise ValueError("No instances were given.")
+        return writer.rows
+
+    def _iter_instance_chunks(self, instances, chunk_size):
+        """
+        Splits instances into chunks with the feature columns of the data.
+
+        Args:
+            instances (DataFrame | str | iterable): A DataFrame, the path of an instance file or an iterable of DataFrames.
+            chunk_size (int): Maximum rows per chunk. Only used for DataFrames and files.
+
+        Yields:
+            DataFrame: Non-empty chunks of instances.
+        """
+        if isinstance(instances, pd.DataFrame):
+            chunks = (instances.iloc[start:start + chunk_size] for start in range(0, len(instances), chunk_size))
+        elif isinstance(instances, (str, os.PathLike)):
+            from xai_gpt_shap.BatchPipeline import BatchPipeline
+            chunks = BatchPipeline(self, chunk_size=chunk_size).iter_chunks(os.fspath(instances))
+        else:
+            chunks = instances
+
+        feature_names = list(self.data.columns)
+        for chunk in chunks:
+            if len(chunk):
+                yield chunk[feature_names]
+
+    def _merge_cached_results(self, instances, cache_keys, cached, chunks):
+        """
+        Stores newly computed results in the result cache and merges them with the cached ones in input order.
+
+        Args:
+            instances (DataFrame): All explained instances.
+            cache_keys (list): Cache key of each instance.
+            cached (dict): Results found in the cache, keyed by cache key.
+            chunks (list): Explanations of the instances that were not cached, in input order.
+
+        Returns:
+            shap.Explanation: SHAP values for the target class for all instances.
+        """
+        import shap
+
+        values = np.empty((len(instances), len(self.data.columns)))
+        base_values = np.empty(len(instances))
+        computed = iter([])
+        if chunks:
+            computed_explanation = self._concatenate_explanations(chunks)
+            computed = zip(computed_explanation.values, np.ravel(computed_explanation.base_values))
+
+        new_entries = []
+        for position, key in enumerate(cache_keys):
+            if key in cached:
+                values[position], base_values[position] = cached[key]
+            else:
+                values[position], base_values[position] = next(computed)
+                new_entries.append((key, values[position], base_values[position]))
+        self.result_cache.put_many(new_entries)
+
+        return shap.Explanation(
+            values=values,
+            base_values=base_values,
+            data=instances.to_numpy(),
+            feature_names=list(self.data.columns),
+        )
+
+    def create_worker_pool(self, n_workers=None, start_method=None):
+        """
+        Starts a process pool for `calculate_shap_values_parallel`. Each worker loads the model from `model_path`
+        and receives the background once, when it starts, so a pool that is passed to many calls does not
+        load them again. The workers keep the settings the calculator had when the pool was created.
+
+        Args:
+            n_workers (int, optional): Number of worker processes. Defaults to the number of CPU cores.
+            start_method (str, optional): Multiprocessing start method ("fork", "spawn" or "forkserver").
+                                          Defaults to the platform default.
+
+        Returns:
+            ProcessPoolExecutor: The pool. Use it as a context manager or call `shutdown()` when it is not needed anymore.
+
+        Raises:
+            ValueError: If the model was not loaded from `model_path` or the data is not loaded.
+        """
+        if self.model is None or not self.model_path:
+            raise ValueError("Parallel workers need the model to be loaded from model_path.")
+        if self.data is None:
+            raise ValueError("Data is not loaded.")
+        return ProcessPoolExecutor(
+            max_workers=n_workers or os.cpu_count() or 1, mp_context=multiprocessing.get_context(start_method),
+            initializer=_init_parallel_worker, initargs=(self._get_worker_state(),),
+        )
+
+    def calculate_shap_values_parallel(self, instances, n_workers=None, shard_size=None, start_method=None, executor=None):
+        """
+        Calculates SHAP values for many instances on several CPU cores. The instances are split into shards
+        that are explained in a process pool. Each worker loads the model from `model_path` and receives
+        the background once, when it starts. Results are merged back in input order.
+
+        Args:
+            instances (DataFrame): Instances (rows) to explain. The index is used as the instance id.
+            n_workers (int, optional): Number of worker processes. Defaults to the number of CPU cores.
+                                       With 1 (or 0) the shards are explained serially in the calling process,
+                                       which is useful for debugging.
+            shard_size (int, optional): Number of rows per task. Defaults to about four shards per worker.
+            start_method (str, optional): Multiprocessing start method ("fork", "spawn" or "forkserver").
+                                          Defaults to the platform default.
+            executor (ProcessPoolExecutor, optional): A pool created by `create_worker_pool`. It is reused and
+                                                      not shut down, so repeated calls do not start new workers.
+                                                      `n_workers` is then only used to size the shards.
+
+        Returns:
+            Tuple:
+                - DataFrame: A long-format DataFrame, the same as returned by `calculate_shap_values_for_batch`.
+                - shap.Explanation: SHAP values for the target class for all instances, in input order.
+
+        Raises:
+            ValueError: If the model, the data or the target class is not set, if the model was not loaded
+                        from `model_path` or if `instances` is empty.
+        """
+        import shap
+
+        if self.model is None:
+            raise ValueError("Model is not loaded")
+        if not self.model_path:
+            raise ValueError("Parallel workers need the model to be loaded from model_path.")
+        if self.data is None:
+            raise ValueError("Data is not loaded.")
+        if self.target_class is None:
+            raise ValueError("Target class is not set.")
+        if instances is None or len(instances) == 0:
+            raise ValueError("No instances were given.")
+
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+        if shard_size is None:
+            shard_size = max(1, -(-len(instances) // (max(n_workers, 1) * 4)))
+        shards = [instances.iloc[start:start + shard_size] for start in range(0, len(instances), shard_size)]
+
+        if executor is None and n_workers <= 1:
+            # Serial fallback, runs the same shard path in the calling process
+            explanations = [self.calculate_shap_values_for_batch(shard, chunk_size=shard_size)[1] for shard in shards]
+        else:
+            pool = executor if executor is not None else self.create_worker_pool(n_workers, start_method)
+            try:
+                with self.instrumentation.span("shap_evaluation_parallel", rows=len(instances), workers=n_workers):
+                    explanations = [
+                        shap.Explanation(values=values, base_values=base_values, data=data,
+                                         feature_names=list(self.data.columns), error_std=error_std)
+                        for values, base_values, data, error_std in pool.map(_explain_parallel_shard, shards)
+                    ]
+            finally:
+                if executor is None:
+                    pool.shutdown()
+            self.instrumentation.increment("explained_rows", len(instances))
+
+        shap_values_for_class = self._concatenate_explanations(explanations)
+        return self._create_batch_results(instances, shap_values_for_class), shap_values_for_class
+
+    def _get_worker_state(self):
+        """
+        Collects everything a parallel worker needs to rebuild this calculator, except the model itself,
+        which the worker loads from `model_path`.
+
+        Returns:
+            dict: The worker configuration.
+        """
+        return {
+            "model_path": self.model_path,
+            "target_class": self.target_class,
+            "explainer_options": self.explainer_options,
+            "explainer_type": self.explainer_type,
+            "onnx_options": self.onnx_options,
+            "prediction_memo_size": self.prediction_memo_size,
+            # A memory-mapped dataset is reopened by the workers, so all processes share its pages
+            "data_cache_path": self._data_cache_path if self.background_strategy is None else None,
+            "data": None if self.background_strategy is None and self._data_cache_path else (
+                self.data if self.background_strategy is None else self.background
+            ),
+            "background_summary": self._background_summary,
+            "prepared": self.background_strategy is not None,
+        }
+
+    def _create_batch_results(self, instances, shap_values_for_class):
+        """
+        Creates the long-format result of a batch explanation.
+
+        Args:
+            instances (DataFrame): The explained instances.
+            shap_values_for_class (shap.Explanation): SHAP values for the target class, one row per instance.
+
+        Returns:
+            DataFrame: One row per instance and feature with columns "Instance", "Feature", "SHAP Value"
+                       and "Feature Value".
+        """
+        feature_names = list(self.data.columns)
+        results = pd.DataFrame({
+            "Instance": np.repeat(instances.index.values, len(feature_names)),
+            "Feature": np.tile(feature_names, len(instances)),
+            "SHAP Value": shap_values_for_class.values.ravel(),
+            "Feature Value": instances.to_numpy(dtype=object).ravel(),
+        })
+        if shap_values_for_class.error_std is not None:
+            results["SHAP Std Error"] = shap_values_for_class.error_std.ravel()
+        return results
+
+    def _concatenate_explanations(self, explanations):
+        """
+        Joins per-chunk explanations into a single explanation.
+
+        Args:
+            explanations (list): A list of `shap.Explanation` objects with the same features.
+
+        Returns:
+            shap.Explanation: The explanations stacked along the instance axis.
+        """
+        import shap
+
+        if len(explanations) == 1:
+            return explanations[0]
+        has_error_std = all(explanation.error_std is not None for explanation in explanations)
+        return shap.Explanation(
+            values=np.concatenate([explanation.values for explanation in explanations]),
+            base_values=np.concatenate([explanation.base_values for explanation in explanations]),
+            data=np.concatenate([explanation.data for explanation in explanations]),
+            feature_names=explanations[0].feature_names,
+            error_std=np.concatenate([explanation.error_std for explanation in explanations]) if has_error_std else None,
+        )
+
     def save_shap_values_to_csv(self, output_path):
         """
         Saves the SHAP results to a CSV file.
@@ -154,3 +1395,55 @@ class ShapCalculator:
             raise ValueError("SHAP are not available. Try running the SHAP analysis first")
         self.shap_results.to_csv(output_path, index=False)
         print(f"SHAP results were save to {output_path}")
+
+
+# Calculator of the current parallel worker process, set once by `_init_parallel_worker`
+_worker_calculator = None
+
+
+def _init_parallel_worker(state):
+    """
+    Initializes a parallel worker: loads the model from its path and installs the background.
+
+    Args:
+        state (dict): Worker configuration created by `ShapCalculator._get_worker_state`.
+    """
+    global _worker_calculator
+    calculator = ShapCalculator(
+        model_path=state["model_path"],
+        target_class=state["target_class"],
+        explainer_options=state["explainer_options"],
+        explainer_type=state["explainer_type"],
+        onnx_options=state["onnx_options"],
+        prediction_memo_size=state["prediction_memo_size"],
+        # Workers must not write to exporters inherited from the parent process
+        instrumentation=NullInstrumentation(),
+    )
+    calculator.load_model()
+    if state["data_cache_path"]:
+        calculator.data = calculator._read_data_cache(state["data_cache_path"])
+    else:
+        calculator.data = state["data"]
+    if state["prepared"]:
+        # The background was already summarized by the parent process, use it as it is
+        calculator.background_strategy = {"strategy": "full", "size": 1, "seed": None, "labels": None}
+        calculator._background = state["data"]
+        calculator._background_summary = state["background_summary"]
+        if state["background_summary"] is not None:
+            calculator.background_weights = state["background_summary"].weights
+    _worker_calculator = calculator
+
+
+def _explain_parallel_shard(shard):
+    """
+    Explains one shard of instances inside a parallel worker.
+
+    Args:
+        shard (DataFrame): Instances to explain.
+
+    Returns:
+        Tuple: SHAP values, base values, feature values and standard errors (None for exact explainers)
+               of the shard as numpy arrays.
+    """
+    _, shap_values = _worker_calculator.calculate_shap_values_for_batch(shard, chunk_size=len(shard))
+    return shap_values.values, shap_values.base_values, shap_values.data, shap_values.error_std
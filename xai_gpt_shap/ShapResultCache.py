@@ -0,0 +1,235 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+
+class ShapResultCache:
+    """
+    A persistent, content-addressed cache of SHAP results stored in a SQLite database.
+
+    Each entry holds the SHAP vector and base value of one explained instance. Entries are keyed by the
+    model file hash, the background fingerprint, the explainer settings, the target class and the instance
+    values, so a result is only reused when all of them are the same. The least recently used entries are
+    evicted when the cache grows over its size limits, and entries that were not used for `max_age_seconds`
+    expire. The database runs in WAL mode, so several processes can read and write it at the same time.
+
+    Attributes:
+        path (str): Path to the SQLite database.
+        max_entries (int): Maximum number of cached results.
+        max_bytes (int): Maximum total size of the cached SHAP vectors in bytes.
+        max_age_seconds (float): Entries not used for this long are removed. None keeps them forever.
+        hits (int): Number of lookups answered from the cache by this object.
+        misses (int): Number of lookups that were not in the cache.
+    """
+
+    DEFAULT_MAX_ENTRIES = 100_000 # Maximum number of cached results
+    DEFAULT_MAX_BYTES = 512 * 1024 * 1024 # Maximum size of the cached SHAP vectors
+    EVICTION_INTERVAL = 100 # Number of writes between eviction checks
+    BUSY_TIMEOUT = 30 # Seconds to wait for other processes holding a write lock
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, max_age_seconds=None):
+        """
+        Initializes the ShapResultCache class and creates the database if needed.
+
+        Args:
+            path (str): Path to the SQLite database file.
+            max_entries (int, optional): Maximum number of cached results.
+            max_bytes (int, optional): Maximum total size of the cached SHAP vectors in bytes.
+            max_age_seconds (float, optional): Entries not used for this long are removed. None keeps them forever.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        with connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS shap_results (
+                    key TEXT PRIMARY KEY,
+                    shap_values BLOB NOT NULL,
+                    base_value REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS shap_results_last_access ON shap_results (last_access)")
+
+    def _connect(self):
+        """
+        Returns the SQLite connection of the current thread and process.
+
+        Returns:
+            sqlite3.Connection: An open connection.
+        """
+        # Connections must not be shared between threads or inherited by forked processes
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.BUSY_TIMEOUT, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def make_key(model_fingerprint, background_fingerprint, explainer_settings, target_class, instance_values):
+        """
+        Creates a cache key.
+
+        Args:
+            model_fingerprint (str): Hash of the model file.
+            background_fingerprint (str): Fingerprint of the background data.
+            explainer_settings (str): Description of the explainer settings.
+            target_class (int): The explained class.
+            instance_values (bytes): The instance values.
+
+        Returns:
+            str: A SHA-256 hex digest.
+        """
+        digest = hashlib.sha256()
+        for part in (model_fingerprint, background_fingerprint, explainer_settings, str(target_class)):
+            digest.update(str(part).encode("utf-8"))
+            digest.update(b"\0")
+        digest.update(instance_values)
+        return digest.hexdigest()
+
+    def get_many(self, keys):
+        """
+        Looks up several results at once.
+
+        Args:
+            keys (list): Cache keys.
+
+        Returns:
+            dict: Maps each found key to a tuple of the SHAP vector (numpy.ndarray) and the base value.
+        """
+        if not keys:
+            return {}
+        connection = self._connect()
+        now = time.time()
+        found = {}
+        # Stay below SQLite's limit on the number of query parameters
+        for start in range(0, len(keys), 500):
+            chunk = list(keys[start:start + 500])
+            placeholders = ",".join("?" * len(chunk))
+            query = f"SELECT key, shap_values, base_value, last_access FROM shap_results WHERE key IN ({placeholders})"
+            for key, shap_values, base_value, last_access in connection.execute(query, chunk):
+                if self.max_age_seconds is not None and now - last_access > self.max_age_seconds:
+                    continue
+                found[key] = (np.frombuffer(shap_values, dtype=np.float64), base_value)
+        if found:
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                connection.executemany(
+                    "UPDATE shap_results SET last_access = ? WHERE key = ?", [(now, key) for key in found]
+                )
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key):
+        """
+        Looks up one result.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            Tuple: The SHAP vector (numpy.ndarray) and the base value, or None if the key is not cached.
+        """
+        return self.get_many([key]).get(key)
+
+    def put_many(self, entries):
+        """
+        Stores several results.
+
+        Args:
+            entries (list): Tuples of cache key, SHAP vector and base value.
+        """
+        if not entries:
+            return
+        now = time.time()
+        rows = []
+        for key, shap_values, base_value in entries:
+            blob = np.ascontiguousarray(shap_values, dtype=np.float64).tobytes()
+            rows.append((key, blob, float(base_value), len(blob), now, now))
+        connection = self._connect()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(
+                "INSERT OR REPLACE INTO shap_results (key, shap_values, base_value, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        self._writes += len(rows)
+        if self._writes >= self.EVICTION_INTERVAL:
+            self._writes = 0
+            self.evict()
+
+    def put(self, key, shap_values, base_value):
+        """
+        Stores one result.
+
+        Args:
+            key (str): Cache key.
+            shap_values (numpy.ndarray): SHAP vector of the instance.
+            base_value (float): Base value of the explanation.
+        """
+        self.put_many([(key, shap_values, base_value)])
+
+    def evict(self):
+        """
+        Removes expired entries and then the least recently used entries until the cache fits its limits.
+        """
+        connection = self._connect()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            if self.max_age_seconds is not None:
+                connection.execute("DELETE FROM shap_results WHERE last_access < ?", (time.time() - self.max_age_seconds,))
+            entries, total_bytes = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM shap_results").fetchone()
+            if self.max_entries is not None and entries > self.max_entries:
+                connection.execute(
+                    "DELETE FROM shap_results WHERE key IN (SELECT key FROM shap_results ORDER BY last_access LIMIT ?)",
+                    (entries - self.max_entries,),
+                )
+            if self.max_bytes is not None and total_bytes > self.max_bytes:
+                # Walk from the oldest entry until enough bytes are freed
+                excess = total_bytes - self.max_bytes
+                keys = []
+                for key, size in connection.execute("SELECT key, size FROM shap_results ORDER BY last_access"):
+                    keys.append((key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                connection.executemany("DELETE FROM shap_results WHERE key = ?", keys)
+
+    def clear(self):
+        """
+        Removes all cached results.
+        """
+        connection = self._connect()
+        with connection:
+            connection.execute("DELETE FROM shap_results")
+
+    def get_stats(self):
+        """
+        Returns cache statistics.
+
+        Returns:
+            dict: Hits and misses of this object, number of stored entries and their total size in bytes.
+        """
+        entries, total_bytes = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM shap_results"
+        ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": total_bytes}
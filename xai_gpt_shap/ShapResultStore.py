@@ -0,0 +1,406 @@
+import os
+import json
+import zipfile
+import numpy as np
+import pandas as pd
+
+
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+ARROW_EXTENSIONS = (".arrow", ".feather")
+NPZ_EXTENSIONS = (".npz",)
+METADATA_KEY = b"xai_gpt_shap" # Schema metadata key of the Arrow and Parquet files
+
+
+def _get_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in PARQUET_EXTENSIONS:
+        return "parquet"
+    if extension in ARROW_EXTENSIONS:
+        return "arrow"
+    if extension in NPZ_EXTENSIONS:
+        return "npz"
+    raise ValueError(
+        f"Unsupported SHAP result format: {extension}. "
+        f"Supported formats: {', '.join(PARQUET_EXTENSIONS + ARROW_EXTENSIONS + NPZ_EXTENSIONS)}"
+    )
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError("Parquet and Arrow files require the 'pyarrow' package. Install it or use the .npz format.")
+    return pyarrow
+
+
+class ShapResultWriter:
+    """
+    Writes SHAP values to a compact binary file, chunk by chunk.
+
+    SHAP values are stored as a float32 matrix (one row per instance, one column per feature) with one shared
+    list of feature names, next to the instance ids, the base values and, optionally, the feature values.
+    The target class, the model fingerprint and other metadata are stored with them.
+
+    The format is chosen by the file extension:
+        - .arrow/.feather: Arrow IPC file, one record batch per chunk. Read back memory-mapped without copies.
+        - .parquet/.pq: Parquet file, one row group per chunk. Smaller, but decoded when read.
+        - .npz: NumPy archive, stored uncompressed so the arrays can be memory-mapped. Chunks are spooled to
+                temporary files and packed on `close`. Feature values must be numeric.
+
+    Example:
+        with ShapResultWriter("results.arrow", feature_names, {"target_class": 1}) as writer:
+            for chunk, explanation in explained_chunks:
+                writer.append(explanation.values, explanation.base_values, chunk.index, chunk)
+    """
+
+    def __init__(self, path, feature_names, metadata=None):
+        """
+        Creates the file.
+
+        Args:
+            path (str): Path of the output file. Its extension selects the format.
+            feature_names (list): Names of the features, in the column order of the SHAP values.
+            metadata (dict, optional): JSON-serializable metadata, e.g. "target_class" and "model_fingerprint".
+
+        Raises:
+            ValueError: If the format is not supported or pyarrow is missing for Arrow and Parquet files.
+        """
+        self.path = path
+        self.format = _get_format(path)
+        self.feature_names = [str(name) for name in feature_names]
+        self.metadata = dict(metadata or {})
+        self.rows = 0
+        self._writer = None
+        self._value_columns = None
+        self._closed = False
+        if self.format != "npz":
+            self._pyarrow = _import_pyarrow()
+        else:
+            self._spool = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _get_metadata(self):
+        return {**self.metadata, "feature_names": self.feature_names}
+
+    def append(self, shap_values, base_values, index=None, feature_values=None):
+        """
+        Appends a chunk of explained instances.
+
+        Args:
+            shap_values (ndarray): SHAP values of shape (rows, features).
+            base_values (ndarray): Base value of every row, or one base value for all rows.
+            index (array-like, optional): Instance ids. Defaults to the running row number.
+            feature_values (DataFrame, optional): Feature values of the rows, with the feature names as columns.
+                                                  Every chunk must either have them or not.
+
+        Raises:
+            ValueError: If the shapes do not match the feature names, or feature values of an .npz file are not numeric.
+        """
+        shap_values = np.ascontiguousarray(shap_values, dtype=np.float32)
+        rows = len(shap_values)
+        if shap_values.ndim != 2 or shap_values.shape[1] != len(self.feature_names):
+            raise ValueError(f"Expected SHAP values of shape (rows, {len(self.feature_names)}), got {shap_values.shape}.")
+        base_values = np.broadcast_to(np.asarray(base_values, dtype=np.float64).reshape(-1), (rows,))
+        index = np.arange(self.rows, self.rows + rows) if index is None else np.asarray(index, dtype=np.int64)
+        if feature_values is not None:
+            feature_values = pd.DataFrame(feature_values)[self.feature_names]
+        if self._value_columns is None:
+            self._value_columns = feature_values is not None
+        elif self._value_columns != (feature_values is not None):
+            raise ValueError("Every chunk must either have feature values or not.")
+
+        if self.format == "npz":
+            self._append_npz(shap_values, base_values, index, feature_values)
+        else:
+            self._append_arrow(shap_values, base_values, index, feature_values)
+        self.rows += rows
+
+    def _append_arrow(self, shap_values, base_values, index, feature_values):
+        pa = self._pyarrow
+        columns = {
+            "index": pa.array(index, pa.int64()),
+            "base_value": pa.array(base_values, pa.float64()),
+            "shap_values": pa.FixedSizeListArray.from_arrays(pa.array(shap_values.reshape(-1)), len(self.feature_names)),
+        }
+        if feature_values is not None:
+            for name in self.feature_names:
+                columns[f"value:{name}"] = pa.Array.from_pandas(feature_values[name])
+        batch = pa.RecordBatch.from_pydict(columns)
+
+        if self._writer is None:
+            schema = batch.schema.with_metadata({METADATA_KEY: json.dumps(self._get_metadata())})
+            if self.format == "parquet":
+                self._writer = pa.parquet.ParquetWriter(self.path, schema)
+            else:
+                self._writer = pa.ipc.new_file(self.path, schema)
+            self._schema = schema
+        batch = batch.cast(self._schema) if batch.schema != self._schema else batch
+        if self.format == "parquet":
+            self._writer.write_batch(batch, row_group_size=max(batch.num_rows, 1))
+        else:
+            self._writer.write_batch(batch)
+
+    def _append_npz(self, shap_values, base_values, index, feature_values):
+        arrays = {"shap_values": shap_values, "base_values": base_values, "index": index}
+        if feature_values is not None:
+            try:
+                arrays["feature_values"] = feature_values.to_numpy(dtype=np.float64)
+            except (TypeError, ValueError):
+                raise ValueError("Feature values of an .npz file must be numeric, use the Arrow or Parquet format.")
+        for name, array in arrays.items():
+            spool = self._spool.get(name)
+            if spool is None:
+                spool = self._spool[name] = (open(f"{self.path}.{name}.tmp", "w+b"), array.dtype, array.shape[1:])
+            spool[0].write(np.ascontiguousarray(array).tobytes())
+
+    def close(self):
+        """
+        Finishes the file. Further calls do nothing.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self.format == "npz":
+            self._close_npz()
+            return
+        if self._writer is None:
+            # No chunk was appended, write an empty file with the schema
+            self.append(np.empty((0, len(self.feature_names)), dtype=np.float32), np.empty(0))
+        self._writer.close()
+        self._writer = None
+
+    def _close_npz(self):
+        if not self._spool:
+            self._spool = {
+                "shap_values": (None, np.dtype(np.float32), (len(self.feature_names),)),
+                "base_values": (None, np.dtype(np.float64), ()),
+                "index": (None, np.dtype(np.int64), ()),
+            }
+        temporary_path = self.path + ".tmp"
+        # Stored uncompressed, so `ShapResultReader` can memory-map the arrays inside the archive
+        with zipfile.ZipFile(temporary_path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+            metadata = np.array(json.dumps(self._get_metadata()))
+            with archive.open("metadata.npy", "w") as member:
+                np.lib.format.write_array(member, metadata)
+            for name, (spool, dtype, shape) in self._spool.items():
+                rows = 0
+                if spool is not None:
+                    spool.flush()
+                    rows = os.path.getsize(spool.name) // (dtype.itemsize * int(np.prod(shape)))
+                # The spooled chunks are copied through a memory map, so they are never all in memory
+                array = np.memmap(spool.name, dtype=dtype, mode="r", shape=(rows, *shape)) if rows \
+                    else np.empty((0, *shape), dtype=dtype)
+                with archive.open(f"{name}.npy", "w", force_zip64=True) as member:
+                    np.lib.format.write_array(member, array)
+                del array
+                if spool is not None:
+                    spool.close()
+                    os.remove(spool.name)
+        os.replace(temporary_path, self.path)
+        self._spool = {}
+
+
+class ShapResultReader:
+    """
+    Reads SHAP values written by `ShapResultWriter`.
+
+    Arrow and uncompressed .npz files are memory-mapped, so the SHAP matrix is only read from disk when
+    it is accessed. Parquet files are decoded when read.
+
+    Example:
+        reader = ShapResultReader("results.arrow")
+        values = reader.read_shap_values()  # float32 matrix of shape (rows, features)
+        importance = np.abs(values).mean(axis=0)
+    """
+
+    def __init__(self, path, memory_map=True):
+        """
+        Opens the file and reads its metadata.
+
+        Args:
+            path (str): Path of a file written by `ShapResultWriter`.
+            memory_map (bool, optional): Memory-map the file instead of reading it into memory. Defaults to True.
+
+        Raises:
+            ValueError: If the format is not supported or the file was not written by `ShapResultWriter`.
+        """
+        self.path = path
+        self.format = _get_format(path)
+        self.memory_map = memory_map
+        if self.format == "npz":
+            self._offsets = self._read_npz_offsets()
+            metadata = self._read_npz_array("metadata")
+            self.metadata = json.loads(str(metadata))
+        else:
+            pa = _import_pyarrow()
+            if self.format == "parquet":
+                schema = pa.parquet.read_schema(path, memory_map=memory_map)
+            else:
+                with self._open_arrow() as reader:
+                    schema = reader.schema
+            if not schema.metadata or METADATA_KEY not in schema.metadata:
+                raise ValueError(f"{path} was not written by ShapResultWriter.")
+            self.metadata = json.loads(schema.metadata[METADATA_KEY])
+            self._schema = schema
+        self.feature_names = self.metadata.pop("feature_names")
+
+    def __len__(self):
+        if self.format == "npz":
+            return self._offsets["index"][1][0]
+        if self.format == "parquet":
+            return _import_pyarrow().parquet.ParquetFile(self.path).metadata.num_rows
+        reader = self._open_arrow()
+        return sum(reader.get_batch(position).num_rows for position in range(reader.num_record_batches))
+
+    @property
+    def has_feature_values(self):
+        """
+        bool: Whether the file contains the feature values.
+        """
+        if self.format == "npz":
+            return "feature_values" in self._offsets
+        return f"value:{self.feature_names[0]}" in self._schema.names if self.feature_names else False
+
+    def _open_arrow(self):
+        pa = _import_pyarrow()
+        source = pa.memory_map(self.path) if self.memory_map else pa.OSFile(self.path)
+        return pa.ipc.open_file(source)
+
+    def _read_table(self, columns=None):
+        pa = _import_pyarrow()
+        if self.format == "parquet":
+            return pa.parquet.read_table(self.path, columns=columns, memory_map=self.memory_map)
+        table = self._open_arrow().read_all()
+        return table.select(columns) if columns else table
+
+    def _read_npz_offsets(self):
+        """
+        Finds the data offset, shape and dtype of every array stored in the archive.
+        """
+        offsets = {}
+        with zipfile.ZipFile(self.path) as archive, open(self.path, "rb") as file:
+            for info in archive.infolist():
+                if info.compress_type != zipfile.ZIP_STORED or not info.filename.endswith(".npy"):
+                    raise ValueError(f"{self.path} was not written by ShapResultWriter.")
+                # Local file header: 30 fixed bytes, then the file name and the extra field
+                file.seek(info.header_offset + 26)
+                name_length, extra_length = np.frombuffer(file.read(4), dtype="<u2")
+                file.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+                version = np.lib.format.read_magic(file)
+                if version == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+                offsets[info.filename[:-len(".npy")]] = (file.tell(), shape, dtype, fortran_order)
+        return offsets
+
+    def _read_npz_array(self, name):
+        offset, shape, dtype, fortran_order = self._offsets[name]
+        if dtype.hasobject:
+            raise ValueError(f"{self.path} was not written by ShapResultWriter.")
+        if self.memory_map and dtype.itemsize and int(np.prod(shape)):
+            return np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=shape,
+                             order="F" if fortran_order else "C")
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            array = np.fromfile(file, dtype=dtype, count=int(np.prod(shape)))
+        return array.reshape(shape, order="F" if fortran_order else "C")
+
+    def read_shap_values(self):
+        """
+        Returns:
+            ndarray: SHAP values as a float32 matrix of shape (rows, features). Memory-mapped for .npz files
+                     and Arrow files with one chunk. Arrow files with several chunks are concatenated in memory,
+                     use `iter_chunks` to avoid that.
+        """
+        if self.format == "npz":
+            return self._read_npz_array("shap_values")
+        column = self._read_table(["shap_values"]).column("shap_values")
+        if column.num_chunks == 1:
+            values = column.chunk(0).flatten()
+            return values.to_numpy(zero_copy_only=False).reshape(-1, len(self.feature_names))
+        parts = [chunk.flatten().to_numpy(zero_copy_only=False) for chunk in column.chunks]
+        return np.concatenate(parts).reshape(-1, len(self.feature_names)) if parts \
+            else np.empty((0, len(self.feature_names)), dtype=np.float32)
+
+    def read_base_values(self):
+        """
+        Returns:
+            ndarray: The base value of every row.
+        """
+        if self.format == "npz":
+            return self._read_npz_array("base_values")
+        return self._read_table(["base_value"]).column("base_value").to_numpy()
+
+    def read_index(self):
+        """
+        Returns:
+            ndarray: The instance id of every row.
+        """
+        if self.format == "npz":
+            return self._read_npz_array("index")
+        return self._read_table(["index"]).column("index").to_numpy()
+
+    def read_feature_values(self):
+        """
+        Returns:
+            DataFrame: The feature values, indexed by instance id, or None if they were not stored.
+        """
+        if not self.has_feature_values:
+            return None
+        if self.format == "npz":
+            values = pd.DataFrame(np.asarray(self._read_npz_array("feature_values")), columns=self.feature_names)
+        else:
+            table = self._read_table([f"value:{name}" for name in self.feature_names])
+            values = table.to_pandas()
+            values.columns = self.feature_names
+        values.index = self.read_index()
+        return values
+
+    def iter_chunks(self):
+        """
+        Reads the file chunk by chunk, as it was written (Arrow and Parquet) or in one piece (.npz).
+
+        Yields:
+            Tuple: Instance ids, SHAP values (float32 matrix) and base values of a chunk.
+        """
+        if self.format == "npz":
+            yield self.read_index(), self.read_shap_values(), self.read_base_values()
+            return
+        if self.format == "parquet":
+            batches = _import_pyarrow().parquet.ParquetFile(self.path, memory_map=self.memory_map).iter_batches(
+                columns=["index", "base_value", "shap_values"])
+        else:
+            reader = self._open_arrow()
+            batches = (reader.get_batch(position) for position in range(reader.num_record_batches))
+        for batch in batches:
+            shap_values = batch.column("shap_values").flatten().to_numpy(zero_copy_only=False)
+            yield (
+                batch.column("index").to_numpy(),
+                shap_values.reshape(-1, len(self.feature_names)),
+                batch.column("base_value").to_numpy(),
+            )
+
+    def to_dataframe(self):
+        """
+        Converts the file to the long format of `ShapCalculator.calculate_shap_values_for_batch`.
+
+        Returns:
+            DataFrame: One row per instance and feature with columns "Instance", "Feature", "SHAP Value"
+                       and "Feature Value" (None if the feature values were not stored).
+        """
+        index = self.read_index()
+        feature_values = self.read_feature_values()
+        return pd.DataFrame({
+            "Instance": np.repeat(index, len(self.feature_names)),
+            "Feature": np.tile(self.feature_names, len(index)),
+            "SHAP Value": np.asarray(self.read_shap_values()).ravel(),
+            "Feature Value": feature_values.to_numpy(dtype=object).ravel() if feature_values is not None else None,
+        })
@@ -0,0 +1,157 @@
+import re
+import time
+from rich.console import Group
+from rich.live import Live
+from rich.markdown import Markdown
+from rich.panel import Panel
+
+
+class StreamRenderer:
+    """
+    Renders a streamed GPT response in the console.
+
+    Chunks are collected in a list and the live view is only re-rendered every `refresh_interval` seconds or
+    after `render_chars` new characters. Finished Markdown blocks are parsed once and kept, only the trailing
+    unfinished block is parsed again on every render. The finished answer is shown in a panel, parsed as a whole.
+
+    If the console is not a terminal (e.g. the output is piped to a file), the chunks are written as plain text.
+
+    Example:
+        text = StreamRenderer(console).render(chunks)
+    """
+
+    REFRESH_INTERVAL = 0.25 # Minimum seconds between two renders
+    RENDER_CHARS = 400 # Characters after which the view is rendered even if the interval has not passed
+    CURSOR = "█ "
+    _FENCE = re.compile(r" {0,3}(```|~~~)")
+
+    def __init__(self, console, refresh_interval=REFRESH_INTERVAL, render_chars=RENDER_CHARS, plain=None,
+                 title="Assistant Response", border_style="blue"):
+        """
+        Initializes the renderer.
+
+        Args:
+            console (Console): Rich console to render to.
+            refresh_interval (float, optional): Minimum seconds between two renders.
+            render_chars (int, optional): Characters after which the view is rendered even if the interval has not passed.
+            plain (bool, optional): Write plain text instead of rendering Markdown. Defaults to True if the console
+                                    is not a terminal.
+            title (str, optional): Title of the panel with the finished answer.
+            border_style (str, optional): Border style of the panel.
+        """
+        self.console = console
+        self.refresh_interval = refresh_interval
+        self.render_chars = render_chars
+        self.plain = not console.is_terminal if plain is None else plain
+        self.title = title
+        self.border_style = border_style
+        self.renders = 0 # Number of live renders of the last response
+
+    def render(self, chunks):
+        """
+        Renders the chunks of a response as they arrive.
+
+        Args:
+            chunks (iterable): Text chunks of the response.
+
+        Returns:
+            str: The full response text.
+        """
+        self.renders = 0
+        if self.plain:
+            return self._render_plain(chunks)
+        return self._render_live(chunks)
+
+    def _render_plain(self, chunks):
+        parts = []
+        output = self.console.file
+        for content in chunks:
+            parts.append(content)
+            output.write(content)
+            output.flush()
+        output.write("\n")
+        output.flush()
+        return "".join(parts)
+
+    def _render_live(self, chunks):
+        parts = []
+        self._blocks = []
+        self._block_lines = []
+        self._line_parts = []
+        self._in_fence = False
+        self._blank_line = False
+
+        with Live(console=self.console, auto_refresh=False) as live:
+            last_render = time.monotonic()
+            pending_chars = 0
+            for content in chunks:
+                parts.append(content)
+                self._feed(content)
+                pending_chars += len(content)
+
+                now = time.monotonic()
+                if pending_chars >= self.render_chars or now - last_render >= self.refresh_interval:
+                    live.update(self._get_preview(), refresh=True)
+                    self.renders += 1
+                    last_render = now
+                    pending_chars = 0
+
+            text = "".join(parts)
+            live.update(
+                Panel(
+                    Markdown(text),
+                    title=self.title,
+                    border_style=self.border_style,
+                ),
+                refresh=True,
+            )
+        return text
+
+    def _feed(self, content):
+        """
+        Splits new text into lines and freezes Markdown blocks as soon as they are finished.
+        """
+        lines = content.split("\n")
+        self._line_parts.append(lines[0])
+        for line in lines[1:]:
+            self._add_line("".join(self._line_parts))
+            self._line_parts = [line]
+
+        # An unindented line after a blank line finishes the block before the line is complete
+        if self._blank_line and self._block_lines:
+            line_start = next((part for part in self._line_parts if part), "")
+            if line_start and not line_start[0].isspace():
+                self._freeze_block()
+
+    def _add_line(self, line):
+        """
+        Adds a finished line to the current block.
+
+        A block is finished by a blank line outside of a code fence that is followed by an unindented line,
+        so list items with indented continuations stay in one block.
+        """
+        if line.strip() == "":
+            if not self._in_fence:
+                self._blank_line = True
+            self._block_lines.append(line)
+            return
+
+        if self._blank_line and not line[0].isspace() and self._block_lines:
+            self._freeze_block()
+        self._blank_line = False
+        if self._FENCE.match(line):
+            self._in_fence = not self._in_fence
+        self._block_lines.append(line)
+
+    def _freeze_block(self):
+        text = "\n".join(self._block_lines).strip("\n")
+        if text:
+            self._blocks.append(Markdown(text))
+        self._block_lines = []
+
+    def _get_preview(self):
+        """
+        Returns the live view: the parsed finished blocks and the trailing block with a cursor.
+        """
+        tail = "\n".join(self._block_lines + ["".join(self._line_parts)]).lstrip("\n")
+        return Group(*self._blocks, Markdown(tail + self.CURSOR))
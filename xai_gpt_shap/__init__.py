@@ -1,5 +1,40 @@
-from .ChatGptClient import ChatGptClient
-from .ShapCalculator import ShapCalculator
-from .roles import get_role_message
+import importlib
 
-__all__ = ["ChatGptClient", "ShapCalculator", "get_role_message"]
+# Public names and the modules that define them. The modules are imported on first access,
+# so importing the package does not load shap, onnxruntime, pandas or openai.
+_EXPORTS = {
+    "ChatGptClient": ".ChatGptClient",
+    "AsyncChatGptClient": ".AsyncChatGptClient",
+    "ShapCalculator": ".ShapCalculator",
+    "ShapResultCache": ".ShapResultCache",
+    "ShapAccumulator": ".ShapAccumulator",
+    "MultiClassShapResult": ".MultiClassShapResult",
+    "ApproximateExplainer": ".ApproximateExplainer",
+    "MemoizedPredictor": ".MemoizedPredictor",
+    "ShapResultWriter": ".ShapResultStore",
+    "ShapResultReader": ".ShapResultStore",
+    "InMemoryResponseCache": ".ResponseCache",
+    "SQLiteResponseCache": ".ResponseCache",
+    "ChatSessionStore": ".ChatSessionStore",
+    "BatchPipeline": ".BatchPipeline",
+    "ExplanationServer": ".ExplanationServer",
+    "get_role_message": ".roles",
+    "Instrumentation": ".instrumentation",
+    "set_instrumentation": ".instrumentation",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    # Cache the value, so later lookups do not go through __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,395 @@
+"""
+Tracing and metrics of the explain-and-chat pipeline.
+
+`ShapCalculator` and `ChatGptClient` report timed spans (e.g. "load_model", "shap_evaluation", "llm_stream"),
+counters (e.g. "model_evaluations", "completion_tokens") and observations (e.g. "masker_batch_size",
+"time_to_first_token") to an `Instrumentation`. By default they use `NullInstrumentation`, whose methods do nothing.
+
+Example:
+    instrumentation = Instrumentation(exporters=[JsonLinesExporter("trace.jsonl")])
+    set_instrumentation(instrumentation)
+    ...
+    print(instrumentation.format_report())
+    instrumentation.flush()
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+class _Statistics:
+    """
+    Count, sum, minimum and maximum of observed values.
+    """
+
+    __slots__ = ("count", "total", "minimum", "maximum")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float("inf")
+        self.maximum = float("-inf")
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "min": self.minimum if self.count else 0.0,
+            "max": self.maximum if self.count else 0.0,
+        }
+
+
+class Instrumentation:
+    """
+    Collects spans, counters and observations and passes them to exporters.
+
+    Attributes:
+        enabled (bool): Always True, components skip optional measurement work if it is False.
+        exporters (list): Exporters that receive every finished span and the metrics on `flush`.
+    """
+
+    enabled = True
+
+    def __init__(self, exporters=None):
+        """
+        Initializes the instrumentation.
+
+        Args:
+            exporters (list, optional): Exporters, e.g. `JsonLinesExporter`, `PrometheusExporter` or `OpenTelemetryExporter`.
+        """
+        self.exporters = list(exporters or [])
+        self._spans = {}
+        self._counters = {}
+        self._observations = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Times a block of code.
+
+        Args:
+            name (str): Name of the stage, e.g. "load_model".
+            **attributes: Extra attributes passed to the exporters.
+        """
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        start_time = time.time()
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            stack.pop()
+            with self._lock:
+                statistics = self._spans.get(name)
+                if statistics is None:
+                    statistics = self._spans[name] = _Statistics()
+                statistics.add(duration)
+            if self.exporters:
+                record = {
+                    "type": "span",
+                    "name": name,
+                    "parent": parent,
+                    "start_time": start_time,
+                    "duration": duration,
+                    "error": error,
+                    "attributes": attributes,
+                }
+                for exporter in self.exporters:
+                    exporter.export_span(record)
+
+    def increment(self, name, value=1):
+        """
+        Adds to a counter.
+
+        Args:
+            name (str): Counter name, e.g. "model_evaluations".
+            value (int, optional): Amount to add. Defaults to 1.
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        """
+        Records a value whose distribution is of interest, e.g. a batch size or a latency.
+
+        Args:
+            name (str): Observation name, e.g. "masker_batch_size".
+            value (float): The observed value.
+        """
+        with self._lock:
+            statistics = self._observations.get(name)
+            if statistics is None:
+                statistics = self._observations[name] = _Statistics()
+            statistics.add(value)
+
+    def get_metrics(self):
+        """
+        Returns a snapshot of all metrics.
+
+        Returns:
+            dict: Span duration statistics in seconds ("spans"), counters ("counters") and
+                  observation statistics ("observations").
+        """
+        with self._lock:
+            return {
+                "spans": {name: statistics.to_dict() for name, statistics in self._spans.items()},
+                "counters": dict(self._counters),
+                "observations": {name: statistics.to_dict() for name, statistics in self._observations.items()},
+            }
+
+    def format_report(self):
+        """
+        Formats a per-stage latency breakdown with the counters and observations.
+
+        Returns:
+            str: A plain-text table.
+        """
+        metrics = self.get_metrics()
+        lines = [f"{'Stage':<28}{'Calls':>8}{'Total (s)':>12}{'Mean (ms)':>12}{'Max (ms)':>12}"]
+        for name, stats in sorted(metrics["spans"].items(), key=lambda item: -item[1]["total"]):
+            lines.append(
+                f"{name:<28}{stats['count']:>8}{stats['total']:>12.3f}{stats['mean'] * 1000:>12.2f}{stats['max'] * 1000:>12.2f}"
+            )
+        if metrics["counters"]:
+            lines.append("")
+            lines.append(f"{'Counter':<28}{'Value':>8}")
+            for name, value in sorted(metrics["counters"].items()):
+                lines.append(f"{name:<28}{value:>8}")
+        if metrics["observations"]:
+            lines.append("")
+            lines.append(f"{'Observation':<28}{'Count':>8}{'Mean':>12}{'Min':>12}{'Max':>12}")
+            for name, stats in sorted(metrics["observations"].items()):
+                lines.append(f"{name:<28}{stats['count']:>8}{stats['mean']:>12.4g}{stats['min']:>12.4g}{stats['max']:>12.4g}")
+        return "\n".join(lines)
+
+    def flush(self):
+        """
+        Passes the current metrics to all exporters.
+        """
+        metrics = self.get_metrics()
+        for exporter in self.exporters:
+            exporter.export_metrics(metrics)
+
+    def reset(self):
+        """
+        Removes all collected metrics.
+        """
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            self._observations.clear()
+
+
+class NullInstrumentation:
+    """
+    Instrumentation that records nothing. Used when instrumentation is disabled, every call is a no-op.
+    """
+
+    enabled = False
+
+    class _NullSpan:
+        __slots__ = ()
+
+        def __enter__(self):
+            return None
+
+        def __exit__(self, *exc_info):
+            return False
+
+    _NULL_SPAN = _NullSpan()
+
+    def span(self, name, **attributes):
+        return self._NULL_SPAN
+
+    def increment(self, name, value=1):
+        pass
+
+    def observe(self, name, value):
+        pass
+
+    def get_metrics(self):
+        return {"spans": {}, "counters": {}, "observations": {}}
+
+    def format_report(self):
+        return "Instrumentation is disabled."
+
+    def flush(self):
+        pass
+
+    def reset(self):
+        pass
+
+
+class JsonLinesExporter:
+    """
+    Writes every finished span, and the metrics on `flush`, as one JSON object per line.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Path of the JSON-lines file. Records are appended.
+        """
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export_span(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def export_metrics(self, metrics):
+        line = json.dumps({"type": "metrics", "time": time.time(), **metrics}) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class PrometheusExporter:
+    """
+    Writes the metrics in the Prometheus text exposition format, e.g. for the node exporter's textfile collector.
+    """
+
+    PREFIX = "xai_gpt_shap"
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str, optional): File written on every `flush`. Without it, use `render` to get the text.
+        """
+        self.path = path
+
+    def export_span(self, record):
+        pass
+
+    def export_metrics(self, metrics):
+        if self.path is None:
+            return
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write(self.render(metrics))
+        # Replaced atomically, so a scraper never reads a half-written file
+        os.replace(temporary_path, self.path)
+
+    @classmethod
+    def render(cls, metrics):
+        """
+        Formats metrics in the Prometheus text format.
+
+        Args:
+            metrics (dict): Metrics from `Instrumentation.get_metrics`.
+
+        Returns:
+            str: The metrics text.
+        """
+        lines = []
+        if metrics["spans"]:
+            name = f"{cls.PREFIX}_span_duration_seconds"
+            lines.append(f"# HELP {name} Duration of the pipeline stages.")
+            lines.append(f"# TYPE {name} summary")
+            for span, stats in sorted(metrics["spans"].items()):
+                lines.append(f'{name}_count{{span="{span}"}} {stats["count"]}')
+                lines.append(f'{name}_sum{{span="{span}"}} {stats["total"]:.9g}')
+        for counter, value in sorted(metrics["counters"].items()):
+            name = f"{cls.PREFIX}_{counter}_total"
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+        for observation, stats in sorted(metrics["observations"].items()):
+            name = f"{cls.PREFIX}_{observation}"
+            lines.append(f"# TYPE {name} summary")
+            lines.append(f"{name}_count {stats['count']}")
+            lines.append(f"{name}_sum {stats['total']:.9g}")
+        return "\n".join(lines) + "\n"
+
+
+class OpenTelemetryExporter:
+    """
+    Forwards spans and counters to OpenTelemetry. Requires the `opentelemetry-api` package; the configured
+    OpenTelemetry SDK decides where the data is sent.
+    """
+
+    def __init__(self, tracer=None, meter=None):
+        """
+        Args:
+            tracer (Tracer, optional): OpenTelemetry tracer. Defaults to the global tracer of this package.
+            meter (Meter, optional): OpenTelemetry meter. Defaults to the global meter of this package.
+
+        Raises:
+            ValueError: If OpenTelemetry is not installed.
+        """
+        try:
+            from opentelemetry import trace, metrics
+        except ImportError:
+            raise ValueError("OpenTelemetry is not installed. Install the 'opentelemetry-api' package.")
+        self.tracer = tracer or trace.get_tracer("xai_gpt_shap")
+        self.meter = meter or metrics.get_meter("xai_gpt_shap")
+        self._counters = {}
+        self._exported_counts = {}
+
+    def export_span(self, record):
+        start = int(record["start_time"] * 1e9)
+        span = self.tracer.start_span(record["name"], start_time=start, attributes=record["attributes"] or None)
+        if record["error"] is not None:
+            span.set_attribute("error.type", record["error"])
+        span.end(end_time=start + int(record["duration"] * 1e9))
+
+    def export_metrics(self, metrics):
+        # OpenTelemetry counters take increments, so only the growth since the last flush is added
+        for name, value in metrics["counters"].items():
+            counter = self._counters.get(name)
+            if counter is None:
+                counter = self._counters[name] = self.meter.create_counter(f"xai_gpt_shap.{name}")
+            increment = value - self._exported_counts.get(name, 0)
+            if increment > 0:
+                counter.add(increment)
+            self._exported_counts[name] = value
+
+
+_instrumentation = NullInstrumentation()
+
+
+def get_instrumentation():
+    """
+    Returns the default instrumentation used by components that were not given one.
+
+    Returns:
+        Instrumentation: The default instrumentation, `NullInstrumentation` unless `set_instrumentation` was called.
+    """
+    return _instrumentation
+
+
+def set_instrumentation(instrumentation):
+    """
+    Sets the default instrumentation for components created afterwards.
+
+    Args:
+        instrumentation (Instrumentation): The instrumentation, or None to disable it.
+    """
+    global _instrumentation
+    _instrumentation = instrumentation if instrumentation is not None else NullInstrumentation()